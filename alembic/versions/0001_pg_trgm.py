@@ -0,0 +1,22 @@
+"""pg_trgm extension for indexed ILIKE search on tickets
+
+Tables and columns come in the following revisions (0002_initial_tables on).
+
+Revision ID: 0001_pg_trgm
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0001_pg_trgm"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+def downgrade() -> None:
+    op.execute("DROP EXTENSION IF EXISTS pg_trgm")
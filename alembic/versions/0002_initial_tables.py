@@ -0,0 +1,135 @@
+"""tables of the original schema: tickets, messages, attachments, ai_runs, kb_documents
+
+A database created before migrations were versioned already has them (Base.metadata.create_all
+with or without the kb_documents.search_tsv trigger): they are left as they are, only a
+search_tsv that is still TEXT (the old mapping of the model) is turned into the tsvector and
+the trigger that maintains it is put in place. On an empty database the tables are created
+as they were then; later revisions bring them up to the models.
+
+Revision ID: 0002_initial_tables
+Revises: 0001_pg_trgm
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from app.core.config import settings
+
+revision = "0002_initial_tables"
+down_revision = "0001_pg_trgm"
+branch_labels = None
+depends_on = None
+
+TABLES = ("tickets", "messages", "attachments", "ai_runs", "kb_documents")
+
+
+def _create_tables() -> None:
+    op.create_table(
+        "tickets",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("subject", sa.String(512), nullable=False),
+        sa.Column("customer_email", sa.String(320), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("new", "needs_info", "waiting_customer", "solved", "escalated", name="ticketstatus"),
+            nullable=False,
+        ),
+        sa.Column("category", sa.String(128), nullable=False),
+        sa.Column("product", sa.String(128), nullable=False),
+        sa.Column("priority", sa.String(32), nullable=False),
+        sa.Column("ai_confidence", sa.Integer, nullable=False),
+        sa.Column("ai_summary", sa.Text, nullable=False),
+        sa.Column("ai_suggested_actions", sa.JSON, nullable=False),
+        sa.Column("ai_draft_reply", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("ticket_id", sa.Integer, sa.ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("direction", sa.Enum("inbound", "outbound", name="messagedirection"), nullable=False),
+        sa.Column("from_email", sa.String(320), nullable=False),
+        sa.Column("to_email", sa.String(320), nullable=False),
+        sa.Column("subject", sa.String(512), nullable=False),
+        sa.Column("raw_headers", sa.JSON, nullable=False),
+        sa.Column("cleaned_text", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "attachments",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("message_id", sa.Integer, sa.ForeignKey("messages.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("filename", sa.String(512), nullable=False),
+        sa.Column("mime_type", sa.String(128), nullable=False),
+        sa.Column("size_bytes", sa.Integer, nullable=False),
+        sa.Column("storage_path", sa.String(1024), nullable=False),
+    )
+    op.create_table(
+        "ai_runs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("ticket_id", sa.Integer, sa.ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("model_versions", sa.JSON, nullable=False),
+        sa.Column("outputs", sa.JSON, nullable=False),
+        sa.Column("confidence", sa.Integer, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "kb_documents",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String(512), nullable=False),
+        sa.Column("body", sa.Text, nullable=False),
+        sa.Column("tags", sa.JSON, nullable=False),
+        sa.Column("language", sa.String(16), nullable=False),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("search_tsv", TSVECTOR, nullable=True),
+    )
+    op.create_index("ix_tickets_status", "tickets", ["status"])
+    op.create_index("ix_tickets_updated_at", "tickets", ["updated_at"])
+    op.create_index("ix_messages_ticket_id", "messages", ["ticket_id"])
+    op.create_index("ix_kb_documents_status", "kb_documents", ["status"])
+
+
+def _kb_search_tsv(convert: bool) -> None:
+    # maintained by the trigger only, the ORM never writes it (app.db.models.KbDocument)
+    if convert:
+        op.execute("ALTER TABLE kb_documents DROP COLUMN search_tsv")
+        op.execute("ALTER TABLE kb_documents ADD COLUMN search_tsv tsvector")
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION kb_documents_search_tsv() RETURNS trigger AS $$
+        BEGIN
+          NEW.search_tsv := setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(NEW.title, '')), 'A')
+                         || setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(NEW.body, '')), 'B');
+          RETURN NEW;
+        END $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute("DROP TRIGGER IF EXISTS kb_documents_search_tsv ON kb_documents")
+    op.execute(
+        "CREATE TRIGGER kb_documents_search_tsv BEFORE INSERT OR UPDATE ON kb_documents "
+        "FOR EACH ROW EXECUTE FUNCTION kb_documents_search_tsv()"
+    )
+    op.execute("UPDATE kb_documents SET search_tsv = NULL")  # fires the trigger for existing rows
+    op.execute("CREATE INDEX IF NOT EXISTS ix_kb_documents_search_tsv ON kb_documents USING gin (search_tsv)")
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    existing = [t for t in TABLES if inspector.has_table(t)]
+    if not existing:
+        _create_tables()
+    elif len(existing) != len(TABLES):
+        raise RuntimeError(f"Partial schema: only {', '.join(existing)} exist")
+    search_tsv = next(c for c in sa.inspect(op.get_bind()).get_columns("kb_documents") if c["name"] == "search_tsv")
+    _kb_search_tsv(convert=not isinstance(search_tsv["type"], TSVECTOR))
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS kb_documents_search_tsv ON kb_documents")
+    op.execute("DROP FUNCTION IF EXISTS kb_documents_search_tsv()")
+    for table in reversed(TABLES):
+        op.drop_table(table)
+    op.execute("DROP TYPE IF EXISTS messagedirection")
+    op.execute("DROP TYPE IF EXISTS ticketstatus")
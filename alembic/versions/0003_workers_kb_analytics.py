@@ -0,0 +1,289 @@
+"""queues, worker state, KB passages and analytics rollups; threading and search columns on messages
+
+New tables: outbox, enrichment_jobs, ai_rules, reprocess_runs, mailbox_checkpoints,
+similar_signatures / similar_buckets, kb_passages, kb_state, analytics_ticket_state /
+analytics_daily / analytics_daily_totals. New columns: tickets.enrichment_status and
+first_response_at, messages.message_id_header / ref_ids / raw_text / delivery_status /
+search_tsv, kb_documents.external_id. Existing rows are backfilled where the data is
+already there (threading ids from raw_headers, first reply time, delivery status of sent
+replies); the derived stores are rebuilt by their workers after the upgrade:
+app.workers.kb_passages, app.workers.similar_index, app.workers.analytics_backfill.
+
+Revision ID: 0003_workers_kb_analytics
+Revises: 0002_initial_tables
+Create Date: 2026-10-18
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from app.core.config import settings
+
+revision = "0003_workers_kb_analytics"
+down_revision = "0002_initial_tables"
+branch_labels = None
+depends_on = None
+
+BACKFILL_CHUNK = 5000
+
+# header parsing as app.services.tickets.thread_ids had it at this revision (the migration must not follow later changes)
+_MSGID_RE = re.compile(r"<[^<>\s]+>")
+_MAX_REFS = 50
+
+
+def _header(headers: dict, name: str) -> str:
+    name = name.lower()
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return str(v or "")
+    return ""
+
+
+def _thread_ids(raw_headers: dict) -> tuple[str | None, list[str]]:
+    """(Message-ID, parent candidates) as "<id>"; In-Reply-To first, then References newest first."""
+    raw_id = _header(raw_headers, "Message-ID").strip()
+    found = _MSGID_RE.findall(raw_id)
+    message_id = found[0] if found else (f"<{raw_id}>" if raw_id and " " not in raw_id else None)
+    refs = _MSGID_RE.findall(_header(raw_headers, "In-Reply-To")) + _MSGID_RE.findall(_header(raw_headers, "References"))[::-1]
+    refs = [r for r in dict.fromkeys(refs) if r != message_id][:_MAX_REFS]
+    return message_id, refs
+
+
+job_status = postgresql.ENUM("pending", "done", "failed", name="jobstatus", create_type=False)
+delivery_status = postgresql.ENUM("pending", "sent", "failed", name="deliverystatus", create_type=False)
+
+
+def _ts(*parts: tuple[str, str]) -> str:
+    return " || ".join(
+        f"setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce({column}, '')), '{weight}')"
+        for column, weight in parts
+    )
+
+
+def _create_tables() -> None:
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("message_id", sa.Integer, sa.ForeignKey("messages.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("message_id_header", sa.String(998), nullable=False),
+        sa.Column("to_email", sa.String(320), nullable=False),
+        sa.Column("subject", sa.String(512), nullable=False),
+        sa.Column("body_text", sa.Text, nullable=False),
+        sa.Column("in_reply_to", sa.String(998), nullable=False),
+        sa.Column("references", sa.Text, nullable=False),
+        sa.Column("status", delivery_status, nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("last_error", sa.Text, nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "enrichment_jobs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("ticket_id", sa.Integer, sa.ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("message_id", sa.Integer, sa.ForeignKey("messages.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("status", job_status, nullable=False),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("last_error", sa.Text, nullable=False),
+        sa.Column("run_after", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "ai_rules",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("kind", sa.String(32), nullable=False),
+        sa.Column("value", sa.String(128), nullable=False),
+        sa.Column("keyword", sa.String(256), nullable=False),
+        sa.Column("order", sa.Integer, nullable=False),
+        sa.Column("active", sa.Boolean, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "reprocess_runs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("model_version", sa.String(128), nullable=False),
+        sa.Column("status", sa.String(16), nullable=False),
+        sa.Column("update_tickets", sa.Boolean, nullable=False),
+        sa.Column("with_kb", sa.Boolean, nullable=False),
+        sa.Column("last_ticket_id", sa.Integer, nullable=False),
+        sa.Column("processed", sa.Integer, nullable=False),
+        sa.Column("updated_tickets", sa.Integer, nullable=False),
+        sa.Column("total", sa.Integer, nullable=False),
+        sa.Column("error", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "mailbox_checkpoints",
+        sa.Column("mailbox", sa.String(512), primary_key=True),
+        sa.Column("uidvalidity", sa.BigInteger, nullable=False),
+        sa.Column("last_uid", sa.BigInteger, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "similar_signatures",
+        sa.Column("ticket_id", sa.Integer, sa.ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("signature", sa.LargeBinary, nullable=False),
+        sa.Column("indexed_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_table(
+        "similar_buckets",
+        sa.Column("band", sa.SmallInteger, primary_key=True),
+        sa.Column("bucket", sa.BigInteger, primary_key=True),
+        sa.Column("ticket_id", sa.Integer, sa.ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True),
+    )
+    op.create_table(
+        "kb_passages",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("document_id", sa.Integer, sa.ForeignKey("kb_documents.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("position", sa.Integer, nullable=False),
+        sa.Column("heading", sa.String(512), nullable=False),
+        sa.Column("text", sa.Text, nullable=False),
+        sa.Column("content_hash", sa.String(40), nullable=False),
+        sa.Column("search_tsv", postgresql.TSVECTOR, sa.Computed(_ts(("heading", "A"), ("text", "B")), persisted=True)),
+    )
+    op.create_table(
+        "kb_state",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("version", sa.BigInteger, nullable=False),
+    )
+    op.create_table(
+        "analytics_ticket_state",
+        sa.Column("ticket_id", sa.Integer, primary_key=True),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("category", sa.String(128), nullable=False),
+        sa.Column("priority", sa.String(32), nullable=False),
+        sa.Column("confidence", sa.Integer, nullable=True),
+        sa.Column("response_seconds", sa.Float, nullable=True),
+    )
+    op.create_table(
+        "analytics_daily",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("dimension", sa.String(16), primary_key=True),
+        sa.Column("value", sa.String(128), primary_key=True),
+        sa.Column("tickets", sa.BigInteger, nullable=False),
+    )
+    op.create_table(
+        "analytics_daily_totals",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("tickets", sa.BigInteger, nullable=False),
+        sa.Column("confidence_sum", sa.BigInteger, nullable=False),
+        sa.Column("confidence_n", sa.BigInteger, nullable=False),
+        sa.Column("responded", sa.BigInteger, nullable=False),
+        sa.Column("response_seconds_sum", sa.Float, nullable=False),
+    )
+
+
+def _add_columns() -> None:
+    # tickets of the original schema were analysed inline, before the queue existed
+    op.add_column("tickets", sa.Column("enrichment_status", job_status, server_default="done", nullable=False))
+    op.alter_column("tickets", "enrichment_status", server_default=None)
+    op.add_column("tickets", sa.Column("first_response_at", sa.DateTime(timezone=True), nullable=True))
+
+    op.add_column("messages", sa.Column("message_id_header", sa.String(998), nullable=True))
+    op.add_column("messages", sa.Column("ref_ids", postgresql.ARRAY(sa.String(998)), server_default="{}", nullable=False))
+    op.alter_column("messages", "ref_ids", server_default=None)
+    op.add_column("messages", sa.Column("raw_text", sa.Text, nullable=True))
+    op.add_column("messages", sa.Column("delivery_status", delivery_status, nullable=True))
+    op.add_column("messages", sa.Column(
+        "search_tsv", postgresql.TSVECTOR,
+        sa.Computed(f"to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(cleaned_text, ''))", persisted=True),
+    ))
+
+    op.add_column("kb_documents", sa.Column("external_id", sa.String(256), nullable=True))
+
+
+def _backfill() -> None:
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text("SELECT id, raw_headers FROM messages WHERE id > :last_id ORDER BY id LIMIT :n"),
+            {"last_id": last_id, "n": BACKFILL_CHUNK},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        params = []
+        for row in rows:
+            message_id, refs = _thread_ids(row.raw_headers or {})
+            if message_id or refs:
+                params.append({"id": row.id, "message_id": message_id, "refs": refs})
+        if params:
+            bind.execute(
+                sa.text("UPDATE messages SET message_id_header = :message_id, ref_ids = :refs WHERE id = :id")
+                .bindparams(sa.bindparam("refs", type_=postgresql.ARRAY(sa.String(998)))),
+                params,
+            )
+    # the original schema stored re-deliveries too: the first copy keeps its Message-ID
+    op.execute(
+        "UPDATE messages SET message_id_header = NULL WHERE message_id_header IS NOT NULL AND id NOT IN "
+        "(SELECT min(id) FROM messages WHERE message_id_header IS NOT NULL GROUP BY message_id_header)"
+    )
+    op.execute("UPDATE messages SET delivery_status = 'sent' WHERE direction = 'outbound'")
+    op.execute(
+        "UPDATE tickets t SET first_response_at = m.first FROM "
+        "(SELECT ticket_id, min(created_at) AS first FROM messages WHERE direction = 'outbound' GROUP BY ticket_id) m "
+        "WHERE m.ticket_id = t.id"
+    )
+
+
+def _create_indexes() -> None:
+    op.drop_index("ix_tickets_status", table_name="tickets")
+    op.drop_index("ix_tickets_updated_at", table_name="tickets")
+    op.create_index("ix_tickets_updated_at_id", "tickets", ["updated_at", "id"])
+    op.create_index("ix_tickets_status_updated_at_id", "tickets", ["status", "updated_at", "id"])
+    op.create_index("ix_tickets_priority_updated_at_id", "tickets", ["priority", "updated_at", "id"])
+    op.create_index(
+        "ix_tickets_subject_trgm", "tickets", ["subject"],
+        postgresql_using="gin", postgresql_ops={"subject": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_tickets_customer_email_trgm", "tickets", ["customer_email"],
+        postgresql_using="gin", postgresql_ops={"customer_email": "gin_trgm_ops"},
+    )
+    op.create_index("ux_messages_message_id_header", "messages", ["message_id_header"], unique=True)
+    op.create_index("ix_messages_ref_ids", "messages", ["ref_ids"], postgresql_using="gin")
+    op.create_index("ix_messages_search_tsv", "messages", ["search_tsv"], postgresql_using="gin")
+    op.create_index("ux_kb_documents_external_id", "kb_documents", ["external_id"], unique=True)
+    op.create_index("ix_kb_passages_document_id", "kb_passages", ["document_id"])
+    op.create_index("ix_kb_passages_search_tsv", "kb_passages", ["search_tsv"], postgresql_using="gin")
+    op.create_index("ix_similar_buckets_ticket_id", "similar_buckets", ["ticket_id"])
+    op.create_index(
+        "ix_outbox_pending", "outbox", ["next_attempt_at"], postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.create_index(
+        "ix_enrichment_jobs_pending", "enrichment_jobs", ["run_after"], postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def upgrade() -> None:
+    job_status.create(op.get_bind(), checkfirst=True)
+    delivery_status.create(op.get_bind(), checkfirst=True)
+    _create_tables()
+    _add_columns()
+    _backfill()
+    _create_indexes()
+
+
+def downgrade() -> None:
+    # indexes on the dropped columns and tables go with them
+    for name in ("ix_tickets_customer_email_trgm", "ix_tickets_subject_trgm", "ix_tickets_priority_updated_at_id",
+                 "ix_tickets_status_updated_at_id", "ix_tickets_updated_at_id"):
+        op.drop_index(name, table_name="tickets")
+    op.create_index("ix_tickets_status", "tickets", ["status"])
+    op.create_index("ix_tickets_updated_at", "tickets", ["updated_at"])
+    op.drop_column("kb_documents", "external_id")
+    for column in ("search_tsv", "delivery_status", "raw_text", "ref_ids", "message_id_header"):
+        op.drop_column("messages", column)
+    op.drop_column("tickets", "first_response_at")
+    op.drop_column("tickets", "enrichment_status")
+    for table in ("analytics_daily_totals", "analytics_daily", "analytics_ticket_state", "kb_state", "kb_passages",
+                  "similar_buckets", "similar_signatures", "mailbox_checkpoints", "reprocess_runs", "ai_rules",
+                  "enrichment_jobs", "outbox"):
+        op.drop_table(table)
+    delivery_status.drop(op.get_bind(), checkfirst=True)
+    job_status.drop(op.get_bind(), checkfirst=True)
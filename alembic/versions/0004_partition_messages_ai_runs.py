@@ -0,0 +1,140 @@
+"""messages and ai_runs range-partitioned by month of created_at; messages.raw_headers as jsonb
+
+Autogenerate cannot express partitioning: each table is renamed, recreated as a partitioned
+table with the same columns and (id, created_at) as primary key, given monthly partitions
+from its oldest row to PARTITION_MONTHS_AHEAD months from now plus a default partition,
+filled, and the old table is dropped. Foreign keys to messages.id (attachments, outbox,
+enrichment_jobs) are dropped: a partitioned table's unique keys must contain created_at.
+Later months are created by app.workers.archive. Takes an exclusive lock on both tables
+for the duration of the copy.
+
+Revision ID: 0004_partition_messages_ai_runs
+Revises: 0003_workers_kb_analytics
+Create Date: 2026-10-18
+"""
+from datetime import date, datetime, timezone
+from alembic import op
+from sqlalchemy import text
+from app.core.config import settings
+
+revision = "0004_partition_messages_ai_runs"
+down_revision = "0003_workers_kb_analytics"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "messages": [
+        "CREATE INDEX ix_messages_ticket_id ON messages (ticket_id)",
+        "CREATE INDEX ix_messages_message_id_header ON messages (message_id_header)",
+        "CREATE INDEX ix_messages_ref_ids ON messages USING gin (ref_ids)",
+        "CREATE INDEX ix_messages_search_tsv ON messages USING gin (search_tsv)",
+    ],
+    "ai_runs": [],
+}
+# referencing column -> ON DELETE action, restored by downgrade
+MESSAGE_FKS = {"attachments": "CASCADE", "outbox": "SET NULL", "enrichment_jobs": "CASCADE"}
+
+
+def _add_months(month: date, n: int) -> date:
+    years, m = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, m + 1, 1)
+
+
+def _ts(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc).isoformat()
+
+
+def _columns(table: str) -> list[str]:
+    return list(op.get_bind().scalars(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table AND is_generated = 'NEVER' "
+        "ORDER BY ordinal_position"
+    ), {"table": table}))
+
+
+def _drop_foreign_keys_to(table: str) -> None:
+    bind = op.get_bind()
+    for referencing, name in bind.execute(text(
+        "SELECT CAST(conrelid AS regclass)::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = CAST(:table AS regclass)"
+    ), {"table": table}).all():
+        op.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{name}"')
+
+
+def _move_sequence(old: str, new: str) -> None:
+    seq = op.get_bind().scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": old})
+    if seq:
+        op.execute(f"ALTER SEQUENCE {seq} OWNED BY {new}.id")
+
+
+def _partition(table: str, casts: dict[str, str]) -> None:
+    flat = f"{table}_flat"
+    op.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"ALTER TABLE {table} RENAME TO {flat}")
+    op.execute(f"ALTER TABLE {flat} RENAME CONSTRAINT {table}_pkey TO {flat}_pkey")
+    op.execute(f"CREATE TABLE {table} (LIKE {flat} INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY RANGE (created_at)")
+    for column, type_ in casts.items():
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {type_} USING {column}::{type_}")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)")
+    op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE CASCADE")
+
+    oldest = op.get_bind().scalar(text(f"SELECT min(created_at) FROM {flat}"))
+    first = date.today().replace(day=1)
+    month = min(oldest.date().replace(day=1), first) if oldest else first
+    last = _add_months(first, settings.PARTITION_MONTHS_AHEAD)
+    while month <= last:
+        nxt = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{_ts(month)}') TO ('{_ts(nxt)}')"
+        )
+        month = nxt
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    cols = _columns(flat)
+    select = ", ".join(f"{c}::{casts[c]}" if c in casts else c for c in cols)
+    op.execute(f"INSERT INTO {table} ({', '.join(cols)}) SELECT {select} FROM {flat}")
+
+    _drop_foreign_keys_to(flat)
+    _move_sequence(flat, table)
+    op.execute(f"DROP TABLE {flat}")
+    for ddl in INDEXES[table]:
+        op.execute(ddl)
+    op.execute(f"ANALYZE {table}")
+
+
+def _unpartition(table: str, casts: dict[str, str]) -> None:
+    parted = f"{table}_parted"
+    op.execute(f"ALTER TABLE {table} RENAME TO {parted}")
+    op.execute(f"ALTER TABLE {parted} RENAME CONSTRAINT {table}_pkey TO {parted}_pkey")
+    op.execute(f"CREATE TABLE {table} (LIKE {parted} INCLUDING DEFAULTS INCLUDING GENERATED)")
+    for column, type_ in casts.items():
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {type_} USING {column}::{type_}")
+    cols = _columns(parted)
+    select = ", ".join(f"{c}::{casts[c]}" if c in casts else c for c in cols)
+    op.execute(f"INSERT INTO {table} ({', '.join(cols)}) SELECT {select} FROM {parted}")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE CASCADE")
+    _move_sequence(parted, table)
+    op.execute(f"DROP TABLE {parted}")  # drops the partitions too
+    for ddl in INDEXES[table]:
+        op.execute(ddl)
+
+
+def upgrade() -> None:
+    _partition("messages", {"raw_headers": "jsonb"})
+    _partition("ai_runs", {})
+    op.execute("CREATE INDEX IF NOT EXISTS ix_attachments_message_id ON attachments (message_id)")
+
+
+def downgrade() -> None:
+    # archived months (app.workers.archive) are not brought back: restore them first
+    _unpartition("messages", {"raw_headers": "json"})
+    _unpartition("ai_runs", {})
+    op.execute("DROP INDEX IF EXISTS ix_messages_message_id_header")
+    op.execute("CREATE UNIQUE INDEX ux_messages_message_id_header ON messages (message_id_header)")
+    op.execute("DROP INDEX IF EXISTS ix_attachments_message_id")
+    for referencing, on_delete in MESSAGE_FKS.items():
+        op.execute(
+            f"ALTER TABLE {referencing} ADD FOREIGN KEY (message_id) REFERENCES messages (id) ON DELETE {on_delete}"
+        )
@@ -0,0 +1,25 @@
+"""analytics_dirty: tickets queued for a rollup refresh by app.workers.analytics_refresh
+
+Revision ID: 0005_analytics_dirty
+Revises: 0004_partition_messages_ai_runs
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_analytics_dirty"
+down_revision = "0004_partition_messages_ai_runs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "analytics_dirty",
+        sa.Column("ticket_id", sa.Integer, primary_key=True),
+        sa.Column("marked_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("analytics_dirty")
@@ -0,0 +1,29 @@
+"""mailbox_failures: messages the IMAP poller skipped after IMAP_MAX_ATTEMPTS
+
+Revision ID: 0006_mailbox_failures
+Revises: 0005_analytics_dirty
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_mailbox_failures"
+down_revision = "0005_analytics_dirty"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mailbox_failures",
+        sa.Column("mailbox", sa.String(512), primary_key=True),
+        sa.Column("uidvalidity", sa.BigInteger, primary_key=True),
+        sa.Column("uid", sa.BigInteger, primary_key=True),
+        sa.Column("attempts", sa.Integer, nullable=False),
+        sa.Column("error", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("mailbox_failures")
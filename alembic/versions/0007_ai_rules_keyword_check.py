@@ -0,0 +1,23 @@
+"""ai_rules.keyword may not be empty: such a rule would match every message
+
+Rules with an empty keyword are deleted first; they applied to everything.
+
+Revision ID: 0007_ai_rules_keyword_check
+Revises: 0006_mailbox_failures
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0007_ai_rules_keyword_check"
+down_revision = "0006_mailbox_failures"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("DELETE FROM ai_rules WHERE trim(keyword) = ''")
+    op.create_check_constraint("ck_ai_rules_keyword_not_empty", "ai_rules", "trim(keyword) <> ''")
+
+
+def downgrade() -> None:
+    op.drop_constraint("ck_ai_rules_keyword_not_empty", "ai_rules", type_="check")
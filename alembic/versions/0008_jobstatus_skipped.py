@@ -0,0 +1,30 @@
+"""jobstatus 'skipped': tickets stored by batch ingest with enrich=none
+
+They were left with enrichment_status 'pending' although no job was ever queued; existing
+ones are found the same way (enrichment jobs are never deleted) and marked 'skipped'.
+
+Revision ID: 0008_jobstatus_skipped
+Revises: 0007_ai_rules_keyword_check
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0008_jobstatus_skipped"
+down_revision = "0007_ai_rules_keyword_check"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a new enum value can only be used after the transaction that added it commits
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'skipped'")
+    op.execute(
+        "UPDATE tickets SET enrichment_status = 'skipped' WHERE enrichment_status = 'pending' "
+        "AND NOT EXISTS (SELECT 1 FROM enrichment_jobs j WHERE j.ticket_id = tickets.id)"
+    )
+
+
+def downgrade() -> None:
+    # Postgres cannot drop an enum value; the rows go back to what they were before
+    op.execute("UPDATE tickets SET enrichment_status = 'pending' WHERE enrichment_status = 'skipped'")
@@ -1,10 +1,31 @@
-from typing import Generator
+from typing import AsyncIterator, Callable, TypeVar
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.core.config import settings
+from app.db.session import SessionLocal, AsyncSessionLocal
 
-def get_db() -> Generator[Session, None, None]:
+T = TypeVar("T")
+DbSession = Session | AsyncSession
+
+async def get_db() -> AsyncIterator[DbSession]:
+    """AsyncSession with DB_ASYNC, otherwise the sync Session (closed in the threadpool)."""
+    if settings.DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await run_in_threadpool(db.close)
+
+async def run_db(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Runs a sync service function without blocking the event loop.
+    AsyncSession: AsyncSession.run_sync — the ORM code runs in a greenlet and its I/O
+    goes through the async driver, no thread is held. Sync Session: a threadpool thread.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
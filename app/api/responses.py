@@ -0,0 +1,24 @@
+import enum
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+
+def _default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, enum.Enum):
+        return o.value
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+class RowsJSONResponse(JSONResponse):
+    """
+    json.dumps of plain dicts/lists (rows from column selects), skipping response_model
+    validation and jsonable_encoder — both walk every field of every object. The route
+    keeps response_model for the OpenAPI schema; the service must return rows of that shape.
+    """
+
+    def render(self, content) -> bytes:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
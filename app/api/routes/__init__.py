@@ -3,6 +3,9 @@ from .tickets import router as tickets_router
 from .kb import router as kb_router
 from .email import router as email_router
 from .export import router as export_router
+from .admin import router as admin_router
+from .metrics import router as metrics_router
+from .analytics import router as analytics_router
 
 all_routers = [
     health_router,
@@ -10,4 +13,7 @@ all_routers = [
     kb_router,
     email_router,
     export_router,
+    admin_router,
+    metrics_router,
+    analytics_router,
 ]
\ No newline at end of file
@@ -0,0 +1,43 @@
+import threading
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.api.deps import get_db, run_db, DbSession
+from app.core.security import require_api_key
+from app.db.models import ReprocessRun
+from app.db.session import SessionLocal
+from app.schemas.admin import ReprocessRequest, ReprocessRunOut
+from app.services.reprocess import start_run, run_reprocess, run_in_progress
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_api_key)])
+
+def _run_in_background(run_id: int) -> None:
+    def target() -> None:
+        with SessionLocal() as db:
+            run_reprocess(db, run_id)
+    threading.Thread(target=target, name=f"reprocess-{run_id}", daemon=True).start()
+
+@router.post("/reprocess", response_model=ReprocessRunOut)
+async def reprocess_start(payload: ReprocessRequest, db: DbSession = Depends(get_db)):
+    run = await run_db(db, start_run, payload.model_version, payload.update_tickets, payload.with_kb)
+    _run_in_background(run.id)
+    return run
+
+@router.post("/reprocess/{run_id}/resume", response_model=ReprocessRunOut)
+async def reprocess_resume(run_id: int, db: DbSession = Depends(get_db)):
+    # status alone can't tell: a run whose process died still says running
+    if await run_db(db, run_in_progress, run_id):
+        raise HTTPException(status_code=409, detail="Reprocess run is in progress")
+    run = await run_db(db, Session.get, ReprocessRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reprocess run not found")
+    if run.status == "done":
+        raise HTTPException(status_code=409, detail="Reprocess run already finished")
+    _run_in_background(run.id)
+    return run
+
+@router.get("/reprocess/{run_id}", response_model=ReprocessRunOut)
+async def reprocess_status(run_id: int, db: DbSession = Depends(get_db)):
+    run = await run_db(db, Session.get, ReprocessRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reprocess run not found")
+    return run
@@ -0,0 +1,17 @@
+from datetime import date, datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.deps import get_db, run_db, DbSession
+from app.core.security import require_api_key
+from app.schemas.analytics import AnalyticsResponse
+from app.services.analytics import get_analytics
+
+router = APIRouter(prefix="/analytics", tags=["analytics"], dependencies=[Depends(require_api_key)])
+
+@router.get("", response_model=AnalyticsResponse)
+async def analytics(date_from: date | None = None, date_to: date | None = None, db: DbSession = Depends(get_db)):
+    """Tickets by creation day (UTC); default: the last 30 days."""
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    return await run_db(db, get_analytics, date_from, date_to)
@@ -1,18 +1,26 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.api.deps import get_db, run_db, DbSession
 from app.core.security import require_api_key
 from app.schemas.common import Ok
 from app.schemas.email import SendEmailRequest
-from app.services.email import send_email
+from app.services.email import enqueue_email
 
 router = APIRouter(prefix="/email", tags=["email"], dependencies=[Depends(require_api_key)])
 
 @router.post("/send", response_model=Ok)
-def api_send_email(payload: SendEmailRequest):
-    send_email(
-        to_email=payload.to_email,
-        subject=payload.subject,
-        body_text=payload.body_text,
-        in_reply_to=payload.in_reply_to,
-        references=payload.references,
-    )
-    return {"ok": True}
\ No newline at end of file
+async def api_send_email(payload: SendEmailRequest, db: DbSession = Depends(get_db)):
+    # queued in the outbox; app.workers.smtp_sender delivers it
+    def enqueue(db: Session) -> None:
+        enqueue_email(
+            db,
+            to_email=payload.to_email,
+            subject=payload.subject,
+            body_text=payload.body_text,
+            in_reply_to=payload.in_reply_to,
+            references=payload.references,
+        )
+        db.commit()
+
+    await run_db(db, enqueue)
+    return {"ok": True}
@@ -1,19 +1,50 @@
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterator
 from fastapi import APIRouter, Depends
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
-from app.api.deps import get_db
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
 from app.core.security import require_api_key
-from app.services.export import export_tickets_csv, export_tickets_xlsx
+from app.db.session import SessionLocal, AsyncSessionLocal
+from app.services.export import export_tickets_csv, export_tickets_xlsx, export_tickets_csv_async, export_tickets_xlsx_async
+from app.services.tickets import ticket_filters
 
 router = APIRouter(prefix="/export", tags=["export"], dependencies=[Depends(require_api_key)])
 
+def _stream(export: Callable, filters: list) -> Iterator[bytes]:
+    # own session: yield-dependencies are closed before a StreamingResponse body is sent
+    with SessionLocal() as db:
+        yield from export(db, filters)
+
+async def _astream(export: Callable, filters: list) -> AsyncIterator[bytes]:
+    async with AsyncSessionLocal() as db:
+        async for chunk in export(db, filters):
+            yield chunk
+
+def _body(sync_export: Callable, async_export: Callable, filters: list):
+    # a sync iterator is advanced in the threadpool by StreamingResponse, an async one on the loop
+    if settings.DB_ASYNC:
+        return _astream(async_export, filters)
+    return _stream(sync_export, filters)
+
 @router.get("/tickets.csv")
-def export_csv(db: Session = Depends(get_db)):
-    data = export_tickets_csv(db)
-    return Response(content=data, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=tickets.csv"})
+async def export_csv(
+    status: str | None = None,
+    priority: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+):
+    filters = ticket_filters(status, priority, date_from, date_to)
+    return StreamingResponse(_body(export_tickets_csv, export_tickets_csv_async, filters), media_type="text/csv",
+                             headers={"Content-Disposition": "attachment; filename=tickets.csv"})
 
 @router.get("/tickets.xlsx")
-def export_xlsx(db: Session = Depends(get_db)):
-    data = export_tickets_xlsx(db)
-    return Response(content=data, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={"Content-Disposition": "attachment; filename=tickets.xlsx"})
\ No newline at end of file
+async def export_xlsx(
+    status: str | None = None,
+    priority: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+):
+    filters = ticket_filters(status, priority, date_from, date_to)
+    return StreamingResponse(_body(export_tickets_xlsx, export_tickets_xlsx_async, filters),
+                             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                             headers={"Content-Disposition": "attachment; filename=tickets.xlsx"})
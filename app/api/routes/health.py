@@ -4,5 +4,6 @@ from app.schemas.common import Ok
 router = APIRouter(tags=["health"])
 
 @router.get("/health", response_model=Ok)
-def health():
+async def health():
+    # no DB, no threadpool: answers even when every worker thread is busy
     return Ok(ok=True)
\ No newline at end of file
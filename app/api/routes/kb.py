@@ -1,33 +1,125 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.api.deps import get_db
+import json
+import time
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from app.core.config import settings
+from app.api.deps import get_db, run_db, DbSession
 from app.core.security import require_api_key
-from app.schemas.kb import KbDocumentCreate, KbDocumentOut, KbSearchResponse
-from app.services.kb import create_kb_document, update_kb_document, get_kb_document, search_kb
+from app.schemas.kb import KbDocumentCreate, KbDocumentImport, KbDocumentOut, KbImportResponse, KbSearchResponse, KbSearchExplain, KbCacheStats
+from app.services.kb import (
+    create_kb_document, update_kb_document, get_kb_document, search_kb, explain_kb_search, kb_cache_stats,
+    import_kb_documents, finish_kb_import, import_summary,
+)
 
 router = APIRouter(prefix="/kb", tags=["kb"], dependencies=[Depends(require_api_key)])
 
 @router.post("/documents", response_model=KbDocumentOut)
-def kb_create(payload: KbDocumentCreate, db: Session = Depends(get_db)):
-    doc = create_kb_document(db, payload.title, payload.body, payload.tags, payload.language, payload.status)
+async def kb_create(payload: KbDocumentCreate, db: DbSession = Depends(get_db)):
+    doc = await run_db(db, create_kb_document, payload.title, payload.body, payload.tags, payload.language, payload.status)
     return doc
 
+@router.post("/documents/bulk", response_model=KbImportResponse)
+async def kb_bulk(
+    request: Request,
+    reindex: Literal["deferred", "inline"] = "deferred",
+    db: DbSession = Depends(get_db),
+):
+    """
+    Body: NDJSON (one KbDocumentImport per line) or a JSON array of them, at most
+    KB_IMPORT_ARRAY_MAX_BYTES (NDJSON is streamed and has no limit). Upserts on external_id
+    in chunks of KB_IMPORT_CHUNK, one transaction each. reindex=deferred updates the vector
+    index and the KB version (search cache) once after the last chunk. Errors are per document.
+    """
+    started = time.perf_counter()
+    results: list[dict] = []
+    chunk: list[tuple[int, dict]] = []
+    index = 0
+
+    async def flush() -> None:
+        rows = await run_db(db, import_kb_documents, [it for _, it in chunk], reindex)
+        results.extend({"index": i, **r} for (i, _), r in zip(chunk, rows))
+        chunk.clear()
+
+    async def take(record) -> None:
+        nonlocal index
+        try:
+            if isinstance(record, dict):
+                chunk.append((index, KbDocumentImport.model_validate(record).model_dump()))
+            else:
+                chunk.append((index, KbDocumentImport.model_validate_json(record).model_dump()))
+        except ValidationError as e:
+            results.append({"index": index, "error": str(e.errors(include_url=False))[:500]})
+        index += 1
+        if len(chunk) >= settings.KB_IMPORT_CHUNK:
+            await flush()
+
+    stream = request.stream()
+    head = b""
+    async for data in stream:
+        head += data
+        if head.strip():
+            break
+    if head.lstrip().startswith(b"["):
+        # a JSON array cannot be split into records before it is complete: it is held in memory, so
+        # it is capped at KB_IMPORT_ARRAY_MAX_BYTES; larger imports go as NDJSON
+        parts, size = [head], len(head)
+        async for data in stream:
+            size += len(data)
+            if size > settings.KB_IMPORT_ARRAY_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="JSON array too large, send NDJSON")
+            parts.append(data)
+        try:
+            records = await run_in_threadpool(json.loads, b"".join(parts))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON array")
+        for record in records:
+            await take(record if isinstance(record, dict) else json.dumps(record))
+    else:
+        tail = head
+        async for data in stream:
+            lines = (tail + data).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if line.strip():
+                    await take(line)
+        for line in tail.split(b"\n"):
+            if line.strip():
+                await take(line)
+    if chunk:
+        await flush()
+
+    if reindex == "deferred":
+        touched = [r["id"] for r in results if r.get("action") in ("created", "updated")]
+        await run_db(db, finish_kb_import, touched)
+    results.sort(key=lambda r: r["index"])
+    return import_summary(results, time.perf_counter() - started)
+
 @router.put("/documents/{doc_id}", response_model=KbDocumentOut)
-def kb_update(doc_id: int, payload: KbDocumentCreate, db: Session = Depends(get_db)):
+async def kb_update(doc_id: int, payload: KbDocumentCreate, db: DbSession = Depends(get_db)):
     try:
-        doc = update_kb_document(db, doc_id, payload.title, payload.body, payload.tags, payload.language, payload.status)
+        doc = await run_db(db, update_kb_document, doc_id, payload.title, payload.body, payload.tags, payload.language, payload.status)
         return doc
     except ValueError:
         raise HTTPException(status_code=404, detail="KB document not found")
 
 @router.get("/documents/{doc_id}", response_model=KbDocumentOut)
-def kb_get(doc_id: int, db: Session = Depends(get_db)):
-    doc = get_kb_document(db, doc_id)
+async def kb_get(doc_id: int, db: DbSession = Depends(get_db)):
+    doc = await run_db(db, get_kb_document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="KB document not found")
     return doc
 
 @router.get("/search", response_model=KbSearchResponse)
-def kb_search(q: str, limit: int = 5, db: Session = Depends(get_db)):
-    hits = search_kb(db, query=q, limit=min(max(limit, 1), 20))
-    return {"query": q, "hits": hits}
\ No newline at end of file
+async def kb_search(q: str, limit: int = 5, mode: Literal["lexical", "hybrid"] | None = None, db: DbSession = Depends(get_db)):
+    hits = await run_db(db, search_kb, query=q, limit=min(max(limit, 1), 20), mode=mode)
+    return {"query": q, "hits": hits}
+
+@router.get("/search/explain", response_model=KbSearchExplain)
+async def kb_search_explain(q: str, limit: int = 5, mode: Literal["lexical", "hybrid"] | None = None, db: DbSession = Depends(get_db)):
+    return await run_db(db, explain_kb_search, query=q, limit=min(max(limit, 1), 20), mode=mode)
+
+@router.get("/cache", response_model=KbCacheStats)
+async def kb_cache(db: DbSession = Depends(get_db)):
+    return await run_db(db, kb_cache_stats)
\ No newline at end of file
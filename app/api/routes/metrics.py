@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import render
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format 0.0.4; like /health, no API key (scrapers)
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,113 +1,200 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.api.deps import get_db
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import ValidationError
+from app.core.config import settings
+from app.api.deps import get_db, run_db, DbSession
+from app.api.responses import RowsJSONResponse
+from app.db.session import count_statements
 from app.core.security import require_api_key
-from app.schemas.common import Page, IdResponse, Ok
+from app.schemas.common import IdResponse
 from app.schemas.tickets import (
-    TicketCreateInbound, TicketOut, TicketDetailOut, TicketUpdate,
-    ApproveSendRequest, RequestInfoRequest, EscalateRequest
+    TicketCreateInbound, BatchIngestResponse, TicketOut, TicketPage, TicketSearchResponse, TicketDetailOut, TicketUpdate,
+    ApproveSendRequest, RequestInfoRequest, EscalateRequest, TicketActionOut, SimilarTicketsResponse
 )
 from app.services.tickets import (
-    create_ticket_from_inbound, list_tickets, get_ticket_detail, update_ticket, add_outbound_message
+    create_ticket_from_inbound, create_tickets_from_inbound_batch, list_tickets, search_tickets, get_ticket_detail, update_ticket, ticket_action,
+    parse_fields, TICKET_FIELDS, MESSAGE_FIELDS, MESSAGE_EXTRA_FIELDS,
 )
-from app.services.email import send_email
+from app.services.similar import similar_to_ticket
 
 router = APIRouter(prefix="/tickets", tags=["tickets"], dependencies=[Depends(require_api_key)])
 
+def _fields(fields: str | None, allowed: tuple[str, ...], default: tuple[str, ...] | None = None) -> tuple[str, ...]:
+    try:
+        return parse_fields(fields, allowed, default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/inbound", response_model=IdResponse)
-def ingest_inbound(payload: TicketCreateInbound, db: Session = Depends(get_db)):
-    ticket = create_ticket_from_inbound(
-        db=db,
+async def ingest_inbound(payload: TicketCreateInbound, db: DbSession = Depends(get_db)):
+    ticket = await run_db(
+        db,
+        create_ticket_from_inbound,
         subject=payload.subject,
         customer_email=payload.customer_email,
         from_email=payload.from_email,
         to_email=payload.to_email,
         cleaned_text=payload.cleaned_text,
         raw_headers=payload.raw_headers,
+        keep_raw=payload.keep_raw,
     )
     return {"id": ticket.id}
 
-@router.get("", response_model=Page)
-def tickets_list(
+@router.post("/inbound/batch", response_model=BatchIngestResponse)
+async def ingest_inbound_batch(
+    request: Request,
+    enrich: Literal["queue", "inline", "none"] = "queue",
+    db: DbSession = Depends(get_db),
+):
+    """
+    NDJSON body: one TicketCreateInbound per line. The body is read as a stream and
+    inserted in chunks of INBOUND_BATCH_CHUNK; errors are reported per record.
+    """
+    results: list[dict] = []
+    chunk: list[tuple[int, dict]] = []
+    index = 0
+
+    async def flush() -> None:
+        rows = await run_db(db, create_tickets_from_inbound_batch, [it for _, it in chunk], enrich)
+        results.extend({"index": i, **r} for (i, _), r in zip(chunk, rows))
+        chunk.clear()
+
+    def take(line: bytes) -> None:
+        nonlocal index
+        if not line.strip():
+            return
+        try:
+            chunk.append((index, TicketCreateInbound.model_validate_json(line).model_dump()))
+        except ValidationError as e:
+            results.append({"index": index, "id": None, "error": str(e.errors(include_url=False))[:500]})
+        index += 1
+
+    tail = b""
+    async for data in request.stream():
+        lines = (tail + data).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            take(line)
+            if len(chunk) >= settings.INBOUND_BATCH_CHUNK:
+                await flush()
+    take(tail)
+    if chunk:
+        await flush()
+
+    results.sort(key=lambda r: r["index"])
+    created = sum(1 for r in results if r["id"] is not None)
+    return {"created": created, "failed": len(results) - created, "items": results}
+
+@router.get("", response_model=TicketPage)
+async def tickets_list(
     limit: int = 20,
-    offset: int = 0,
+    cursor: str | None = None,
     status: str | None = None,
     priority: str | None = None,
     q: str | None = None,
-    db: Session = Depends(get_db),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    total: Literal["none", "estimate", "exact"] = "none",
+    fields: str | None = None,
+    db: DbSession = Depends(get_db),
 ):
+    """fields: comma-separated TicketOut fields to return (id is always included); default all."""
     limit = min(max(limit, 1), 200)
-    offset = max(offset, 0)
-    items, total = list_tickets(db, limit=limit, offset=offset, status=status, priority=priority, q=q)
-    return {"items": items, "total": total, "limit": limit, "offset": offset}
+    columns = _fields(fields, TICKET_FIELDS)
+    try:
+        items, next_cursor, prev_cursor, count = await run_db(
+            db, list_tickets, limit=limit, cursor=cursor, status=status, priority=priority, q=q,
+            date_from=date_from, date_to=date_to, total=total, fields=columns,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return RowsJSONResponse({"items": items, "total": count, "limit": limit, "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+@router.get("/search", response_model=TicketSearchResponse)
+async def tickets_search(
+    q: str,
+    limit: int = 20,
+    status: str | None = None,
+    priority: str | None = None,
+    db: DbSession = Depends(get_db),
+):
+    hits = await run_db(db, search_tickets, q=q, limit=min(max(limit, 1), 100), status=status, priority=priority)
+    return {"query": q, "hits": hits}
 
 @router.get("/{ticket_id}", response_model=TicketDetailOut)
-def ticket_detail(ticket_id: int, db: Session = Depends(get_db)):
-    ticket, msgs = get_ticket_detail(db, ticket_id)
+async def ticket_detail(
+    ticket_id: int,
+    fields: str | None = None,
+    message_fields: str | None = None,
+    messages_limit: int = 50,
+    messages_cursor: str | None = None,
+    db: DbSession = Depends(get_db),
+):
+    """Messages are paged oldest first: pass next_cursor back as messages_cursor."""
+    columns = _fields(fields, TICKET_FIELDS)
+    message_columns = _fields(message_fields, MESSAGE_FIELDS + MESSAGE_EXTRA_FIELDS, MESSAGE_FIELDS)
+    try:
+        ticket, msgs, next_cursor = await run_db(
+            db, get_ticket_detail, ticket_id, fields=columns, message_fields=message_columns,
+            messages_limit=min(max(messages_limit, 1), 500), messages_cursor=messages_cursor,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    return {"ticket": ticket, "messages": msgs}
+    return RowsJSONResponse({"ticket": ticket, "messages": msgs, "next_cursor": next_cursor})
 
-@router.patch("/{ticket_id}", response_model=TicketOut)
-def ticket_patch(ticket_id: int, payload: TicketUpdate, db: Session = Depends(get_db)):
+@router.get("/{ticket_id}/similar", response_model=SimilarTicketsResponse)
+async def ticket_similar(ticket_id: int, k: int = 5, db: DbSession = Depends(get_db)):
     try:
-        ticket = update_ticket(
-            db,
-            ticket_id,
-            status=payload.status,
-            category=payload.category,
-            product=payload.product,
-            priority=payload.priority,
-        )
-        return ticket
+        hits = await run_db(db, similar_to_ticket, ticket_id, k=min(max(k, 1), 50))
     except ValueError:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    return {"ticket_id": ticket_id, "hits": hits}
 
-@router.post("/{ticket_id}/approve-send", response_model=Ok)
-def approve_and_send(ticket_id: int, payload: ApproveSendRequest, db: Session = Depends(get_db)):
-    ticket, _ = get_ticket_detail(db, ticket_id)
-    if not ticket:
+@router.patch("/{ticket_id}", response_model=TicketOut)
+async def ticket_patch(ticket_id: int, payload: TicketUpdate, response: Response, db: DbSession = Depends(get_db)):
+    try:
+        with count_statements() as stmts:
+            ticket = await run_db(
+                db,
+                update_ticket,
+                ticket_id,
+                status=payload.status,
+                category=payload.category,
+                product=payload.product,
+                priority=payload.priority,
+            )
+    except ValueError:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    response.headers["X-DB-Statements"] = str(stmts.n)
+    return ticket
 
-    to_email = payload.to_email or ticket.customer_email
-    subject = payload.subject or ticket.subject or "Support request"
-
-    # Send
-    send_email(to_email=to_email, subject=subject, body_text=payload.reply_text)
-
-    # Save outbound message and update ticket status
-    add_outbound_message(db, ticket_id, to_email=to_email, subject=subject, body_text=payload.reply_text)
-    update_ticket(db, ticket_id, status="waiting_customer")
-
-    return {"ok": True}
-
-@router.post("/{ticket_id}/request-info", response_model=Ok)
-def request_info(ticket_id: int, payload: RequestInfoRequest, db: Session = Depends(get_db)):
-    ticket, _ = get_ticket_detail(db, ticket_id)
-    if not ticket:
+async def _action(db: DbSession, ticket_id: int, status: str, **reply) -> dict:
+    try:
+        with count_statements() as stmts:
+            result = await run_db(db, ticket_action, ticket_id, status, **reply)
+    except ValueError:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    return {"ok": True, **result, "statements": stmts.n}
 
-    to_email = payload.to_email or ticket.customer_email
-    subject = payload.subject or (ticket.subject or "Support request")
+@router.post("/{ticket_id}/approve-send", response_model=TicketActionOut)
+async def approve_and_send(ticket_id: int, payload: ApproveSendRequest, db: DbSession = Depends(get_db)):
+    # outbound message + outbox row + status in one transaction; the sender worker delivers it
+    return await _action(db, ticket_id, "waiting_customer",
+                   body_text=payload.reply_text, to_email=payload.to_email, subject=payload.subject)
 
+@router.post("/{ticket_id}/request-info", response_model=TicketActionOut)
+async def request_info(ticket_id: int, payload: RequestInfoRequest, db: DbSession = Depends(get_db)):
     body = (
         "Здравствуйте!\n\n"
         "Чтобы быстрее помочь, уточните, пожалуйста:\n"
         + "\n".join(f"- {q}" for q in payload.questions)
         + "\n\nС уважением,\nТехподдержка"
     )
+    return await _action(db, ticket_id, "needs_info", body_text=body, to_email=payload.to_email, subject=payload.subject)
 
-    send_email(to_email=to_email, subject=subject, body_text=body)
-    add_outbound_message(db, ticket_id, to_email=to_email, subject=subject, body_text=body)
-    update_ticket(db, ticket_id, status="needs_info")
-
-    return {"ok": True}
-
-@router.post("/{ticket_id}/escalate", response_model=Ok)
-def escalate(ticket_id: int, payload: EscalateRequest, db: Session = Depends(get_db)):
-    ticket, _ = get_ticket_detail(db, ticket_id)
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-
-    update_ticket(db, ticket_id, status="escalated")
-    return {"ok": True}
\ No newline at end of file
+@router.post("/{ticket_id}/escalate", response_model=TicketActionOut)
+async def escalate(ticket_id: int, payload: EscalateRequest, db: DbSession = Depends(get_db)):
+    return await _action(db, ticket_id, "escalated")
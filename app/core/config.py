@@ -7,19 +7,86 @@ class Settings(BaseSettings):
     ENV: str = "dev"
 
     DATABASE_URL: str
+    DB_ASYNC: bool = False             # async engine + AsyncSession in the API (sync Session in a threadpool otherwise)
+    DB_POOL_SIZE: int = 5              # per engine and process; see db_pool_* in /metrics
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30          # seconds to wait for a connection before erroring
 
     IMAP_HOST: str = ""
     IMAP_PORT: int = 993
     IMAP_USER: str = ""
     IMAP_PASSWORD: str = ""
+    IMAP_USE_SSL: bool = True
+    IMAP_MAILBOX: str = "INBOX"
+    IMAP_FETCH_BATCH: int = 50         # UIDs per UID FETCH round trip
+    IMAP_IDLE_TIMEOUT: int = 25 * 60   # re-issue IDLE before the 29 min server cutoff
+    IMAP_POLL_INTERVAL: int = 30       # used when the server has no IDLE, and between retries of a failed message
+    IMAP_MAX_ATTEMPTS: int = 5         # then the message is recorded in mailbox_failures and skipped
+    IMAP_STREAM_THRESHOLD: int = 1_000_000  # bigger messages are fetched in chunks to a temp file
+    IMAP_FETCH_CHUNK: int = 1_000_000
+
+    ATTACHMENTS_DIR: str = "data/attachments"
+    MIME_TEXT_LIMIT: int = 1_000_000  # max bytes kept from a text/plain or text/html part
+    CLEAN_TEXT_LIMIT: int = 20_000     # chars of cleaned message text stored, analyzed and indexed
+    KEEP_RAW_TEXT: bool = False        # also store the uncleaned text in messages.raw_text
 
     SMTP_HOST: str = ""
     SMTP_PORT: int = 587
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
     SMTP_USE_TLS: bool = True
+    SMTP_TIMEOUT: int = 30
+    SMTP_POOL_SIZE: int = 2            # long-lived connections in the sender worker
+    SMTP_BATCH: int = 20
+    SMTP_NOOP_AFTER: int = 60          # check an idle connection with NOOP before reuse
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_LEASE_SECONDS: int = 300    # claimed rows become visible again if a sender dies
+    OUTBOX_POLL_INTERVAL: float = 1.0
+
+    INBOUND_BATCH_CHUNK: int = 500     # rows per multi-row INSERT in /tickets/inbound/batch
+
+    ENRICH_INLINE: bool = False        # run AI/KB inside the ingest request (dev without a worker)
+    ENRICH_WORKERS: int = 4
+    ENRICH_BATCH: int = 10
+    ENRICH_MAX_ATTEMPTS: int = 5
+    ENRICH_POLL_INTERVAL: float = 1.0
+    AI_RUN_OUTPUTS: str = "full"       # full / ref (don't repeat in ai_runs what the enriched ticket row holds; runs are write-only then)
+
+    ANALYTICS_REFRESH_INTERVAL: float = 5.0  # analytics_refresh poll; about how far /analytics lags the writes
+    ANALYTICS_REFRESH_BATCH: int = 1000      # queued tickets per refresh transaction
+
+    PARTITION_MONTHS_AHEAD: int = 3    # monthly partitions of messages / ai_runs created in advance
+    ARCHIVE_DIR: str = "data/archive"  # gzip NDJSON cold storage of archived partitions
+    ARCHIVE_AFTER_MONTHS: int = 6      # months after which solved tickets' messages / ai_runs leave the DB
+
+    REPROCESS_CHUNK: int = 5000        # tickets per read/write round
+    REPROCESS_WORKERS: int = 0         # analysis processes, 0 = cpu count
+
+    SIMILAR_NUM_PERM: int = 96         # MinHash signature length
+    SIMILAR_BANDS: int = 32            # LSH bands of NUM_PERM / BANDS rows: ~0.3 Jaccard threshold
+    SIMILAR_CANDIDATES: int = 200      # bucket hits re-ranked by signature per query
+    SIMILAR_MIN_SCORE: float = 0.2     # estimated Jaccard below this is not "similar"
+    SIMILAR_TOP_K: int = 5
+
+    EXPORT_CHUNK_ROWS: int = 2000      # rows per server-side cursor fetch / streamed chunk
 
     API_KEY: str = "dev_api_key_change_me"
     KB_TS_CONFIG: str = "russian"  # russian / english etc.
 
+    CACHE_BACKEND: str = "memory"  # memory / redis
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    KB_CACHE_SIZE: int = 2048
+    KB_CACHE_TTL: int = 300
+
+    KB_SEARCH_MODE: str = "hybrid"     # lexical / hybrid (ts_rank_cd fused with the local vector index)
+    KB_INDEX_DIR: str = "data/kb_index"
+    KB_VECTOR_DIM: int = 2048          # hashed char n-gram features per document
+    KB_HYBRID_CANDIDATES: int = 50     # hits taken from each ranking before fusion
+    KB_RRF_K: int = 60                 # reciprocal rank fusion constant
+    KB_QUERY_TERMS: int = 8            # longer queries (emails) are reduced to this many key terms
+    KB_FALLBACK_WEIGHT: float = 0.5    # rank multiplier for hits found only by the OR-of-terms fallback
+    KB_IMPORT_CHUNK: int = 500         # documents per multi-row upsert in /kb/documents/bulk
+    KB_IMPORT_ARRAY_MAX_BYTES: int = 32 * 1024 * 1024  # JSON-array body of /kb/documents/bulk (NDJSON is unlimited)
+    KB_PASSAGE_CHARS: int = 1200       # paragraph window of a KB passage (a heading always starts a new one)
+
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+In-process metrics in the Prometheus text format (GET /metrics), no client library.
+
+Counter / Histogram are label-keyed and thread-safe; Gauge values can be callbacks
+read at scrape time (DB pool state). Every process keeps its own numbers: the API
+exposes its own, workers only log.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float | Callable[[], float]] = {}
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, *labels: str, fn: Callable[[], float]) -> None:
+        with self._lock:
+            self._values[labels] = fn
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: kv[0])
+        lines = self.header()
+        for k, v in items:
+            value = v() if callable(v) else v
+            lines.append(f"{self.name}{_labels(self.labelnames, k)} {_num(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = (*buckets, math.inf)
+        # labels -> [per-bucket counts..., sum, count]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        for k, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, k)} {row[-1]}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template, method and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency until the last body byte", ("method", "route"))
+DB_STATEMENT = Histogram("db_statement_duration_seconds", "SQL statement execution time", ("engine", "verb"), DB_BUCKETS)
+DB_POOL = Gauge("db_pool_connections", "SQLAlchemy pool state", ("engine", "state"))
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time to get a connection from the pool", ("engine",), DB_BUCKETS)
+STAGE = Histogram("pipeline_stage_duration_seconds", "Ingest / enrichment / mail / export stages", ("stage",))
+
+
+def stage(name: str):
+    """with stage("kb_search"): ... — one histogram series per pipeline stage."""
+    return STAGE.time(name)
+
+
+class MetricsMiddleware:
+    """Pure ASGI (streaming responses are timed to their last chunk); labels use the route template, not the raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(scope["method"], path, str(status))
+            HTTP_LATENCY.observe(scope["method"], path, value=time.perf_counter() - start)
@@ -1,9 +1,12 @@
 import enum
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy import (
-    String, Text, DateTime, Enum, Integer, ForeignKey, Boolean, JSON, func, Index
+    String, Text, Date, DateTime, Enum, Integer, BigInteger, SmallInteger, Float, LargeBinary, ForeignKey, Boolean, JSON, func, Index
 )
+from sqlalchemy import CheckConstraint, Computed, DDL, FetchedValue, event
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.core.config import settings
 from app.db.base import Base
 
 
@@ -20,6 +23,19 @@ class MessageDirection(str, enum.Enum):
     outbound = "outbound"
 
 
+class DeliveryStatus(str, enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
+
+class JobStatus(str, enum.Enum):
+    pending = "pending"
+    done = "done"
+    failed = "failed"
+    skipped = "skipped"  # tickets.enrichment_status only: batch ingest with enrich="none"
+
+
 class Ticket(Base):
     __tablename__ = "tickets"
 
@@ -36,65 +52,210 @@ class Ticket(Base):
     ai_summary: Mapped[str] = mapped_column(Text, default="")
     ai_suggested_actions: Mapped[dict] = mapped_column(JSON, default=dict)
     ai_draft_reply: Mapped[str] = mapped_column(Text, default="")
+    enrichment_status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.pending)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    first_response_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # first outbound reply
 
     messages: Mapped[list["Message"]] = relationship(back_populates="ticket", cascade="all, delete-orphan")
     ai_runs: Mapped[list["AiRun"]] = relationship(back_populates="ticket", cascade="all, delete-orphan")
 
 
 class Message(Base):
+    """
+    Range-partitioned by month of created_at (app.services.partitions), so the key is
+    (id, created_at); id alone is still unique and is the ORM identity. Nothing can hold a
+    foreign key to it: attachments / outbox / enrichment_jobs keep plain message_id columns.
+    """
     __tablename__ = "messages"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"))
     direction: Mapped[MessageDirection] = mapped_column(Enum(MessageDirection))
     from_email: Mapped[str] = mapped_column(String(320), default="")
     to_email: Mapped[str] = mapped_column(String(320), default="")
     subject: Mapped[str] = mapped_column(String(512), default="")
 
-    raw_headers: Mapped[dict] = mapped_column(JSON, default=dict)
+    raw_headers: Mapped[dict] = mapped_column(JSONB, default=dict)
+    # threading: normalized "<id>" values lifted out of raw_headers so they can be indexed
+    message_id_header: Mapped[str | None] = mapped_column(String(998), nullable=True)
+    ref_ids: Mapped[list[str]] = mapped_column(ARRAY(String(998)), default=list)  # In-Reply-To + References
     cleaned_text: Mapped[str] = mapped_column(Text, default="")
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # text as received, only when asked for (KEEP_RAW_TEXT / keep_raw) and cleaning changed it
+    raw_text: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True)
+    delivery_status: Mapped[DeliveryStatus | None] = mapped_column(Enum(DeliveryStatus), nullable=True)  # outbound only
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+
+    # maintained by Postgres on every insert/update; never loaded unless asked for
+    search_tsv: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(cleaned_text, ''))", persisted=True),
+        deferred=True,
+    )
 
     ticket: Mapped["Ticket"] = relationship(back_populates="messages")
-    attachments: Mapped[list["Attachment"]] = relationship(back_populates="message", cascade="all, delete-orphan")
+    attachments: Mapped[list["Attachment"]] = relationship(
+        back_populates="message", cascade="all, delete-orphan",
+        primaryjoin="Message.id == foreign(Attachment.message_id)",
+    )
+
+    __mapper_args__ = {"primary_key": [id]}
 
 
 class Attachment(Base):
     __tablename__ = "attachments"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    message_id: Mapped[int] = mapped_column(ForeignKey("messages.id", ondelete="CASCADE"))
+    message_id: Mapped[int] = mapped_column(Integer)  # messages.id (partitioned: no FK)
     filename: Mapped[str] = mapped_column(String(512), default="")
     mime_type: Mapped[str] = mapped_column(String(128), default="")
     size_bytes: Mapped[int] = mapped_column(Integer, default=0)
     storage_path: Mapped[str] = mapped_column(String(1024), default="")
 
-    message: Mapped["Message"] = relationship(back_populates="attachments")
+    message: Mapped["Message"] = relationship(
+        back_populates="attachments", primaryjoin="foreign(Attachment.message_id) == Message.id",
+    )
 
 
 class AiRun(Base):
+    """Range-partitioned by month of created_at, like Message."""
     __tablename__ = "ai_runs"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"))
 
     model_versions: Mapped[dict] = mapped_column(JSON, default=dict)
+    # AI_RUN_OUTPUTS=ref: what the ticket row already holds is replaced by {"ref": ...} (app.services.enrichment)
     outputs: Mapped[dict] = mapped_column(JSON, default=dict)
     confidence: Mapped[int] = mapped_column(Integer, default=0)
 
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
 
     ticket: Mapped["Ticket"] = relationship(back_populates="ai_runs")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class OutboxEmail(Base):
+    """Outbound mail, written in the same transaction as the outbound Message and drained by app.workers.smtp_sender."""
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # messages.id (partitioned: no FK)
+    message_id_header: Mapped[str] = mapped_column(String(998), default="")
+    to_email: Mapped[str] = mapped_column(String(320))
+    subject: Mapped[str] = mapped_column(String(512), default="")
+    body_text: Mapped[str] = mapped_column(Text, default="")
+    in_reply_to: Mapped[str] = mapped_column(String(998), default="")
+    references: Mapped[str] = mapped_column(Text, default="")
+
+    status: Mapped[DeliveryStatus] = mapped_column(Enum(DeliveryStatus), default=DeliveryStatus.pending)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, default="")
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class EnrichmentJob(Base):
+    """AI/KB enrichment queue, claimed by workers with FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "enrichment_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"))
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # messages.id (partitioned: no FK)
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.pending)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, default="")
+    run_after: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class AiRule(Base):
+    """Keyword rule for analyze_message: kind=category|priority|os, value=result, lower order wins."""
+    __tablename__ = "ai_rules"
+    # an empty keyword would match at every position of every message
+    __table_args__ = (CheckConstraint("trim(keyword) <> ''", name="ck_ai_rules_keyword_not_empty"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    value: Mapped[str] = mapped_column(String(128))
+    keyword: Mapped[str] = mapped_column(String(256))
+    order: Mapped[int] = mapped_column(Integer, default=100)
+    active: Mapped[bool] = mapped_column(Boolean, default=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ReprocessRun(Base):
+    """Re-analysis of historical tickets; last_ticket_id is the resume point."""
+    __tablename__ = "reprocess_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    model_version: Mapped[str] = mapped_column(String(128))
+    status: Mapped[str] = mapped_column(String(16), default="running")  # running/done/failed
+    update_tickets: Mapped[bool] = mapped_column(Boolean, default=False)
+    with_kb: Mapped[bool] = mapped_column(Boolean, default=False)
+    last_ticket_id: Mapped[int] = mapped_column(Integer, default=0)
+    processed: Mapped[int] = mapped_column(Integer, default=0)
+    updated_tickets: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str] = mapped_column(Text, default="")
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class MailboxCheckpoint(Base):
+    """Last ingested UID per IMAP mailbox, so the poller resumes instead of rescanning."""
+    __tablename__ = "mailbox_checkpoints"
+
+    mailbox: Mapped[str] = mapped_column(String(512), primary_key=True)  # user@host/INBOX
+    uidvalidity: Mapped[int] = mapped_column(BigInteger, default=0)
+    last_uid: Mapped[int] = mapped_column(BigInteger, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class MailboxFailure(Base):
+    """Message the IMAP poller gave up on after IMAP_MAX_ATTEMPTS and skipped; it stays in the mailbox."""
+    __tablename__ = "mailbox_failures"
+
+    mailbox: Mapped[str] = mapped_column(String(512), primary_key=True)
+    uidvalidity: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    uid: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer)
+    error: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class SimilarSignature(Base):
+    """MinHash signature of a solved ticket (subject + summary + first inbound text), see app.services.similar."""
+    __tablename__ = "similar_signatures"
+
+    ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True)
+    signature: Mapped[bytes] = mapped_column(LargeBinary)  # SIMILAR_NUM_PERM little-endian uint64
+    indexed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class SimilarBucket(Base):
+    """LSH bands of the signatures: tickets sharing a (band, bucket) are similarity candidates."""
+    __tablename__ = "similar_buckets"
+
+    band: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    ticket_id: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True)
+
 
 # KB (Variant 3: Full-Text Search)
 class KbDocument(Base):
     __tablename__ = "kb_documents"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    external_id: Mapped[str | None] = mapped_column(String(256), nullable=True)  # id in the source help center (bulk import)
     title: Mapped[str] = mapped_column(String(512))
     body: Mapped[str] = mapped_column(Text)
     tags: Mapped[list[str]] = mapped_column(JSON, default=list)  # MVP: JSON array
@@ -102,11 +263,125 @@ class KbDocument(Base):
     status: Mapped[str] = mapped_column(String(32), default="active")  # active/archived
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
-    # We'll store tsvector in DB via migration SQL (generated column) for best performance.
-    # Here we keep it as TEXT placeholder for SQLAlchemy mapping safety; real type is TSVECTOR.
-    search_tsv: Mapped[str] = mapped_column(Text, default="")  # 실제 tsvector via migration
+    # title (A) + body (B), filled in by the kb_documents_search_tsv trigger (alembic 0002_initial_tables);
+    # never written by the ORM. KB search ranks kb_passages instead.
+    search_tsv: Mapped[str | None] = mapped_column(TSVECTOR, server_default=FetchedValue(), nullable=True, deferred=True)
+
+
+class KbPassage(Base):
+    """A heading section / paragraph window of a KB document: the unit search ranks and snippets (app.services.kb_passages)."""
+    __tablename__ = "kb_passages"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey("kb_documents.id", ondelete="CASCADE"))
+    position: Mapped[int] = mapped_column(Integer)  # order within the document
+    heading: Mapped[str] = mapped_column(String(512))  # nearest heading above, else the document title
+    text: Mapped[str] = mapped_column(Text)
+    content_hash: Mapped[str] = mapped_column(String(40))  # sha1 of heading + text: unchanged passages are kept on re-chunk
+
+    search_tsv: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(heading, '')), 'A')"
+            f" || setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(text, '')), 'B')",
+            persisted=True,
+        ),
+        deferred=True,
+    )
+
+
+class KbState(Base):
+    """Single row (id=1). `version` is bumped by every KB write and keys the search cache."""
+    __tablename__ = "kb_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+# Analytics rollups (app.services.analytics), keyed by the day the ticket was created (UTC)
+class AnalyticsTicketState(Base):
+    """What each ticket currently contributes to the rollups; a refresh applies the difference."""
+    __tablename__ = "analytics_ticket_state"
+
+    ticket_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[date] = mapped_column(Date)
+    status: Mapped[str] = mapped_column(String(32))
+    category: Mapped[str] = mapped_column(String(128))
+    priority: Mapped[str] = mapped_column(String(32))
+    confidence: Mapped[int | None] = mapped_column(Integer, nullable=True)  # counted once enrichment is done
+    response_seconds: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+class AnalyticsDaily(Base):
+    """Ticket counts per day and status / category / priority value."""
+    __tablename__ = "analytics_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    dimension: Mapped[str] = mapped_column(String(16), primary_key=True)  # status/category/priority
+    value: Mapped[str] = mapped_column(String(128), primary_key=True)
+    tickets: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class AnalyticsDailyTotals(Base):
+    __tablename__ = "analytics_daily_totals"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    tickets: Mapped[int] = mapped_column(BigInteger, default=0)
+    confidence_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+    confidence_n: Mapped[int] = mapped_column(BigInteger, default=0)
+    responded: Mapped[int] = mapped_column(BigInteger, default=0)
+    response_seconds_sum: Mapped[float] = mapped_column(Float, default=0.0)
 
-Index("ix_tickets_status", Ticket.status)
-Index("ix_tickets_updated_at", Ticket.updated_at)
+
+class AnalyticsDirty(Base):
+    """Tickets changed since their last rollup refresh, queued on commit; drained by app.workers.analytics_refresh."""
+    __tablename__ = "analytics_dirty"
+
+    ticket_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    marked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+# keyset pagination on (updated_at, id), with and without the list filters
+Index("ix_tickets_updated_at_id", Ticket.updated_at, Ticket.id)
+Index("ix_tickets_status_updated_at_id", Ticket.status, Ticket.updated_at, Ticket.id)
+Index("ix_tickets_priority_updated_at_id", Ticket.priority, Ticket.updated_at, Ticket.id)
 Index("ix_messages_ticket_id", Message.ticket_id)
-Index("ix_kb_documents_status", KbDocument.status)
\ No newline at end of file
+
+# one row per Message-ID: re-deliveries are detected on ingest, replies find their ticket.
+# A unique index on a partitioned table must contain created_at, so uniqueness is kept by
+# ingest and archive restore under a per-Message-ID advisory lock (app.services.tickets.lock_message_ids)
+Index("ix_messages_message_id_header", Message.message_id_header)
+Index("ix_messages_ref_ids", Message.ref_ids, postgresql_using="gin")
+
+# ticket search: trigram indexes serve ILIKE '%q%', GIN over message text serves FTS
+# (pg_trgm is created by alembic revision 0001_pg_trgm)
+Index("ix_tickets_subject_trgm", Ticket.subject, postgresql_using="gin", postgresql_ops={"subject": "gin_trgm_ops"})
+Index(
+    "ix_tickets_customer_email_trgm", Ticket.customer_email,
+    postgresql_using="gin", postgresql_ops={"customer_email": "gin_trgm_ops"},
+)
+Index("ix_messages_search_tsv", Message.search_tsv, postgresql_using="gin")
+Index("ix_attachments_message_id", Attachment.message_id)
+Index("ix_kb_documents_status", KbDocument.status)
+Index("ix_kb_documents_search_tsv", KbDocument.search_tsv, postgresql_using="gin")
+Index("ux_kb_documents_external_id", KbDocument.external_id, unique=True)  # upsert key of /kb/documents/bulk
+Index("ix_kb_passages_document_id", KbPassage.document_id)
+Index("ix_kb_passages_search_tsv", KbPassage.search_tsv, postgresql_using="gin")
+Index("ix_similar_buckets_ticket_id", SimilarBucket.ticket_id)  # re-indexing deletes by ticket
+Index(
+    "ix_outbox_pending",
+    OutboxEmail.next_attempt_at,
+    postgresql_where=OutboxEmail.status == DeliveryStatus.pending,
+)
+Index(
+    "ix_enrichment_jobs_pending",
+    EnrichmentJob.run_after,
+    postgresql_where=EnrichmentJob.status == JobStatus.pending,
+)
+
+# rows outside every monthly partition (none created yet, or kept back from the archive) land here
+for _table in (Message.__table__, AiRun.__table__):
+    event.listen(
+        _table, "after_create",
+        DDL(f"CREATE TABLE IF NOT EXISTS {_table.name}_default PARTITION OF {_table.name} DEFAULT").execute_if(dialect="postgresql"),
+    )
@@ -1,7 +1,126 @@
-from sqlalchemy import create_engine
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, TypeVar
+import anyio
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.util.concurrency import await_only, in_greenlet
 from app.core.config import settings
+from app.core.metrics import DB_POOL, DB_POOL_WAIT, DB_STATEMENT
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
 
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
\ No newline at end of file
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (db_pool_wait_seconds)."""
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(self.metrics_label, value=time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    metrics_label = "async"
+    _do_get = TimedQueuePool._do_get
+
+
+def _pool_args() -> dict:
+    return {
+        "pool_pre_ping": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
+def _watch_pool(label: str, pool) -> None:
+    DB_POOL.set_function(label, "size", fn=pool.size)
+    DB_POOL.set_function(label, "checked_out", fn=pool.checkedout)
+    DB_POOL.set_function(label, "checked_in", fn=pool.checkedin)
+    DB_POOL.set_function(label, "overflow", fn=lambda: max(pool.overflow(), 0))
+
+
+engine = create_engine(settings.DATABASE_URL, poolclass=TimedQueuePool, **_pool_args())
+_watch_pool("sync", engine.pool)
+
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+# DB_ASYNC: same URL, psycopg's async mode (postgresql+psycopg works for both).
+# expire_on_commit=False: returned objects are serialized after the session is gone,
+# and a lazy refresh outside the event loop's greenlet is an error.
+async_engine = (
+    create_async_engine(settings.DATABASE_URL, poolclass=TimedAsyncQueuePool, **_pool_args())
+    if settings.DB_ASYNC else None
+)
+if async_engine is not None:
+    _watch_pool("async", async_engine.pool)
+
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+)
+
+T = TypeVar("T")
+
+
+def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    fn(*args, **kwargs) for the CPU / file work inside service functions. Under AsyncSession.run_sync
+    (app.api.deps.run_db with DB_ASYNC) services run on the event loop thread: there fn goes to a
+    worker thread and the greenlet waits for it as it waits for the driver, so only SQL stays on
+    the loop. Elsewhere a plain call. fn must not touch the session.
+    """
+    if in_greenlet():
+        return await_only(anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs)))
+    return fn(*args, **kwargs)
+
+
+class StatementCount:
+    def __init__(self):
+        self.n = 0
+
+
+_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "EXPLAIN"}
+
+_statement_count: ContextVar[StatementCount | None] = ContextVar("statement_count", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+    counter = _statement_count.get()
+    if counter is not None:
+        counter.n += 1
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_start")
+    if not started:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    label = "async" if conn.dialect.is_async else "sync"
+    DB_STATEMENT.observe(label, verb if verb in _VERBS else "OTHER", value=time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_statement_start(ctx):
+    if ctx.connection is not None and ctx.connection.info.get("query_start"):
+        ctx.connection.info["query_start"].pop()
+
+
+@contextmanager
+def count_statements() -> Iterator[StatementCount]:
+    """Counts SQL statements sent to the database by the current thread/task inside the block."""
+    counter = StatementCount()
+    token = _statement_count.set(counter)
+    try:
+        yield counter
+    finally:
+        _statement_count.reset(token)
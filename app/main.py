@@ -1,11 +1,13 @@
 from fastapi import FastAPI
 from app.core.config import settings
 from app.core.logging import setup_logging
+from app.core.metrics import MetricsMiddleware
 from app.api.routes import all_routers
 
 setup_logging()
 
 app = FastAPI(title=settings.APP_NAME)
+app.add_middleware(MetricsMiddleware)
 
 for r in all_routers:
     app.include_router(r)
\ No newline at end of file
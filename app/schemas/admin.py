@@ -0,0 +1,28 @@
+from datetime import datetime
+from pydantic import BaseModel
+
+class ReprocessRequest(BaseModel):
+    model_version: str
+    update_tickets: bool = False  # overwrite ticket ai_* only when the new confidence is higher
+    with_kb: bool = False
+
+    class Config:
+        protected_namespaces = ()
+
+class ReprocessRunOut(BaseModel):
+    id: int
+    model_version: str
+    status: str
+    update_tickets: bool
+    with_kb: bool
+    last_ticket_id: int
+    processed: int
+    updated_tickets: int
+    total: int
+    error: str
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+        protected_namespaces = ()
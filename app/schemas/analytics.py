@@ -0,0 +1,20 @@
+from datetime import date
+from pydantic import BaseModel, Field
+
+class AnalyticsBucket(BaseModel):
+    tickets: int
+    by_status: dict[str, int] = Field(default_factory=dict)
+    by_category: dict[str, int] = Field(default_factory=dict)
+    by_priority: dict[str, int] = Field(default_factory=dict)
+    avg_ai_confidence: float | None = None          # over enriched tickets
+    responded: int = 0                              # tickets with an outbound reply
+    avg_first_response_seconds: float | None = None
+
+class AnalyticsDay(AnalyticsBucket):
+    day: date  # UTC day the tickets were created
+
+class AnalyticsResponse(BaseModel):
+    date_from: date
+    date_to: date
+    total: AnalyticsBucket
+    days: list[AnalyticsDay]
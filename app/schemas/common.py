@@ -2,9 +2,10 @@ from pydantic import BaseModel, Field
 
 class Page(BaseModel):
     items: list
-    total: int
+    total: int | None = None  # only when requested (total=estimate|exact)
     limit: int
-    offset: int
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
 
 class Ok(BaseModel):
     ok: bool = True
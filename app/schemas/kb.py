@@ -8,8 +8,12 @@ class KbDocumentCreate(BaseModel):
     language: str = "ru"
     status: str = "active"
 
+class KbDocumentImport(KbDocumentCreate):
+    external_id: str = Field(min_length=1, max_length=256)  # upsert key
+
 class KbDocumentOut(BaseModel):
     id: int
+    external_id: str | None = None
     title: str
     body: str
     tags: list[str]
@@ -25,7 +29,48 @@ class KbSearchHit(BaseModel):
     title: str
     rank: float
     snippet: str
+    passage_id: int | None = None  # the passage the snippet comes from
+    heading: str | None = None
 
 class KbSearchResponse(BaseModel):
     query: str
-    hits: list[KbSearchHit]
\ No newline at end of file
+    hits: list[KbSearchHit]
+
+class KbExplainStage(BaseModel):
+    stage: str                     # rank / rank_fallback / lead_passages / snippets
+    query: str                     # websearch_to_tsquery input of this statement
+    planning_ms: float | None = None
+    execution_ms: float | None = None
+    rows: int | None = None
+    plan: dict                     # EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan tree
+
+class KbSearchExplain(BaseModel):
+    query: str
+    strict: str
+    fallback: str | None = None
+    hits: list[KbSearchHit]
+    stages: list[KbExplainStage]
+
+class KbCacheStats(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    size: int | None = None
+    maxsize: int | None = None
+    kb_version: int
+
+class KbImportItem(BaseModel):
+    index: int                     # 0-based position in the request body
+    external_id: str | None = None
+    id: int | None = None
+    action: str | None = None      # created / updated / unchanged; None on error
+    error: str | None = None
+
+class KbImportResponse(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+    failed: int
+    seconds: float
+    docs_per_second: float | None = None
+    items: list[KbImportItem]
@@ -1,14 +1,26 @@
 from datetime import datetime
 from pydantic import BaseModel, Field
-from app.db.models import TicketStatus, MessageDirection
+from app.schemas.common import Page, Ok
+from app.db.models import TicketStatus, MessageDirection, JobStatus
 
 class TicketCreateInbound(BaseModel):
     subject: str = ""
     customer_email: str
     from_email: str
     to_email: str
-    cleaned_text: str = ""
+    cleaned_text: str = ""        # cleaned again on ingest: quotes, signature, disclaimers, size cap
     raw_headers: dict = Field(default_factory=dict)
+    keep_raw: bool | None = None  # also store the text as sent (default: KEEP_RAW_TEXT)
+
+class BatchIngestItem(BaseModel):
+    index: int            # 0-based position of the record in the NDJSON body
+    id: int | None = None
+    error: str | None = None
+
+class BatchIngestResponse(BaseModel):
+    created: int
+    failed: int
+    items: list[BatchIngestItem]
 
 class TicketOut(BaseModel):
     id: int
@@ -22,12 +34,27 @@ class TicketOut(BaseModel):
     ai_summary: str
     ai_suggested_actions: dict
     ai_draft_reply: str
+    enrichment_status: JobStatus
     created_at: datetime
     updated_at: datetime
+    first_response_at: datetime | None = None
 
     class Config:
         from_attributes = True
 
+class TicketPage(Page):
+    items: list[TicketOut]
+
+class TicketSearchHit(BaseModel):
+    ticket: TicketOut
+    rank: float
+    message_id: int | None = None  # best matching message, if the match came from message text
+    highlight: str = ""
+
+class TicketSearchResponse(BaseModel):
+    query: str
+    hits: list[TicketSearchHit]
+
 class MessageOut(BaseModel):
     id: int
     ticket_id: int
@@ -38,6 +65,7 @@ class MessageOut(BaseModel):
     cleaned_text: str
     raw_headers: dict
     created_at: datetime
+    raw_text: str | None = None  # only with message_fields=...,raw_text
 
     class Config:
         from_attributes = True
@@ -45,6 +73,23 @@ class MessageOut(BaseModel):
 class TicketDetailOut(BaseModel):
     ticket: TicketOut
     messages: list[MessageOut]
+    next_cursor: str | None = None  # next page of messages
+
+class SimilarReply(BaseModel):
+    message_id: int
+    subject: str
+    text: str
+    created_at: datetime
+
+class SimilarTicketHit(BaseModel):
+    ticket_id: int
+    subject: str
+    similarity: float  # estimated Jaccard of the texts
+    reply: SimilarReply | None = None  # last sent answer of that ticket
+
+class SimilarTicketsResponse(BaseModel):
+    ticket_id: int
+    hits: list[SimilarTicketHit]
 
 class TicketUpdate(BaseModel):
     status: TicketStatus | None = None
@@ -63,4 +108,10 @@ class RequestInfoRequest(BaseModel):
     subject: str | None = None
 
 class EscalateRequest(BaseModel):
-    note: str = ""
\ No newline at end of file
+    note: str = ""
+
+class TicketActionOut(Ok):
+    ticket_id: int
+    status: TicketStatus
+    message_id: int | None = None  # outbound message queued by the action
+    statements: int                # SQL statements the action ran
\ No newline at end of file
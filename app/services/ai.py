@@ -6,37 +6,21 @@ MVP AI service: заглушка.
 
 import re
 from typing import Any
+from app.services.rules import RuleEngine, get_engine
 
-def analyze_message(subject: str, text: str) -> dict[str, Any]:
+def analyze_message(subject: str, text: str, engine: RuleEngine | None = None) -> dict[str, Any]:
+    engine = engine or get_engine()
     low = (subject + "\n" + text).lower()
 
-    # category (very naive)
-    if "оплат" in low or "платеж" in low or "billing" in low:
-        category = "billing"
-    elif "не могу войти" in low or "login" in low or "парол" in low:
-        category = "login"
-    elif "ошибк" in low or "error" in low or "exception" in low:
-        category = "bug"
-    else:
-        category = "general"
-
-    # priority
-    priority = "medium"
-    if any(x in low for x in ["срочно", "urgent", "не работает", "down", "прод", "production"]):
-        priority = "high"
-    if any(x in low for x in ["вопрос", "как сделать", "how to"]):
-        priority = "low"
+    # category / priority / os: one scan over the text with the compiled rule set
+    matched = engine.match(low)
+    category = matched.get("category", "general")
+    priority = matched.get("priority", "medium")
+    os_hint = matched.get("os", "")
 
     # entities
     error_codes = re.findall(r"\b(?:0x[0-9a-fA-F]+|E\d{3,6}|\d{3,5})\b", text)
     version = re.findall(r"\bv?\d+\.\d+(?:\.\d+)?\b", text)
-    os_hint = ""
-    if "windows" in low:
-        os_hint = "Windows"
-    elif "mac" in low or "os x" in low:
-        os_hint = "macOS"
-    elif "linux" in low:
-        os_hint = "Linux"
 
     summary = text.strip().split("\n")[0][:220]
     if not summary:
@@ -78,5 +62,10 @@ def analyze_message(subject: str, text: str) -> dict[str, Any]:
         "draft_reply": draft,
         "suggested_actions": suggested_actions,
         "confidence": confidence,
-        "model_versions": {"mvp": "heuristics-v1"},
-    }
\ No newline at end of file
+        "model_versions": {"mvp": "heuristics-v1", "rules": engine.version},
+    }
+
+def analyze_many(items: list[tuple[str, str]], engine: RuleEngine | None = None) -> list[dict[str, Any]]:
+    """Batch API: (subject, text) pairs analyzed with one engine snapshot."""
+    engine = engine or get_engine()
+    return [analyze_message(subject, text, engine) for subject, text in items]
\ No newline at end of file
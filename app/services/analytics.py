@@ -0,0 +1,246 @@
+"""
+Analytics rollups: tickets per day by status / category / priority, average ai_confidence
+and time to first response, served by GET /analytics without scanning tickets or messages.
+
+Write paths call mark_dirty(db, ticket_ids). When that session commits, the ids go into
+the analytics_dirty queue with a single INSERT ... ON CONFLICT DO NOTHING in the same
+transaction: it locks nothing but the tickets' own queue rows, and savepoint rollbacks need
+no bookkeeping. The rollups themselves are refreshed outside the request transactions by
+app.workers.analytics_refresh (refresh_pending): the queued tickets are re-read once and
+compared with analytics_ticket_state (what each ticket is currently counted as); only the
+difference goes into analytics_daily / analytics_daily_totals as upserts, the shared per-day
+rows locked in one key order. /analytics lags the writes by ANALYTICS_REFRESH_INTERVAL or so.
+
+rebuild_rollups() recomputes all three tables from tickets in one pass.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Iterable
+from sqlalchemy import Date, String, Float, event, select, delete, func, case, cast, literal, union_all, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.db.models import Ticket, JobStatus, AnalyticsTicketState, AnalyticsDaily, AnalyticsDailyTotals, AnalyticsDirty
+
+DIMENSIONS = ("status", "category", "priority")
+TOTALS = ("tickets", "confidence_sum", "confidence_n", "responded", "response_seconds_sum")
+_DIRTY = "analytics_dirty"
+
+
+def mark_dirty(db: Session, ticket_ids: Iterable[int]) -> None:
+    """Queues tickets for a rollup refresh when `db` commits."""
+    db.info.setdefault(_DIRTY, set()).update(ticket_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _queue_on_commit(db: Session) -> None:
+    ids = db.info.pop(_DIRTY, None)
+    if ids:
+        db.execute(insert(AnalyticsDirty).values([{"ticket_id": i} for i in sorted(ids)]).on_conflict_do_nothing())
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(db: Session) -> None:
+    db.info.pop(_DIRTY, None)
+
+
+def _utc_day(ts: datetime) -> date:
+    return (ts.astimezone(timezone.utc) if ts.tzinfo else ts).date()
+
+
+def _state(row) -> dict:
+    return {
+        "ticket_id": row.id,
+        "day": _utc_day(row.created_at),
+        "status": row.status.value,
+        "category": row.category or "",
+        "priority": row.priority or "",
+        "confidence": int(row.ai_confidence) if row.enrichment_status == JobStatus.done else None,
+        "response_seconds": (row.first_response_at - row.created_at).total_seconds() if row.first_response_at else None,
+    }
+
+
+def _add(counts: Counter, totals: dict[date, dict], state: dict, sign: int) -> None:
+    day = state["day"]
+    for dim in DIMENSIONS:
+        counts[(day, dim, state[dim])] += sign
+    t = totals.setdefault(day, dict.fromkeys(TOTALS, 0))
+    t["tickets"] += sign
+    if state["confidence"] is not None:
+        t["confidence_sum"] += sign * state["confidence"]
+        t["confidence_n"] += sign
+    if state["response_seconds"] is not None:
+        t["responded"] += sign
+        t["response_seconds_sum"] += sign * state["response_seconds"]
+
+
+def refresh_rollups(db: Session, ticket_ids: Iterable[int]) -> int:
+    """Applies the tickets' changes since their last refresh. Returns number of changed tickets."""
+    ids = sorted(set(ticket_ids))
+    if not ids:
+        return 0
+    old = {
+        s["ticket_id"]: dict(s)
+        for s in db.execute(
+            select(*AnalyticsTicketState.__table__.c)
+            .where(AnalyticsTicketState.ticket_id.in_(ids))
+            .order_by(AnalyticsTicketState.ticket_id)
+            .with_for_update()
+        ).mappings()
+    }
+    # read after the lock: a concurrent refresh of the same tickets has committed by now
+    rows = db.execute(
+        select(Ticket.id, Ticket.created_at, Ticket.status, Ticket.category, Ticket.priority,
+               Ticket.ai_confidence, Ticket.enrichment_status, Ticket.first_response_at)
+        .where(Ticket.id.in_(ids))
+    ).all()
+    new = {r.id: _state(r) for r in rows}
+    changed = [tid for tid in ids if new.get(tid) != old.get(tid)]
+    if not changed:
+        return 0
+
+    counts: Counter = Counter()
+    totals: dict[date, dict] = {}
+    for tid in changed:
+        if tid in old:
+            _add(counts, totals, old[tid], -1)
+        if tid in new:
+            _add(counts, totals, new[tid], 1)
+
+    # sorted keys: concurrent commits lock the shared rows in the same order
+    daily = [{"day": d, "dimension": dim, "value": v, "tickets": n} for (d, dim, v), n in sorted(counts.items()) if n]
+    if daily:
+        stmt = insert(AnalyticsDaily)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["day", "dimension", "value"],
+                set_={"tickets": AnalyticsDaily.tickets + stmt.excluded.tickets},
+            ),
+            daily,
+        )
+    day_totals = [{"day": d, **t} for d, t in sorted(totals.items()) if any(t.values())]
+    if day_totals:
+        stmt = insert(AnalyticsDailyTotals)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["day"],
+                set_={c: getattr(AnalyticsDailyTotals, c) + stmt.excluded[c] for c in TOTALS},
+            ),
+            day_totals,
+        )
+
+    states = [new[tid] for tid in changed if tid in new]
+    if states:
+        stmt = insert(AnalyticsTicketState)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["ticket_id"],
+                set_={c: stmt.excluded[c] for c in states[0] if c != "ticket_id"},
+            ),
+            states,
+        )
+    gone = [tid for tid in changed if tid not in new]
+    if gone:
+        db.execute(delete(AnalyticsTicketState).where(AnalyticsTicketState.ticket_id.in_(gone)))
+    return len(changed)
+
+
+def refresh_pending(db: Session, limit: int) -> int:
+    """Takes up to `limit` queued tickets (SKIP LOCKED), refreshes their rollups; commits. Returns number taken."""
+    picked = (
+        select(AnalyticsDirty.ticket_id).order_by(AnalyticsDirty.ticket_id).limit(limit).with_for_update(skip_locked=True)
+    )
+    # a ticket queued again meanwhile waits for this commit and stays queued for the next round
+    ids = db.scalars(
+        delete(AnalyticsDirty).where(AnalyticsDirty.ticket_id.in_(picked.scalar_subquery())).returning(AnalyticsDirty.ticket_id)
+    ).all()
+    if ids:
+        refresh_rollups(db, ids)
+    db.commit()
+    return len(ids)
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Recomputes the rollups from tickets in one pass; blocks refreshes until committed. Returns number of tickets."""
+    db.execute(text(
+        "LOCK TABLE analytics_ticket_state, analytics_daily, analytics_daily_totals IN EXCLUSIVE MODE"
+    ))
+    for model in (AnalyticsDaily, AnalyticsDailyTotals, AnalyticsTicketState):
+        db.execute(delete(model))
+
+    enriched = Ticket.enrichment_status == JobStatus.done
+    db.execute(insert(AnalyticsTicketState).from_select(
+        ["ticket_id", "day", "status", "category", "priority", "confidence", "response_seconds"],
+        select(
+            Ticket.id,
+            cast(func.timezone("UTC", Ticket.created_at), Date),
+            cast(Ticket.status, String),
+            func.coalesce(Ticket.category, ""),
+            func.coalesce(Ticket.priority, ""),
+            case((enriched, Ticket.ai_confidence)),
+            cast(func.extract("epoch", Ticket.first_response_at - Ticket.created_at), Float),
+        ),
+    ))
+
+    s = AnalyticsTicketState
+    per_dimension = union_all(*(
+        select(s.day, literal(dim).label("dimension"), getattr(s, dim).label("value")) for dim in DIMENSIONS
+    )).subquery()
+    db.execute(insert(AnalyticsDaily).from_select(
+        ["day", "dimension", "value", "tickets"],
+        select(per_dimension.c.day, per_dimension.c.dimension, per_dimension.c.value, func.count())
+        .group_by(per_dimension.c.day, per_dimension.c.dimension, per_dimension.c.value),
+    ))
+    db.execute(insert(AnalyticsDailyTotals).from_select(
+        list(("day", *TOTALS)),
+        select(
+            s.day,
+            func.count(),
+            func.coalesce(func.sum(s.confidence), 0),
+            func.count(s.confidence),
+            func.count(s.response_seconds),
+            func.coalesce(func.sum(s.response_seconds), 0.0),
+        ).group_by(s.day),
+    ))
+    total = db.scalar(select(func.count()).select_from(s))
+    db.commit()
+    return total
+
+
+def _bucket(t: dict | None) -> dict:
+    t = t or dict.fromkeys(TOTALS, 0)
+    return {
+        "tickets": int(t["tickets"]),
+        "by_status": {},
+        "by_category": {},
+        "by_priority": {},
+        "avg_ai_confidence": round(t["confidence_sum"] / t["confidence_n"], 2) if t["confidence_n"] else None,
+        "responded": int(t["responded"]),
+        "avg_first_response_seconds": round(t["response_seconds_sum"] / t["responded"], 1) if t["responded"] else None,
+    }
+
+
+def get_analytics(db: Session, date_from: date, date_to: date) -> dict:
+    """Per-day buckets and their sum for [date_from, date_to]: two range reads of the rollups."""
+    totals = {
+        r.day: dict(r._mapping)
+        for r in db.execute(
+            select(AnalyticsDailyTotals.day, *(getattr(AnalyticsDailyTotals, c) for c in TOTALS))
+            .where(AnalyticsDailyTotals.day.between(date_from, date_to), AnalyticsDailyTotals.tickets != 0)
+            .order_by(AnalyticsDailyTotals.day)
+        )
+    }
+    days = {d: {"day": d, **_bucket(t)} for d, t in totals.items()}
+    overall = {c: sum(t[c] for t in totals.values()) for c in TOTALS}
+    summary = _bucket(overall)
+
+    rows = db.execute(
+        select(AnalyticsDaily.day, AnalyticsDaily.dimension, AnalyticsDaily.value, AnalyticsDaily.tickets)
+        .where(AnalyticsDaily.day.between(date_from, date_to), AnalyticsDaily.tickets != 0)
+    )
+    for day, dim, value, n in rows:
+        key = f"by_{dim}"
+        if day in days:
+            days[day][key][value] = int(n)
+        summary[key][value] = summary[key].get(value, 0) + int(n)
+    return {"date_from": date_from, "date_to": date_to, "total": summary, "days": list(days.values())}
@@ -0,0 +1,269 @@
+"""
+Archival of old months of messages / ai_runs into gzip NDJSON files, and restore on demand.
+
+archive_month() takes the tickets with rows in that month which are solved and have not
+been touched since the cutoff (ARCHIVE_AFTER_MONTHS ago), writes their messages, ai_runs and
+attachments rows of the month to ARCHIVE_DIR/YYYY_MM/<batch>/<table>.ndjson.gz (fsynced,
+published by renaming the batch directory), then detaches and drops the month's partitions.
+Rows of the other tickets go back into the parent table and so into <table>_default, where
+a later run archives them once their ticket qualifies. Dropping a partition leaves nothing
+to vacuum and no index entries to clean up, so the hot tables stay the size of the last
+months plus the open tickets, however much history there is.
+
+restore_month() reads every batch of a month back, all of it or some tickets only; inserts
+are ON CONFLICT DO NOTHING, so restoring twice (or a month archived twice) is harmless.
+Restored rows are archived again by the next run unless their ticket was reopened.
+"""
+
+import enum
+import gzip
+import json
+import logging
+import os
+import shutil
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Iterable, Iterator
+from sqlalchemy import DateTime, Table, select, text as sql_text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import Attachment, Message, TicketStatus
+from app.services.tickets import lock_message_ids
+from app.services.partitions import (
+    PARTITIONED, add_months, copy_columns, create_partition, ensure_partitions, list_partitions, month_bounds, partition_name,
+)
+
+log = logging.getLogger("archive")
+
+ARCHIVED_TABLES: tuple[Table, ...] = (*PARTITIONED, Attachment.__table__)  # restore order: messages before attachments
+FETCH_ROWS = 2000
+RESTORE_CHUNK = 1000
+_MONTH_ROWS = "created_at >= :lo AND created_at < :hi"
+_ARCHIVED = "ticket_id IN (SELECT id FROM archive_tickets)"
+
+
+def _json_default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, enum.Enum):
+        return o.value
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _fsync(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def month_dir(month: date) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, f"{month:%Y_%m}")
+
+
+def list_batches(month: date) -> list[str]:
+    """Published batch directories of the month, oldest first."""
+    root = month_dir(month)
+    if not os.path.isdir(root):
+        return []
+    return [
+        os.path.join(root, name) for name in sorted(os.listdir(root))
+        if os.path.isfile(os.path.join(root, name, "manifest.json"))
+    ]
+
+
+def _write_batch(db: Session, month: date, queries: dict[str, str], params: dict) -> dict[str, int]:
+    """Streams each query into <name>.ndjson.gz of a new batch directory. Returns rows per file."""
+    batch = os.path.join(month_dir(month), datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f"))
+    tmp = batch + ".tmp"
+    os.makedirs(tmp)
+    try:
+        counts = {}
+        for name, sql in queries.items():
+            path = os.path.join(tmp, f"{name}.ndjson.gz")
+            result = db.execute(sql_text(sql), params, execution_options={"stream_results": True, "yield_per": FETCH_ROWS})
+            n = 0
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                for row in result.mappings():
+                    f.write(json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n")
+                    n += 1
+            _fsync(path)
+            counts[name] = n
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"month": f"{month:%Y-%m}", "cutoff": params["cutoff"].isoformat(), "rows": counts}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, batch)
+        _fsync(month_dir(month))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return counts
+
+
+def archive_month(db: Session, month: date, cutoff: datetime) -> dict[str, int]:
+    """
+    Archives the month's rows of solved tickets idle since `cutoff` and drops the month's
+    partitions; commits. Returns rows written per table ({} if nothing qualified).
+    """
+    lo, hi = month_bounds(month)
+    params = {"lo": lo, "hi": hi, "cutoff": cutoff}
+    # one fixed set of tickets for export, delete and keep-back alike, whatever changes meanwhile
+    db.execute(sql_text("CREATE TEMP TABLE archive_tickets (id integer PRIMARY KEY) ON COMMIT DROP"))
+    n = db.execute(
+        sql_text(
+            "INSERT INTO archive_tickets SELECT t.id FROM tickets t "
+            f"WHERE t.status = '{TicketStatus.solved.name}' AND t.updated_at < :cutoff AND t.id IN ("
+            + " UNION ".join(f"SELECT ticket_id FROM {table.name} WHERE {_MONTH_ROWS}" for table in PARTITIONED)
+            + ")"
+        ),
+        params,
+    ).rowcount
+    if not n:
+        db.rollback()
+        return {}
+
+    # the range predicate reads just the month's partition (or the default one)
+    archived_messages = f"SELECT id FROM messages WHERE {_MONTH_ROWS} AND {_ARCHIVED}"
+    attachment_cols = ", ".join(copy_columns(Attachment.__table__))
+    queries = {
+        table.name: f"SELECT {', '.join(copy_columns(table))} FROM {table.name} WHERE {_MONTH_ROWS} AND {_ARCHIVED}"
+        for table in PARTITIONED
+    }
+    queries["attachments"] = f"SELECT {attachment_cols} FROM attachments WHERE message_id IN ({archived_messages})"
+    counts = _write_batch(db, month, queries, params)
+
+    db.execute(sql_text(f"DELETE FROM attachments WHERE message_id IN ({archived_messages})"), params)
+    for table in PARTITIONED:
+        if month in list_partitions(db, table.name):
+            name = partition_name(table.name, month)
+            cols = ", ".join(copy_columns(table))
+            db.execute(sql_text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+            # no partition covers the month any more: the parent routes these into <table>_default
+            db.execute(sql_text(f"INSERT INTO {table.name} ({cols}) SELECT {cols} FROM {name} WHERE NOT {_ARCHIVED}"))
+            db.execute(sql_text(f"DROP TABLE {name}"))
+        # kept back by an earlier run, archivable now
+        db.execute(sql_text(f"DELETE FROM {table.name}_default WHERE {_MONTH_ROWS} AND {_ARCHIVED}"), params)
+    db.commit()
+    log.info("archived %s: %s tickets, %s", f"{month:%Y-%m}", n, counts)
+    return counts
+
+
+def archivable_months(db: Session, cutoff: datetime) -> list[date]:
+    """Months before `cutoff` that still have a partition or rows in a default partition."""
+    months = {m for table in PARTITIONED for m in list_partitions(db, table.name) if month_bounds(m)[1] <= cutoff}
+    for table in PARTITIONED:
+        months.update(db.scalars(sql_text(
+            f"SELECT DISTINCT CAST(date_trunc('month', created_at AT TIME ZONE 'UTC') AS date) "
+            f"FROM {table.name}_default WHERE created_at < :cutoff"
+        ), {"cutoff": cutoff}))
+    return sorted(months)
+
+
+def run_archival(db: Session, after_months: int | None = None, today: date | None = None) -> dict[str, dict[str, int]]:
+    """Creates upcoming partitions, then archives every month older than ARCHIVE_AFTER_MONTHS. Returns counts per month."""
+    after_months = settings.ARCHIVE_AFTER_MONTHS if after_months is None else after_months
+    ensure_partitions(db, today=today)
+    first = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    cutoff = month_bounds(add_months(first, -after_months))[0]
+    done = {}
+    for month in archivable_months(db, cutoff):
+        counts = archive_month(db, month, cutoff)
+        if counts:
+            done[f"{month:%Y-%m}"] = counts
+    return done
+
+
+def _read_rows(path: str, table: Table) -> Iterator[dict]:
+    dates = [c.name for c in table.c if isinstance(c.type, DateTime)]
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            for name in dates:
+                if row.get(name) is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            yield row
+
+
+def _unique_message_ids(db: Session, rows: list[dict]) -> None:
+    """
+    Under the ingest locks (lock_message_ids): a Message-ID stored again since the month was
+    archived (a re-delivery finds nothing to match) stays with that copy; the restored row
+    comes back without it, as 0003_workers_kb_analytics does with the duplicates of old data.
+    """
+    headers = [r["message_id_header"] for r in rows if r.get("message_id_header")]
+    if not headers:
+        return
+    lock_message_ids(db, headers)
+    taken = dict(db.execute(
+        select(Message.message_id_header, Message.id).where(Message.message_id_header.in_(headers))
+    ).all())
+    for r in rows:
+        if taken.get(r.get("message_id_header"), r["id"]) != r["id"]:
+            r["message_id_header"] = None
+
+
+def _insert(db: Session, table: Table, rows: Iterable[dict]) -> int:
+    """Inserts in chunks, committing each one (which also releases its Message-ID locks)."""
+    stmt = pg_insert(table).on_conflict_do_nothing()
+    n = 0
+    for chunk in _chunks(rows, RESTORE_CHUNK):
+        if table is Message.__table__:
+            _unique_message_ids(db, chunk)
+        db.execute(stmt, chunk)
+        db.commit()
+        n += len(chunk)
+    return n
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    chunk: list[dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _collect_ids(rows: Iterable[dict], ids: set[int]) -> Iterator[dict]:
+    for row in rows:
+        ids.add(row["id"])
+        yield row
+
+
+def restore_month(db: Session, month: date, ticket_ids: Iterable[int] | None = None) -> dict[str, int]:
+    """
+    Puts a month's archived rows back (into its partition, recreated if needed); only those
+    of `ticket_ids` if given. Commits per chunk. Returns rows read per table, duplicates included.
+    """
+    batches = list_batches(month)
+    if not batches:
+        raise ValueError(f"No archive for {month:%Y-%m}")
+    wanted = set(ticket_ids) if ticket_ids is not None else None
+    for table in PARTITIONED:
+        create_partition(db, table, month)
+
+    counts = dict.fromkeys((t.name for t in ARCHIVED_TABLES), 0)
+    for batch in batches:
+        message_ids: set[int] = set()
+        for table in ARCHIVED_TABLES:
+            path = os.path.join(batch, f"{table.name}.ndjson.gz")
+            if not os.path.exists(path):
+                continue
+            rows = _read_rows(path, table)
+            if wanted is not None:
+                if table is Attachment.__table__:
+                    rows = (r for r in rows if r["message_id"] in message_ids)
+                else:
+                    rows = (r for r in rows if r["ticket_id"] in wanted)
+                if table.name == "messages":
+                    rows = _collect_ids(rows, message_ids)
+            counts[table.name] += _insert(db, table, rows)
+    db.commit()
+    return counts
@@ -0,0 +1,95 @@
+"""
+Bounded query-result caches.
+
+MemoryCache — in-process LRU with TTL (default).
+RedisCache  — optional shared backend (needs the `redis` package), values are JSON.
+Both count hits/misses for /kb/cache and metrics.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+from app.core.config import settings
+
+_MISSING = object()
+
+
+class MemoryCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+class RedisCache:
+    def __init__(self, url: str, ttl: float, prefix: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the `redis` package") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()  # counters only; the client is thread-safe
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + json.dumps(key, ensure_ascii=False, default=str)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        raw = self.client.get(self._key(key))
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.client.set(self._key(key), json.dumps(value, ensure_ascii=False, default=str), ex=max(int(self.ttl), 1))
+
+    def clear(self) -> None:
+        for k in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(k)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def make_cache(prefix: str, maxsize: int, ttl: float):
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(settings.CACHE_REDIS_URL, ttl, prefix)
+    return MemoryCache(maxsize, ttl)
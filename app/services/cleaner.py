@@ -0,0 +1,173 @@
+"""
+Text cleaning before a message is stored, analyzed and indexed.
+
+HtmlToText converts HTML incrementally (feed() per decoded chunk, one pass; <blockquote>
+history comes out as "> " lines, like plain-text quoting). clean_text() then walks the lines once and
+keeps only what the customer wrote in this message: it stops at the quoted history
+("On ... wrote:", "-----Original Message-----", Outlook From:/Sent: blocks, "> " lines),
+at the signature ("-- ", or a sign-off followed only by signature-like lines: name, title,
+phone) and at legal disclaimers (a trailing block of confidentiality boilerplate), and caps
+the result at CLEAN_TEXT_LIMIT characters. Anything less certain is kept.
+"""
+
+import re
+from html.parser import HTMLParser
+from app.core.config import settings
+
+
+class HtmlToText(HTMLParser):
+    """Incremental: feed() decoded chunks as they arrive; <blockquote> content comes out as "> " lines."""
+
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "table"}
+    SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self, limit: int | None = None):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self.size = 0
+        self.limit = limit
+        self.skip = 0
+        self.quote_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip += 1
+        elif tag == "blockquote":
+            self.quote_depth += 1
+        if tag in self.BLOCK_TAGS:
+            self._newline()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+        elif tag == "blockquote":
+            self.quote_depth = max(self.quote_depth - 1, 0)
+        if tag in self.BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if not self.skip:
+            self._append(data.replace("\n", "\n" + "> " * self.quote_depth) if self.quote_depth else data)
+
+    def _newline(self) -> None:
+        self._append("\n" + "> " * self.quote_depth)
+
+    def _append(self, data: str) -> None:
+        if self.limit is not None and self.size >= self.limit:
+            return
+        self.parts.append(data)
+        self.size += len(data)
+
+    def text(self) -> str:
+        self.close()
+        # convert_charrefs=True: handle_data already got &amp; etc. decoded, once
+        text = "".join(self.parts)
+        text = re.sub(r"[ \t\xa0]+", " ", text)
+        return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def html_to_text(html: str) -> str:
+    parser = HtmlToText()
+    parser.feed(html)
+    return parser.text()
+
+
+# start of the quoted history: everything from here on is dropped
+_QUOTE_HEADER_RE = re.compile(
+    r"""^(?:
+        -{2,}\s*(?:original\s+message|forwarded\s+message|исходное\s+сообщение|пересылаемое\s+сообщение)\s*-{2,}
+      | on\s.{4,200}\swrote:
+      | .{0,200}\d.{0,200}\s(?:пишет|написал|написала|написал\(а\)):
+      | _{10,}
+    )\s*$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+# Outlook: "From: ..." directly followed by "Sent: / Date: ..."
+_OUTLOOK_FROM_RE = re.compile(r"^(?:from|от|отправитель):\s*\S", re.IGNORECASE)
+_OUTLOOK_SENT_RE = re.compile(r"^(?:sent|date|отправлено|дата):\s*\S", re.IGNORECASE)
+
+_SIGNATURE_RE = re.compile(r"^--\s*$")
+_SIGN_OFF_RE = re.compile(
+    r"^(?:best(?:\s+regards)?|kind\s+regards|regards|thanks(?:\s+in\s+advance)?|thank\s+you|cheers|sincerely"
+    r"|с\s+уважением|всего\s+(?:доброго|хорошего)|спасибо(?:\s+заранее)?|заранее\s+спасибо)[\s,.!]*$",
+    re.IGNORECASE,
+)
+SIGN_OFF_TAIL = 4  # at most this many lines (name, title, phone) may follow a sign-off
+SIGNATURE_LINE_CHARS = 60
+_CONTACT_RE = re.compile(r"(?:\+?\d[\d\s().-]{6,}\d|\S+@\S+\.\w+|https?://\S+|www\.\S+)")
+_DEVICE_RE = re.compile(r"^(?:sent\s+from\s+my\s|get\s+outlook\s+for\s|отправлено\s+(?:с|из)\s)", re.IGNORECASE)
+# first line of a disclaimer; it only counts if the block it starts runs to the end of the
+# message and every paragraph of it is legal boilerplate (_LEGAL_RE)
+_DISCLAIMER_RE = re.compile(
+    r"^(?:confidentiality\s+notice|disclaimer|this\s+(?:e-?mail|message)(?:\s+and\s+any\s+attachments?)?\s+(?:is|are|may\s+contain)"
+    r"|the\s+information\s+(?:contained\s+)?in\s+this\s+(?:e-?mail|message)"
+    r"|(?:настоящее|данное|это)\s+(?:электронное\s+)?(?:письмо|сообщение)(?:\s+и\s+(?:все\s+|любые\s+)?(?:вложения|приложения)(?:\s+к\s+нему)?)?\s+(?:является|содержит|может\s+содержать|предназначено)"
+    r"|информация,?\s+содержащаяся\s+в\s+(?:этом|данном|настоящем)\s+(?:письме|сообщении))",
+    re.IGNORECASE,
+)
+_LEGAL_RE = re.compile(
+    r"confidential|privileged|intended\s+(?:solely\s+|only\s+)?(?:for|recipient)|unauthori[sz]ed|notify\s+the\s+sender"
+    r"|конфиденциальн|адресат|предназначен\w*\s+(?:исключительно|только)|третьим\s+лицам|разглашени|уведомите\s+отправителя",
+    re.IGNORECASE,
+)
+_SEPARATOR_RE = re.compile(r"^(?:[-_=*]{3,})?$")  # blank line or a rule
+
+
+def _is_disclaimer(lines: list[str], i: int) -> bool:
+    if i == 0 or not _SEPARATOR_RE.match(lines[i - 1].strip()):
+        return False
+    paragraphs = re.split(r"\n\s*\n", "\n".join(lines[i:]).strip())
+    return all(_LEGAL_RE.search(p) for p in paragraphs if p.strip())
+
+
+def _is_signature_line(line: str) -> bool:
+    """Name, title, company, phone, address: short, no sentence punctuation, no question."""
+    if _CONTACT_RE.search(line):
+        return True
+    if len(line) > SIGNATURE_LINE_CHARS or len(line.split()) > 6 or "?" in line:
+        return False
+    # "Acme Inc." is fine, "Помогите." is a sentence
+    return not re.search(r"\w{5,}[.!:;]$", line)
+
+
+def _sign_off_cut(kept: list[str]) -> int | None:
+    """Index of the first sign-off line followed only by a short signature, if any."""
+    for i, line in enumerate(kept):
+        if i == 0 or not _SIGN_OFF_RE.match(line):
+            continue
+        tail = [t for t in kept[i + 1:] if t]
+        if len(tail) <= SIGN_OFF_TAIL and all(_is_signature_line(t) for t in tail):
+            return i
+    return None
+
+
+def clean_text(text: str, limit: int | None = None) -> str:
+    """The new part of a message, without quotes, signature and disclaimers; at most `limit` characters."""
+    limit = limit or settings.CLEAN_TEXT_LIMIT
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    kept: list[str] = []
+    for i, raw in enumerate(lines):
+        line = raw.strip()
+        if _QUOTE_HEADER_RE.match(line) or _SIGNATURE_RE.match(raw.rstrip("\n")):
+            break
+        if _DISCLAIMER_RE.match(line) and _is_disclaimer(lines, i):
+            while kept and _SEPARATOR_RE.match(kept[-1]):
+                kept.pop()  # the rule above the disclaimer
+            break
+        if _OUTLOOK_FROM_RE.match(line) and i + 1 < len(lines) and _OUTLOOK_SENT_RE.match(lines[i + 1].strip()):
+            break
+        if line.startswith(">") or _DEVICE_RE.match(line):
+            continue
+        kept.append(line)
+    cut = _sign_off_cut(kept)
+    if cut is not None:
+        kept = kept[:cut]
+
+    cleaned = re.sub(r"\n{3,}", "\n\n", "\n".join(kept)).strip()
+    if not cleaned:
+        # nothing but quotes / a signature: keep the original rather than an empty message
+        cleaned = text.strip()
+    if len(cleaned) > limit:
+        cut = cleaned.rfind(" ", 0, limit)
+        cleaned = cleaned[:cut if cut > limit // 2 else limit].rstrip()
+    return cleaned
@@ -1,12 +1,39 @@
+import logging
 import smtplib
+import time
+from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
+from email.utils import make_msgid
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, update
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from app.core.config import settings
+from app.core.metrics import stage
+from app.db.models import OutboxEmail, Message, DeliveryStatus
 
-def send_email(to_email: str, subject: str, body_text: str, in_reply_to: str | None = None, references: str | None = None) -> None:
+log = logging.getLogger("email")
+
+# connection-level problems: reconnect and retry; anything else is decided by the SMTP reply code
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class SmtpUnavailable(Exception):
+    """No usable session (connect, EHLO, STARTTLS or AUTH failed): says nothing about the message being sent."""
+
+def build_message(
+    to_email: str,
+    subject: str,
+    body_text: str,
+    in_reply_to: str | None = None,
+    references: str | None = None,
+    message_id: str | None = None,
+) -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = settings.SMTP_USER
     msg["To"] = to_email
     msg["Subject"] = subject
+    if message_id:
+        msg["Message-ID"] = message_id
 
     if in_reply_to:
         msg["In-Reply-To"] = in_reply_to
@@ -14,16 +41,201 @@ def send_email(to_email: str, subject: str, body_text: str, in_reply_to: str | N
         msg["References"] = references
 
     msg.set_content(body_text)
+    return msg
 
-    if settings.SMTP_USE_TLS:
-        server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT)
-        server.starttls()
-    else:
-        server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT)
-
+def open_smtp() -> smtplib.SMTP:
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
     try:
+        if settings.SMTP_USE_TLS:
+            server.starttls()
         if settings.SMTP_USER and settings.SMTP_PASSWORD:
             server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-        server.send_message(msg)
-    finally:
-        server.quit()
\ No newline at end of file
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def send_email(to_email: str, subject: str, body_text: str, in_reply_to: str | None = None, references: str | None = None) -> None:
+    """Direct one-off send (own connection). API handlers go through the outbox instead."""
+    msg = build_message(to_email, subject, body_text, in_reply_to, references)
+    with stage("smtp_send"):
+        server = open_smtp()
+        try:
+            server.send_message(msg)
+        finally:
+            server.quit()
+
+def new_message_id() -> str:
+    return make_msgid(domain=settings.SMTP_USER.rpartition("@")[2] or None)
+
+def enqueue_email(
+    db: Session,
+    to_email: str,
+    subject: str,
+    body_text: str,
+    in_reply_to: str | None = None,
+    references: str | None = None,
+    message: Message | None = None,
+) -> OutboxEmail:
+    """Adds an outbox row to the caller's transaction; the caller commits."""
+    item = OutboxEmail(
+        message_id=message.id if message is not None else None,
+        message_id_header=new_message_id(),
+        to_email=to_email,
+        subject=subject,
+        body_text=body_text,
+        in_reply_to=in_reply_to or "",
+        references=references or "",
+        status=DeliveryStatus.pending,
+    )
+    db.add(item)
+    if message is not None:
+        message.delivery_status = DeliveryStatus.pending
+        message.message_id_header = item.message_id_header
+        message.raw_headers = {**(message.raw_headers or {}), "Message-ID": item.message_id_header}
+    return item
+
+
+class SmtpConnection:
+    """One long-lived, authenticated SMTP connection reused for many messages."""
+
+    def __init__(self):
+        self.server: smtplib.SMTP | None = None
+        self.last_used = 0.0
+        self.failures = 0  # batches in a row released because the server was unavailable
+
+    def close(self) -> None:
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self.server is not None and time.monotonic() - self.last_used > settings.SMTP_NOOP_AFTER:
+            try:
+                if self.server.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.server = None
+        if self.server is None:
+            try:
+                self.server = open_smtp()
+            except (smtplib.SMTPException, OSError) as e:
+                raise SmtpUnavailable(f"{type(e).__name__}: {e}") from e
+        return self.server
+
+    @retry(
+        retry=retry_if_exception_type((*TRANSIENT_ERRORS, SmtpUnavailable)),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, max=10),
+        reraise=True,
+    )
+    def send(self, msg: EmailMessage) -> None:
+        server = self._ensure()
+        try:
+            server.send_message(msg)
+        except TRANSIENT_ERRORS:
+            self.server = None  # reconnect on the next attempt
+            raise
+        except smtplib.SMTPHeloError as e:
+            self.close()
+            raise SmtpUnavailable(f"{type(e).__name__}: {e}") from e
+        self.last_used = time.monotonic()
+
+
+def claim_outbox(db: Session, limit: int) -> list[OutboxEmail]:
+    """
+    Leases up to `limit` due rows: their next_attempt_at moves forward by OUTBOX_LEASE_SECONDS and the lease is committed.
+    Use a session with expire_on_commit=False, or every row is SELECTed again when delivered.
+    """
+    items = list(db.scalars(
+        select(OutboxEmail)
+        .where(OutboxEmail.status == DeliveryStatus.pending, OutboxEmail.next_attempt_at <= func.now())
+        .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all())
+    lease_until = datetime.now(timezone.utc) + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    for item in items:
+        item.attempts += 1
+        item.next_attempt_at = lease_until
+    db.commit()
+    return items
+
+def _set_message_status(db: Session, item: OutboxEmail, status: DeliveryStatus) -> None:
+    if item.message_id is not None:
+        db.execute(update(Message).where(Message.id == item.message_id).values(delivery_status=status))
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(30 * 2 ** attempts, 3600))
+
+def is_permanent(e: Exception) -> bool:
+    """A 5xx answer to the message's own MAIL FROM, RCPT TO or DATA."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return bool(e.recipients) and all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return e.smtp_code >= 500
+    return False
+
+def release_outbox(db: Session, items: list[OutboxEmail], error: str, failures: int) -> None:
+    """Hands leased rows back untried: the attempt is not counted, they are due again after a backoff. Commits."""
+    if not items:
+        return
+    db.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_([item.id for item in items]))
+        .values(
+            attempts=OutboxEmail.attempts - 1,
+            next_attempt_at=datetime.now(timezone.utc) + _retry_delay(failures),
+            last_error=error[:2000],
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+def deliver(db: Session, conn: SmtpConnection, item: OutboxEmail) -> bool:
+    """Sends one leased row and records the outcome; commits. Raises SmtpUnavailable untouched (see drain_outbox)."""
+    msg = build_message(
+        item.to_email, item.subject, item.body_text, item.in_reply_to, item.references, item.message_id_header or None,
+    )
+    try:
+        with stage("smtp_send"):
+            conn.send(msg)
+    except (smtplib.SMTPException, OSError) as e:
+        permanent = is_permanent(e)
+        item.last_error = f"{type(e).__name__}: {e}"[:2000]
+        if permanent or item.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            item.status = DeliveryStatus.failed
+            _set_message_status(db, item, DeliveryStatus.failed)
+        else:
+            item.next_attempt_at = datetime.now(timezone.utc) + _retry_delay(item.attempts)
+        db.commit()
+        log.warning("outbox %s to %s failed (attempt %s): %s", item.id, item.to_email, item.attempts, e)
+        return False
+
+    item.status = DeliveryStatus.sent
+    item.sent_at = datetime.now(timezone.utc)
+    item.last_error = ""
+    _set_message_status(db, item, DeliveryStatus.sent)
+    db.commit()
+    return True
+
+def drain_outbox(db: Session, conn: SmtpConnection, limit: int) -> int:
+    """
+    Claims and sends one batch. If the server cannot be reached or logged into, the row being
+    sent and the rest of the batch are released (release_outbox) and SmtpUnavailable is raised.
+    """
+    items = claim_outbox(db, limit)
+    for i, item in enumerate(items):
+        try:
+            deliver(db, conn, item)
+        except SmtpUnavailable as e:
+            conn.failures += 1
+            release_outbox(db, items[i:], f"{type(e).__name__}: {e}", conn.failures)
+            log.warning("SMTP unavailable, %s outbox rows released (failure %s): %s", len(items) - i, conn.failures, e)
+            raise
+        conn.failures = 0
+    return len(items)
@@ -0,0 +1,188 @@
+"""
+AI/KB enrichment of inbound tickets.
+
+Ingest only commits Ticket + Message and puts a row into enrichment_jobs;
+workers (app.workers.enrichment_worker) claim jobs with FOR UPDATE SKIP LOCKED
+and fill category/priority/summary/draft/kb_hits + AiRun.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from app.core.config import settings
+from app.core.metrics import stage
+from app.db.session import run_blocking
+from app.db.models import Ticket, Message, MessageDirection, TicketStatus, AiRun, EnrichmentJob, JobStatus
+from app.services.ai import analyze_message
+from app.services.kb import search_kb
+from app.services.rules import refresh_rules
+from app.services.similar import find_similar
+from app.services.analytics import mark_dirty
+
+
+def enqueue_enrichment(db: Session, ticket_id: int, message_id: int | None) -> EnrichmentJob:
+    job = EnrichmentJob(ticket_id=ticket_id, message_id=message_id, status=JobStatus.pending)
+    db.add(job)
+    return job
+
+
+# AiRun.outputs keys the enriched ticket row also holds: (column, key inside it)
+OUTPUT_REFS = {
+    "summary": ("ai_summary", None),
+    "draft_reply": ("ai_draft_reply", None),
+    "entities": ("ai_suggested_actions", "entities"),
+    "kb_hits": ("ai_suggested_actions", "kb_hits"),
+    "similar_tickets": ("ai_suggested_actions", "similar_tickets"),
+}
+
+
+def _ref_values(fields: dict) -> dict:
+    return {key: fields.get(col) if sub is None else (fields.get(col) or {}).get(sub) for key, (col, sub) in OUTPUT_REFS.items()}
+
+
+def _digest(values: dict) -> str:
+    return hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def outputs_by_ref(outputs: dict, ticket_fields: dict) -> dict:
+    """
+    AiRun.outputs without what ticket_fields write to the ticket, plus a digest of those values.
+    Nothing reads runs back yet: the digest only lets an audit tell whether the ticket still holds them.
+    """
+    rest = {k: v for k, v in outputs.items() if k not in OUTPUT_REFS}
+    return {**rest, "ref": {"ticket": list(OUTPUT_REFS), "sha1": _digest(_ref_values(ticket_fields))}}
+
+
+def build_enrichment(db: Session, subject: str, text: str) -> tuple[dict, dict]:
+    """Runs analysis + KB search. Returns (ticket column values, AiRun column values)."""
+    # Run AI analysis (MVP), with rules from ai_rules
+    with stage("analyze"):
+        ai = run_blocking(analyze_message, subject, text, refresh_rules(db))
+
+    # KB search (Variant 3)
+    with stage("kb_search"):
+        kb_hits = search_kb(db, query=f"{subject}\n{text}"[:800], limit=5)
+    # solved tickets with a similar question, whose replies can be reused
+    with stage("similar_search"):
+        similar = [
+            {"ticket_id": h["ticket_id"], "subject": h["subject"], "similarity": h["similarity"],
+             "reply_message_id": h["reply"]["message_id"] if h["reply"] else None}
+            for h in find_similar(db, f"{subject}\n{text}")
+        ]
+
+    ticket_fields = {
+        "category": ai["category"],
+        "product": ai.get("product", ""),
+        "priority": ai["priority"],
+        "ai_summary": ai["summary"],
+        "ai_draft_reply": ai["draft_reply"],
+        "ai_suggested_actions": {
+            **ai.get("suggested_actions", {}),
+            "kb_hits": [{"id": h["id"], "title": h["title"], "rank": float(h["rank"]), "snippet": h["snippet"]} for h in kb_hits],
+            "entities": ai.get("entities", {}),
+            "similar_tickets": similar,
+        },
+        "ai_confidence": int(ai["confidence"]),
+        "enrichment_status": JobStatus.done,
+    }
+    # status suggestion
+    if ai.get("suggested_actions", {}).get("next_step") == "request_info":
+        ticket_fields["status"] = TicketStatus.needs_info
+
+    run_fields = {
+        "model_versions": ai.get("model_versions", {}),
+        "outputs": {
+            "summary": ai["summary"],
+            "draft_reply": ai["draft_reply"],
+            "entities": ai.get("entities", {}),
+            "missing_info": ai.get("missing_info", []),
+            "kb_hits": kb_hits,
+            "similar_tickets": similar,
+        },
+        "confidence": int(ai["confidence"]),
+    }
+    if settings.AI_RUN_OUTPUTS == "ref":
+        # both writers of these fields (enrich_ticket, inline batch ingest) store ticket_fields as they are
+        run_fields["outputs"] = outputs_by_ref(run_fields["outputs"], ticket_fields)
+    return ticket_fields, run_fields
+
+
+# ticket values set at ingest; anything else was chosen by an agent and is kept
+INGEST_VALUES = {"category": "", "product": "", "priority": "medium"}
+
+
+def enrich_ticket(db: Session, ticket: Ticket, msg: Message) -> AiRun:
+    ticket_fields, run_fields = build_enrichment(db, msg.subject, msg.cleaned_text)
+
+    # the slow stages ran without a lock: re-read, so that an agent's edit made meanwhile wins
+    ticket = db.get(Ticket, ticket.id, with_for_update=True, populate_existing=True)
+    # suggested status only while nobody has touched the ticket yet
+    if ticket.status != TicketStatus.new:
+        ticket_fields.pop("status", None)
+    for k, v in INGEST_VALUES.items():
+        if getattr(ticket, k) != v:
+            ticket_fields.pop(k, None)
+    for k, v in ticket_fields.items():
+        setattr(ticket, k, v)
+    mark_dirty(db, [ticket.id])
+
+    run = AiRun(ticket_id=ticket.id, **run_fields)
+    db.add(run)
+    return run
+
+
+def claim_jobs(db: Session, limit: int) -> list[EnrichmentJob]:
+    """Row locks stay held until the caller commits, so a crashed worker just releases its jobs."""
+    stmt = (
+        select(EnrichmentJob)
+        .where(EnrichmentJob.status == JobStatus.pending, EnrichmentJob.run_after <= func.now())
+        .order_by(EnrichmentJob.run_after, EnrichmentJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return list(db.scalars(stmt).all())
+
+
+def _inbound_message(db: Session, job: EnrichmentJob) -> Message | None:
+    if job.message_id is not None:
+        return db.get(Message, job.message_id)
+    return db.scalars(
+        select(Message)
+        .where(Message.ticket_id == job.ticket_id, Message.direction == MessageDirection.inbound)
+        .order_by(Message.id.asc())
+        .limit(1)
+    ).first()
+
+
+def process_job(db: Session, job: EnrichmentJob) -> None:
+    ticket = db.get(Ticket, job.ticket_id)
+    msg = _inbound_message(db, job)
+    if ticket is None or msg is None:
+        job.status = JobStatus.failed
+        job.last_error = "ticket or message not found"
+        return
+
+    job.attempts += 1
+    try:
+        with db.begin_nested():
+            enrich_ticket(db, ticket, msg)
+        job.status = JobStatus.done
+        job.last_error = ""
+    except Exception as e:
+        job.last_error = f"{type(e).__name__}: {e}"[:2000]
+        if job.attempts >= settings.ENRICH_MAX_ATTEMPTS:
+            job.status = JobStatus.failed
+            ticket.enrichment_status = JobStatus.failed
+        else:
+            job.run_after = datetime.now(timezone.utc) + timedelta(seconds=10 * 2 ** job.attempts)
+
+
+def process_pending(db: Session, limit: int) -> int:
+    """Claims up to `limit` jobs, enriches them and commits once. Returns number of claimed jobs."""
+    jobs = claim_jobs(db, limit)
+    for job in jobs:
+        process_job(db, job)
+    db.commit()
+    return len(jobs)
@@ -1,28 +1,112 @@
+import asyncio
 import io
 import csv
+import tempfile
+from typing import AsyncIterator, Iterator
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from openpyxl import Workbook
+from app.core.config import settings
+from app.core.metrics import stage
 from app.db.models import Ticket
 
-def export_tickets_csv(db: Session) -> bytes:
-    tickets = db.scalars(select(Ticket).order_by(Ticket.updated_at.desc())).all()
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(["id", "subject", "customer_email", "status", "category", "product", "priority", "ai_confidence", "updated_at"])
-    for t in tickets:
-        writer.writerow([t.id, t.subject, t.customer_email, t.status, t.category, t.product, t.priority, t.ai_confidence, t.updated_at.isoformat()])
-    return buf.getvalue().encode("utf-8")
-
-def export_tickets_xlsx(db: Session) -> bytes:
-    tickets = db.scalars(select(Ticket).order_by(Ticket.updated_at.desc())).all()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "tickets"
-    ws.append(["id", "subject", "customer_email", "status", "category", "product", "priority", "ai_confidence", "updated_at"])
-    for t in tickets:
-        ws.append([t.id, t.subject, t.customer_email, str(t.status), t.category, t.product, t.priority, t.ai_confidence, t.updated_at.isoformat()])
-
-    out = io.BytesIO()
-    wb.save(out)
-    return out.getvalue()
\ No newline at end of file
+EXPORT_COLUMNS = (
+    Ticket.id, Ticket.subject, Ticket.customer_email, Ticket.status, Ticket.category,
+    Ticket.product, Ticket.priority, Ticket.ai_confidence, Ticket.updated_at,
+)
+HEADER = [c.key for c in EXPORT_COLUMNS]
+
+def _rows_stmt(filters: list):
+    return (
+        select(*EXPORT_COLUMNS)
+        .where(*filters)
+        .order_by(Ticket.updated_at.desc())
+        .execution_options(yield_per=settings.EXPORT_CHUNK_ROWS)
+    )
+
+def _row(r) -> list:
+    return [r.id, r.subject, r.customer_email, r.status.value, r.category, r.product, r.priority,
+            r.ai_confidence, r.updated_at.isoformat()]
+
+def iter_ticket_rows(db: Session, filters: list) -> Iterator[list]:
+    """Plain column tuples from a server-side cursor (yield_per), no ORM objects."""
+    for r in db.execute(_rows_stmt(filters)):
+        yield _row(r)
+
+async def aiter_ticket_rows(db: AsyncSession, filters: list) -> AsyncIterator[list]:
+    """Same rows over the async driver's server-side cursor."""
+    result = await db.stream(_rows_stmt(filters))
+    async for r in result:
+        yield _row(r)
+
+class _CsvChunks:
+    def __init__(self):
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf)
+        self.writer.writerow(HEADER)
+        self.rows = 0
+
+    def add(self, row: list) -> bytes | None:
+        self.writer.writerow(row)
+        self.rows += 1
+        if self.rows % settings.EXPORT_CHUNK_ROWS == 0:
+            return self.take()
+        return None
+
+    def take(self) -> bytes:
+        data = self.buf.getvalue().encode("utf-8")
+        self.buf.seek(0)
+        self.buf.truncate()
+        return data
+
+def export_tickets_csv(db: Session, filters: list) -> Iterator[bytes]:
+    # timed until the last chunk is handed over, i.e. including the client's read speed
+    with stage("export_csv"):
+        out = _CsvChunks()
+        for row in iter_ticket_rows(db, filters):
+            if chunk := out.add(row):
+                yield chunk
+        yield out.take()
+
+async def export_tickets_csv_async(db: AsyncSession, filters: list) -> AsyncIterator[bytes]:
+    with stage("export_csv"):
+        out = _CsvChunks()
+        async for row in aiter_ticket_rows(db, filters):
+            if chunk := out.add(row):
+                yield chunk
+        yield out.take()
+
+def _xlsx_workbook():
+    # write-only mode keeps memory flat; xlsx is a zip, so it is spooled to a temp file and then streamed
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("tickets")
+    ws.append(HEADER)
+    return wb, ws
+
+def _read_chunks(out) -> Iterator[bytes]:
+    out.seek(0)
+    while chunk := out.read(256 * 1024):
+        yield chunk
+
+def export_tickets_xlsx(db: Session, filters: list) -> Iterator[bytes]:
+    with stage("export_xlsx"):
+        wb, ws = _xlsx_workbook()
+        for row in iter_ticket_rows(db, filters):
+            ws.append(row)
+
+        with tempfile.TemporaryFile() as out:
+            wb.save(out)
+            yield from _read_chunks(out)
+
+async def export_tickets_xlsx_async(db: AsyncSession, filters: list) -> AsyncIterator[bytes]:
+    with stage("export_xlsx"):
+        wb, ws = _xlsx_workbook()
+        async for row in aiter_ticket_rows(db, filters):
+            ws.append(row)
+
+        with tempfile.TemporaryFile() as out:
+            # zip compression of the whole sheet is CPU work: keep it off the event loop
+            await asyncio.to_thread(wb.save, out)
+            for chunk in _read_chunks(out):
+                yield chunk
@@ -1,11 +1,40 @@
+import json
+import re
 from sqlalchemy.orm import Session
-from sqlalchemy import text as sql_text
+from sqlalchemy import text as sql_text, select, bindparam, func, or_, cast, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONB
+from sqlalchemy.exc import SQLAlchemyError
 from app.core.config import settings
-from app.db.models import KbDocument
+from app.core.metrics import stage
+from app.db.models import KbDocument, KbState
+from app.db.session import run_blocking
+from app.services.cache import make_cache
+from app.services.kb_passages import sync_passages
+from app.services.kb_vectors import index_kb_document, index_documents, vector_search
+
+# search results keyed on (normalized query, ts_config, limit, kb version)
+_search_cache = make_cache("kb:search:", settings.KB_CACHE_SIZE, settings.KB_CACHE_TTL)
+
+def bump_kb_version(db: Session) -> None:
+    """Called inside the write transaction, so readers see the new version only after commit."""
+    stmt = pg_insert(KbState).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(index_elements=[KbState.id], set_={"version": KbState.version + 1})
+    db.execute(stmt)
+
+def get_kb_version(db: Session) -> int:
+    return db.scalar(select(KbState.version).where(KbState.id == 1)) or 0
+
+def kb_cache_stats(db: Session) -> dict:
+    return {**_search_cache.stats(), "kb_version": get_kb_version(db)}
 
 def create_kb_document(db: Session, title: str, body: str, tags: list[str], language: str, status: str) -> KbDocument:
     doc = KbDocument(title=title, body=body, tags=tags, language=language, status=status)
     db.add(doc)
+    db.flush()
+    sync_passages(db, [(doc.id, doc.title, doc.body)])
+    # before the commit: once the version bump is visible, the vector index already has the row
+    run_blocking(index_kb_document, doc)
+    bump_kb_version(db)
     db.commit()
     db.refresh(doc)
     return doc
@@ -19,39 +48,294 @@ def update_kb_document(db: Session, doc_id: int, title: str, body: str, tags: li
     doc.tags = tags
     doc.language = language
     doc.status = status
+    sync_passages(db, [(doc.id, doc.title, doc.body)])
+    run_blocking(index_kb_document, doc)
+    bump_kb_version(db)
     db.commit()
     db.refresh(doc)
     return doc
 
+_IMPORT_FIELDS = ("title", "body", "tags", "language", "status")
+
+def _upsert_chunk(db: Session, items: list[dict]) -> list[dict]:
+    """
+    One multi-row INSERT ... ON CONFLICT (external_id) DO UPDATE ... RETURNING for the chunk.
+    Rows whose content did not change are not rewritten (and not reindexed): "unchanged".
+    """
+    last = {it["external_id"]: j for j, it in enumerate(items)}
+    rows = [{"external_id": items[j]["external_id"], **{f: items[j][f] for f in _IMPORT_FIELDS}} for j in sorted(last.values())]
+
+    stmt = pg_insert(KbDocument)
+    changed = or_(*(
+        # json has no equality operator, jsonb does
+        cast(KbDocument.tags, JSONB).is_distinct_from(cast(stmt.excluded.tags, JSONB)) if f == "tags"
+        else getattr(KbDocument, f).is_distinct_from(stmt.excluded[f])
+        for f in _IMPORT_FIELDS
+    ))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[KbDocument.external_id],
+        set_={**{f: stmt.excluded[f] for f in _IMPORT_FIELDS}, "updated_at": func.now()},
+        where=changed,
+    ).returning(KbDocument.id, KbDocument.external_id, literal_column("xmax = 0").label("inserted"))
+    written = {r.external_id: (r.id, "created" if r.inserted else "updated") for r in db.execute(stmt, rows)}
+    sync_passages(db, [(written[r["external_id"]][0], r["title"], r["body"]) for r in rows if r["external_id"] in written])
+
+    same = [r["external_id"] for r in rows if r["external_id"] not in written]
+    if same:
+        written.update(
+            (ext, (doc_id, "unchanged"))
+            for doc_id, ext in db.execute(select(KbDocument.id, KbDocument.external_id).where(KbDocument.external_id.in_(same)))
+        )
+
+    results = []
+    for j, it in enumerate(items):
+        ext = it["external_id"]
+        if last[ext] != j:
+            results.append({"external_id": ext, "id": None, "action": None, "error": "duplicate external_id, a later record wins"})
+        else:
+            doc_id, action = written[ext]
+            results.append({"external_id": ext, "id": doc_id, "action": action, "error": None})
+    return results
+
+def import_kb_documents(db: Session, items: list[dict], reindex: str = "deferred") -> list[dict]:
+    """
+    Upserts one chunk of KbDocumentImport dicts keyed on external_id and commits.
+    reindex: "inline" — vector index and KB version updated with this chunk;
+    "deferred" — left to finish_kb_import() once after the last chunk.
+    If the multi-row statement fails, the chunk is retried item by item in savepoints.
+    Returns [{"external_id", "id", "action", "error"}] in input order.
+    """
+    if not items:
+        return []
+    try:
+        results = _upsert_chunk(db, items)
+    except SQLAlchemyError:
+        db.rollback()
+        results = []
+        for it in items:
+            try:
+                with db.begin_nested():
+                    results.extend(_upsert_chunk(db, [it]))
+            except SQLAlchemyError as e:
+                results.append({"external_id": it["external_id"], "id": None, "action": None,
+                                "error": str(getattr(e, "orig", None) or e).strip()[:500]})
+    if reindex == "inline":
+        touched = [r["id"] for r in results if r["action"] in ("created", "updated")]
+        if touched:
+            index_documents(db, touched)
+            bump_kb_version(db)
+    db.commit()
+    return results
+
+def finish_kb_import(db: Session, doc_ids: list[int]) -> None:
+    """Deferred reindex: the vector index for all written documents and a single KB version bump."""
+    if doc_ids:
+        index_documents(db, doc_ids)
+    bump_kb_version(db)
+    db.commit()
+
+def import_summary(results: list[dict], seconds: float) -> dict:
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    for r in results:
+        counts[r.get("action") or "failed"] += 1
+    return {
+        **counts,
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(len(results) / seconds, 1) if seconds > 0 else None,
+        "items": results,
+    }
+
 def get_kb_document(db: Session, doc_id: int) -> KbDocument | None:
     return db.get(KbDocument, doc_id)
 
-def search_kb(db: Session, query: str, limit: int = 5, language: str | None = None) -> list[dict]:
+def search_kb(db: Session, query: str, limit: int = 5, language: str | None = None, mode: str | None = None) -> list[dict]:
     """
-    Full Text Search via PostgreSQL:
-    - websearch_to_tsquery for natural queries
-    - ts_rank_cd for ranking
-    - ts_headline for snippet
+    Full Text Search via PostgreSQL over KB passages (app.services.kb_passages), in two stages:
+    - rank: ts_rank_cd over kb_passages.search_tsv only (GIN index + the tsvector column,
+      passage text is not read); a document ranks by its best passage, one hit per document.
+      Long inputs (an email) are reduced to their key terms;
+      if the strict query (all terms) finds fewer than `limit` documents, an OR query over
+      the same terms fills the rest, ranked by how many terms match and how close.
+    - snippets: ts_headline of the best passage, for the final `limit` documents only.
+    mode="hybrid" fuses the ranking with the local vector index (app.services.kb_vectors),
+    so documents are found even when not every query term matches; rank is then the RRF score.
+    Results are cached until the KB version changes (or KB_CACHE_TTL expires).
     """
     lang = (language or settings.KB_TS_CONFIG).strip() or "russian"
+    mode = mode or settings.KB_SEARCH_MODE
 
-    # Note: We rely on kb_documents.search_tsv being a real tsvector (created in migration).
-    sql = sql_text(
-        """
-        WITH q AS (
-          SELECT websearch_to_tsquery(:ts_config, :query) AS query
-        )
-        SELECT
-          d.id,
-          d.title,
-          ts_rank_cd(d.search_tsv, q.query) AS rank,
-          ts_headline(:ts_config, d.body, q.query, 'MaxWords=28, MinWords=10, ShortWord=3, MaxFragments=2, FragmentDelimiter= … ') AS snippet
-        FROM kb_documents d, q
-        WHERE d.status = 'active'
-          AND d.search_tsv @@ q.query
-        ORDER BY rank DESC
-        LIMIT :limit;
-        """
+    key = (" ".join(query.lower().split()), lang, limit, mode, get_kb_version(db))
+    hits = _search_cache.get(key)
+    if hits is None:
+        hits = _search(db, query, limit, lang, mode)
+        _search_cache.set(key, hits)
+    return [dict(h) for h in hits]
+
+def explain_kb_search(db: Session, query: str, limit: int = 5, language: str | None = None, mode: str | None = None) -> dict:
+    """Runs the search uncached with EXPLAIN (ANALYZE, BUFFERS) of every statement: plan and timings per stage."""
+    lang = (language or settings.KB_TS_CONFIG).strip() or "russian"
+    strict, fallback = kb_query_forms(query)
+    stages: list[dict] = []
+    hits = _search(db, query, limit, lang, mode or settings.KB_SEARCH_MODE, stages)
+    return {"query": query, "strict": strict, "fallback": fallback, "hits": hits, "stages": stages}
+
+def _search(db: Session, query: str, limit: int, lang: str, mode: str, explain: list | None = None) -> list[dict]:
+    if mode == "hybrid":
+        return _search_kb_hybrid(db, query, limit, lang, explain)
+    return _search_kb_db(db, query, limit, lang, explain)
+
+_TERM_RE = re.compile(r"\w{3,}")
+# greetings, pronouns, auxiliaries: never a useful key term, even if the ts_config keeps them
+_STOP_WORDS = frozenset("""
+    the and for you your with this that have has had are was were not but can could would should will from
+    please hello dear thanks thank regards what when where which who how why there their they them our out
+    all any been being did does just also into about some more than then its get got through went
+    что как это для при или мне меня мой моя мои все уже так где когда если есть был была было были нет
+    только можно пожалуйста здравствуйте спасибо добрый день вас вам ваш ваша наш наша они она оно его
+    еще ещё тоже чтобы почему там тут вот без под над про через после перед того этот эта эти
+""".split())
+
+def key_terms(query: str, limit: int) -> list[str]:
+    """The `limit` most frequent (then longest) non-stop-words of the query, in their original order."""
+    counts: dict[str, int] = {}
+    for word in _TERM_RE.findall(query.lower()):
+        if word not in _STOP_WORDS and not word.isdigit():
+            counts[word] = counts.get(word, 0) + 1
+    order = {w: i for i, w in enumerate(counts)}
+    top = sorted(counts, key=lambda w: (-counts[w], -len(w), order[w]))[:limit]
+    return sorted(top, key=order.get)
+
+def kb_query_forms(query: str) -> tuple[str, str | None]:
+    """websearch_to_tsquery inputs: (strict, OR fallback). Short queries stay as typed in the strict form."""
+    terms = key_terms(query, settings.KB_QUERY_TERMS)
+    if len(_TERM_RE.findall(query)) <= settings.KB_QUERY_TERMS:
+        strict = query
+    else:
+        strict = " ".join(terms)
+    # "or" is the OR operator of websearch_to_tsquery; terms are \w+ so nothing else is special
+    return strict, " or ".join(terms) if len(terms) > 1 else None
+
+# stage one: documents ranked by their best passage
+_RANK_SQL = """
+    WITH q AS (
+      SELECT websearch_to_tsquery(:ts_config, :query) AS query
+    ), best AS (
+      SELECT DISTINCT ON (p.document_id) p.document_id AS id, p.id AS passage_id, ts_rank_cd(p.search_tsv, q.query) AS rank
+      FROM kb_passages p JOIN kb_documents d ON d.id = p.document_id, q
+      WHERE d.status = 'active'
+        AND p.search_tsv @@ q.query
+      ORDER BY p.document_id, rank DESC
+    )
+    SELECT id, passage_id, rank FROM best
+    ORDER BY rank DESC
+    LIMIT :limit
+"""
+
+# best passage of documents found by the vector index only (the first one if no term matches)
+_LEAD_PASSAGES_SQL = """
+    WITH q AS (
+      SELECT websearch_to_tsquery(:ts_config, :query) AS query
     )
-    rows = db.execute(sql, {"ts_config": lang, "query": query, "limit": limit}).mappings().all()
-    return [dict(r) for r in rows]
\ No newline at end of file
+    SELECT DISTINCT ON (p.document_id) p.document_id AS id, p.id AS passage_id
+    FROM kb_passages p, q
+    WHERE p.document_id IN :ids
+    ORDER BY p.document_id, ts_rank_cd(p.search_tsv, q.query) DESC, p.position
+"""
+
+# stage two: headline of one passage per returned document
+_SNIPPETS_SQL = """
+    SELECT
+      d.id,
+      d.title,
+      p.id AS passage_id,
+      p.heading,
+      coalesce(nullif(ts_headline(:ts_config, p.text, websearch_to_tsquery(:ts_config, :query), 'MaxWords=28, MinWords=10, ShortWord=3, MaxFragments=2, FragmentDelimiter= … '), ''), p.heading) AS snippet
+    FROM kb_passages p JOIN kb_documents d ON d.id = p.document_id
+    WHERE p.id IN :ids
+      AND d.status = 'active'
+"""
+
+def _execute(db: Session, stage_name: str, sql: str, params: dict, explain: list | None) -> list:
+    def statement(prefix: str = ""):
+        stmt = sql_text(prefix + sql)
+        return stmt.bindparams(bindparam("ids", expanding=True)) if ":ids" in sql else stmt
+
+    if explain is not None:
+        plan = db.execute(statement("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "), params).scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+        explain.append({
+            "stage": stage_name,
+            "query": params["query"],
+            "planning_ms": plan.get("Planning Time"),
+            "execution_ms": plan.get("Execution Time"),
+            "rows": plan["Plan"].get("Actual Rows"),
+            "plan": plan["Plan"],
+        })
+    with stage(f"kb_{stage_name}"):
+        return db.execute(statement(), params).mappings().all()
+
+def _rank_kb(db: Session, query: str, limit: int, lang: str, explain: list | None = None) -> tuple[list[tuple[int, float]], dict[int, tuple[int, str]]]:
+    """Stage one: [(doc id, rank)] best first, and per doc id its best passage and the websearch query it matched."""
+    strict, fallback = kb_query_forms(query)
+    if not strict.strip():
+        return [], {}
+    rows = _execute(db, "rank", _RANK_SQL, {"ts_config": lang, "query": strict, "limit": limit}, explain)
+    ranked = [(r["id"], float(r["rank"])) for r in rows]
+    passages = {r["id"]: (r["passage_id"], strict) for r in rows}
+    if len(ranked) < limit and fallback:
+        # the OR query also matches the strict hits: ask for enough rows to fill `limit` past them
+        rows = _execute(db, "rank_fallback", _RANK_SQL, {"ts_config": lang, "query": fallback, "limit": limit + len(ranked)}, explain)
+        # partial matches rank below full ones, and the ranks stay sorted
+        ceiling = ranked[-1][1] if ranked else None
+        for r in rows:
+            if r["id"] in passages or len(ranked) >= limit:
+                continue
+            rank = float(r["rank"]) * settings.KB_FALLBACK_WEIGHT
+            ranked.append((r["id"], min(rank, ceiling) if ceiling is not None else rank))
+            passages[r["id"]] = (r["passage_id"], fallback)
+    return ranked, passages
+
+def _kb_snippets(db: Session, passages: dict[int, tuple[int, str]], lang: str, explain: list | None = None) -> dict[int, dict]:
+    """Stage two: {doc id: hit} with ts_headline of the given passage, highlighted with the query it matched."""
+    by_query: dict[str, list[int]] = {}
+    for passage_id, query in passages.values():
+        by_query.setdefault(query, []).append(passage_id)
+    out: dict[int, dict] = {}
+    for query, ids in by_query.items():
+        rows = _execute(db, "snippets", _SNIPPETS_SQL, {"ts_config": lang, "query": query, "ids": ids}, explain)
+        out.update((r["id"], dict(r)) for r in rows)
+    return out
+
+def _search_kb_db(db: Session, query: str, limit: int, lang: str, explain: list | None = None) -> list[dict]:
+    ranked, passages = _rank_kb(db, query, limit, lang, explain)
+    if not ranked:
+        return []
+    snippets = _kb_snippets(db, passages, lang, explain)
+    # a document archived between the two statements drops out
+    return [{**snippets[doc_id], "rank": rank} for doc_id, rank in ranked if doc_id in snippets]
+
+def _search_kb_hybrid(db: Session, query: str, limit: int, lang: str, explain: list | None = None) -> list[dict]:
+    n = max(limit, settings.KB_HYBRID_CANDIDATES)
+    lexical, passages = _rank_kb(db, query, n, lang, explain)
+    vector = run_blocking(vector_search, query, n)
+
+    # reciprocal rank fusion: scores of the two rankings are not comparable, ranks are
+    fused: dict[int, float] = {}
+    for ranking in ([doc_id for doc_id, _ in lexical], [doc_id for doc_id, _ in vector]):
+        for pos, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (settings.KB_RRF_K + pos + 1)
+    top = sorted(fused, key=fused.get, reverse=True)[:limit]
+    if not top:
+        return []
+
+    chosen = {doc_id: passages[doc_id] for doc_id in top if doc_id in passages}
+    missing = [doc_id for doc_id in top if doc_id not in passages]
+    if missing:
+        # vector-only hits matched no query form: the passage with most of the key terms
+        _, fallback = kb_query_forms(query)
+        q = fallback or query
+        rows = _execute(db, "lead_passages", _LEAD_PASSAGES_SQL, {"ts_config": lang, "query": q, "ids": missing}, explain)
+        chosen.update((r["id"], (r["passage_id"], q)) for r in rows)
+    snippets = _kb_snippets(db, chosen, lang, explain)
+    # vector-only ids that are gone or archived in the DB drop out here
+    return [{**snippets[doc_id], "rank": fused[doc_id]} for doc_id in top if doc_id in snippets]
@@ -0,0 +1,159 @@
+"""
+KB documents split into passages: the unit the lexical search ranks and builds snippets from.
+
+A passage is one heading section or, inside a long section, a window of whole paragraphs
+up to KB_PASSAGE_CHARS (a paragraph longer than that is cut at sentence ends). Each row has
+its own tsvector (heading weighted A, text B), so a long guide is ranked by its best
+section instead of being diluted by its length, and ts_headline parses one passage.
+
+sync_passages() re-chunks incrementally: passages whose heading and text did not change
+keep their row (only `position` moves), so an edit rewrites just the touched sections.
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import KbDocument, KbPassage
+from app.db.session import run_blocking
+
+# markdown "# Heading" lines, and "Heading" underlined with === / ---
+_ATX_RE = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$")
+_SETEXT_RE = re.compile(r"^\s{0,3}(?:=+|-+)\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _blocks(body: str):
+    """("heading", text) / ("paragraph", text) in document order."""
+    paragraph: list[str] = []
+    for line in body.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        m = _ATX_RE.match(line)
+        if m or (len(paragraph) == 1 and _SETEXT_RE.match(line)):
+            heading = m.group(1) if m else paragraph.pop()
+            if paragraph:
+                yield "paragraph", "\n".join(paragraph)
+            paragraph = []
+            yield "heading", heading.strip()
+        elif line.strip():
+            paragraph.append(line.strip())
+        elif paragraph:
+            yield "paragraph", "\n".join(paragraph)
+            paragraph = []
+    if paragraph:
+        yield "paragraph", "\n".join(paragraph)
+
+
+def _pieces(paragraph: str, size: int):
+    """A paragraph longer than `size`, cut at sentence ends (or at a space for a run-on sentence)."""
+    piece = ""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        while len(sentence) > size:
+            cut = sentence.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            if piece:
+                yield piece
+                piece = ""
+            yield sentence[:cut].rstrip()
+            sentence = sentence[cut:].lstrip()
+        if piece and len(piece) + 1 + len(sentence) > size:
+            yield piece
+            piece = ""
+        piece = f"{piece} {sentence}" if piece else sentence
+    if piece:
+        yield piece
+
+
+def chunk_document(title: str, body: str, size: int | None = None) -> list[tuple[str, str]]:
+    """[(heading, text)] in order; at least one passage, so a title-only match still finds the document."""
+    size = size or settings.KB_PASSAGE_CHARS
+    passages: list[tuple[str, str]] = []
+    heading = title
+    window: list[str] = []
+    length = 0
+
+    def flush() -> None:
+        nonlocal window, length
+        if window:
+            passages.append((heading, "\n\n".join(window)))
+        window, length = [], 0
+
+    for kind, text in _blocks(body):
+        if kind == "heading":
+            flush()
+            heading = text[:512]
+            continue
+        for piece in _pieces(text, size):
+            if window and length + len(piece) > size:
+                flush()
+            window.append(piece)
+            length += len(piece) + 2
+    flush()
+    return passages or [(title, "")]
+
+
+def _hash(heading: str, text: str) -> str:
+    return hashlib.sha1(f"{heading}\0{text}".encode()).hexdigest()
+
+
+def sync_passages(db: Session, docs: list[tuple[int, str, str]]) -> int:
+    """
+    Re-chunks documents given as (id, title, body) and applies the difference to kb_passages:
+    unchanged passages stay (renumbered if they moved), the rest are deleted / inserted.
+    Runs in the caller's transaction. Returns number of passages written.
+    """
+    if not docs:
+        return 0
+    existing: dict[int, dict[str, list[tuple[int, int]]]] = defaultdict(lambda: defaultdict(list))
+    for pid, doc_id, position, content_hash in db.execute(
+        select(KbPassage.id, KbPassage.document_id, KbPassage.position, KbPassage.content_hash)
+        .where(KbPassage.document_id.in_([d[0] for d in docs]))
+        .order_by(KbPassage.document_id, KbPassage.position)
+    ):
+        existing[doc_id][content_hash].append((pid, position))
+
+    chunked = run_blocking(lambda: [
+        [(heading, text, _hash(heading, text)) for heading, text in chunk_document(title, body)] for _, title, body in docs
+    ])
+    inserts: list[dict] = []
+    moves: list[dict] = []
+    stale: list[int] = []
+    for (doc_id, _, _), passages in zip(docs, chunked):
+        old = existing.get(doc_id, {})
+        for position, (heading, text, content_hash) in enumerate(passages):
+            if old.get(content_hash):
+                pid, old_position = old[content_hash].pop(0)
+                if old_position != position:
+                    moves.append({"id": pid, "position": position})
+            else:
+                inserts.append({"document_id": doc_id, "position": position, "heading": heading,
+                                "text": text, "content_hash": content_hash})
+        stale.extend(pid for rows in old.values() for pid, _ in rows)
+
+    if stale:
+        db.execute(delete(KbPassage).where(KbPassage.id.in_(stale)))
+    if moves:
+        db.execute(update(KbPassage), moves)
+    if inserts:
+        db.execute(KbPassage.__table__.insert(), inserts)
+    return len(inserts) + len(moves)
+
+
+def rebuild_passages(db: Session, chunk: int = 200) -> int:
+    """Re-chunks every document (after deploy or a KB_PASSAGE_CHARS change), committing per chunk. Returns documents."""
+    total = 0
+    last_id = 0
+    while True:
+        docs = db.execute(
+            select(KbDocument.id, KbDocument.title, KbDocument.body)
+            .where(KbDocument.id > last_id)
+            .order_by(KbDocument.id)
+            .limit(chunk)
+        ).all()
+        if not docs:
+            return total
+        sync_passages(db, [tuple(d) for d in docs])
+        db.commit()
+        total += len(docs)
+        last_id = docs[-1].id
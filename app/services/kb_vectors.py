@@ -0,0 +1,259 @@
+"""
+Offline vector index of KB documents for hybrid search.
+
+Documents are embedded locally — hashed character 3..5-grams of words, signed hashing,
+sublinear tf, L2-normalized, KB_VECTOR_DIM float32 columns — no model download, no API.
+The matrix lives in KB_INDEX_DIR as raw files opened with np.memmap:
+
+  vectors.f32  capacity x dim
+  ids.i64      capacity, doc id per row (0 = free row)
+  meta.json    {"dim", "rows", "capacity"}
+
+Opening is a couple of mmap calls whatever the KB size; a query is one matrix-vector
+product over the mapped rows. Writers serialize on an flock; in-place row writes are
+visible to every process through the shared mapping, and readers re-map when meta.json
+changes (another process grew the files).
+"""
+
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.core.config import settings
+from app.db.models import KbDocument
+from app.db.session import run_blocking
+
+log = logging.getLogger("kb_vectors")
+
+_WORD_RE = re.compile(r"\w+")
+NGRAMS = (3, 4, 5)
+TEXT_LIMIT = 200_000
+MIN_CAPACITY = 1024
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    counts: dict[int, int] = {}
+    for word in _WORD_RE.findall(text[:TEXT_LIMIT].lower()):
+        word = f" {word} "
+        for n in NGRAMS:
+            for i in range(len(word) - n + 1):
+                h = zlib.crc32(word[i:i + n].encode())
+                # the top bit picks the sign, so collisions cancel out instead of piling up
+                j = h % dim
+                counts[j] = counts.get(j, 0) + (1 if h & 0x80000000 else -1)
+
+    vec = np.zeros(dim, dtype=np.float32)
+    for j, c in counts.items():
+        if c:
+            vec[j] = math.copysign(1.0 + math.log(abs(c)), c)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def document_text(title: str, body: str, tags: list[str] | None) -> str:
+    return "\n".join([title, " ".join(tags or []), body])
+
+
+class VectorIndex:
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.vectors: np.ndarray | None = None
+        self.ids: np.ndarray | None = None
+        self.rows = 0
+        self._meta_stamp: tuple[int, int] | None = None
+        self._lock = threading.Lock()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> dict | None:
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _map(self, meta: dict, mode: str) -> tuple[np.ndarray, np.ndarray]:
+        shape = (meta["capacity"], meta["dim"])
+        return (
+            np.memmap(self._file("vectors.f32"), dtype=np.float32, mode=mode, shape=shape),
+            np.memmap(self._file("ids.i64"), dtype=np.int64, mode=mode, shape=(meta["capacity"],)),
+        )
+
+    def open(self) -> None:
+        """(Re)maps the files if meta.json changed since the last call; cheap enough for every query."""
+        try:
+            st = os.stat(self._file("meta.json"))
+            # meta.json is replaced on every write: a new inode even within one mtime tick
+            stamp = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._meta_stamp:
+            return
+        with self._lock:
+            meta = self._read_meta()
+            if meta is None or not meta["capacity"]:
+                self.vectors, self.ids, self.rows = None, None, 0
+            elif meta["dim"] != self.dim:
+                log.error("KB vector index has dim %s, KB_VECTOR_DIM is %s: rebuild it", meta["dim"], self.dim)
+                self.vectors, self.ids, self.rows = None, None, 0
+            else:
+                self.vectors, self.ids = self._map(meta, "r")
+                self.rows = meta["rows"]
+            self._meta_stamp = stamp
+
+    @contextmanager
+    def _writer(self) -> Iterator[None]:
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("write.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _grow(self, meta: dict, capacity: int) -> dict:
+        """Copies into bigger files and swaps them in; readers keep the old mapping until meta changes."""
+        new = {**meta, "capacity": capacity}
+        vectors = np.memmap(self._file("vectors.f32.tmp"), dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+        ids = np.memmap(self._file("ids.i64.tmp"), dtype=np.int64, mode="w+", shape=(capacity,))
+        if meta["rows"]:
+            old_vectors, old_ids = self._map(meta, "r")
+            vectors[:meta["rows"]] = old_vectors[:meta["rows"]]
+            ids[:meta["rows"]] = old_ids[:meta["rows"]]
+        vectors.flush()
+        ids.flush()
+        del vectors, ids
+        os.replace(self._file("vectors.f32.tmp"), self._file("vectors.f32"))
+        os.replace(self._file("ids.i64.tmp"), self._file("ids.i64"))
+        return new
+
+    def upsert(self, items: list[tuple[int, str | None]]) -> None:
+        """items: (doc_id, text); text None removes the document."""
+        if not items:
+            return
+        with self._writer():
+            meta = self._read_meta() or {"dim": self.dim, "rows": 0, "capacity": 0}
+            if meta["dim"] != self.dim:
+                raise RuntimeError(f"KB vector index has dim {meta['dim']}, KB_VECTOR_DIM is {self.dim}: rebuild it")
+
+            rows = meta["rows"]
+            if rows:
+                _, ids = self._map(meta, "r")
+                current = np.asarray(ids[:rows])
+            else:
+                current = np.zeros(0, dtype=np.int64)
+            # one pass over the ids per batch, not a scan of them per item
+            position: dict[int, int] = {}
+            for i, doc_id in enumerate(current.tolist()):
+                if doc_id:
+                    position.setdefault(doc_id, i)
+            slot = {doc_id: position[doc_id] for doc_id, _ in items if doc_id in position}
+            free = iter(np.flatnonzero(current == 0).tolist())
+
+            adding = [doc_id for doc_id, text in items if text is not None and doc_id not in slot]
+            for doc_id in adding:
+                slot[doc_id] = next(free, rows)
+                rows = max(rows, slot[doc_id] + 1)
+            if rows > meta["capacity"]:
+                meta = self._grow(meta, max(rows, 2 * meta["capacity"], MIN_CAPACITY))
+
+            vectors, ids = self._map(meta, "r+")
+            for doc_id, text in items:
+                if doc_id not in slot:
+                    continue
+                i = slot[doc_id]
+                if text is None:
+                    vectors[i] = 0
+                    ids[i] = 0
+                else:
+                    vectors[i] = embed(text, self.dim)
+                    ids[i] = doc_id
+            vectors.flush()
+            ids.flush()
+            self._write_meta({**meta, "rows": rows})
+
+    def search(self, text: str, k: int) -> list[tuple[int, float]]:
+        """(doc_id, cosine) best first."""
+        self.open()
+        vectors, ids, rows = self.vectors, self.ids, self.rows
+        if vectors is None or not rows or k <= 0:
+            return []
+        scores = vectors[:rows] @ embed(text, self.dim)
+        k = min(k, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if ids[i] and scores[i] > 0]
+
+    def clear(self) -> None:
+        with self._writer():
+            self._write_meta({"dim": self.dim, "rows": 0, "capacity": 0})
+
+
+_index = VectorIndex(settings.KB_INDEX_DIR, settings.KB_VECTOR_DIM)
+
+
+def get_index() -> VectorIndex:
+    return _index
+
+
+def index_kb_document(doc: KbDocument) -> None:
+    """Only active documents are searchable; anything else is dropped from the index."""
+    text = document_text(doc.title, doc.body, doc.tags) if doc.status == "active" else None
+    _index.upsert([(doc.id, text)])
+
+
+def vector_search(query: str, k: int) -> list[tuple[int, float]]:
+    return _index.search(query, k)
+
+
+def rebuild_index(db: Session, chunk: int = 500) -> int:
+    _index.clear()
+    total = 0
+    last_id = 0
+    while True:
+        docs = db.execute(
+            select(KbDocument.id, KbDocument.title, KbDocument.body, KbDocument.tags)
+            .where(KbDocument.status == "active", KbDocument.id > last_id)
+            .order_by(KbDocument.id)
+            .limit(chunk)
+        ).all()
+        if not docs:
+            return total
+        _index.upsert([(d.id, document_text(d.title, d.body, d.tags)) for d in docs])
+        total += len(docs)
+        last_id = docs[-1].id
+
+
+def index_documents(db: Session, ids: list[int], chunk: int = 500) -> int:
+    """(Re)indexes the given documents, one index write per chunk; missing or inactive ones are dropped."""
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        docs = {
+            d.id: d
+            for d in db.execute(
+                select(KbDocument.id, KbDocument.title, KbDocument.body, KbDocument.tags, KbDocument.status)
+                .where(KbDocument.id.in_(part))
+            )
+        }
+        run_blocking(lambda: _index.upsert([
+            (doc_id, document_text(d.title, d.body, d.tags) if (d := docs.get(doc_id)) and d.status == "active" else None)
+            for doc_id in part
+        ]))
+    return len(ids)
@@ -0,0 +1,344 @@
+"""
+Потоковый разбор RFC822/MIME.
+
+Письмо читается построчно из файлового объекта: вложения декодируются
+(base64 / quoted-printable) кусками и сразу пишутся на диск, в памяти
+не держится ни письмо целиком, ни декодированное вложение.
+Текстовые части собираются с ограничением размера; text/html сразу по ходу
+чтения превращается в текст (app.services.cleaner.HtmlToText).
+"""
+
+import binascii
+import codecs
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from email import policy
+from email.message import Message as EmailHeaders
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parseaddr
+from typing import BinaryIO
+from app.core.config import settings
+from app.services.cleaner import HtmlToText
+
+KEPT_HEADERS = ("Message-ID", "In-Reply-To", "References", "Date", "From", "To", "Cc", "Reply-To")
+
+LINE_LIMIT = 64 * 1024  # длинные строки (binary без переводов строк) читаются кусками
+
+_SAFE_NAME_RE = re.compile(r"[^\w.\-]+")
+
+
+class _LineReader:
+    """readline() с ограничением длины и флагом «строка началась с начала строки»."""
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self.at_line_start = True
+
+    def readline(self) -> tuple[bytes, bool]:
+        line_start = self.at_line_start
+        line = self.fp.readline(LINE_LIMIT)
+        self.at_line_start = line.endswith(b"\n")
+        return line, line_start
+
+
+class _Base64Decoder:
+    def __init__(self):
+        self.tail = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self.tail + b"".join(data.split())
+        cut = len(data) - len(data) % 4
+        self.tail = data[cut:]
+        return binascii.a2b_base64(data[:cut]) if cut else b""
+
+    def flush(self) -> bytes:
+        tail, self.tail = self.tail, b""
+        if not tail:
+            return b""
+        try:
+            return binascii.a2b_base64(tail + b"=" * (-len(tail) % 4))
+        except binascii.Error:
+            return b""
+
+
+# конец куска, который нельзя декодировать без продолжения: "=" (мягкий перенос или начало
+# "=XX"), "=X", пробелы (удаляются, если за ними перевод строки) и "\r" без "\n"
+_QP_TAIL_RE = re.compile(rb"(?:=[ \t]*\r?|=[0-9A-Fa-f]|[ \t]+\r?|\r)$")
+_QP_TRAILING_WS_RE = re.compile(rb"[ \t]+(?=\r?\n)")
+
+
+class _QpDecoder:
+    """Строки приходят без перевода строки, а он сам отдельным куском: хвост придерживаем,
+    чтобы "=" склеился с переводом строки в мягкий перенос, а "=D" с "0" в байт."""
+
+    def __init__(self):
+        self.tail = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self.tail + data
+        m = _QP_TAIL_RE.search(data)
+        cut = m.start() if m else len(data)
+        self.tail = data[cut:]
+        return binascii.a2b_qp(_QP_TRAILING_WS_RE.sub(b"", data[:cut]))
+
+    def flush(self) -> bytes:
+        tail, self.tail = self.tail, b""
+        return binascii.a2b_qp(tail.rstrip(b" \t\r"))
+
+
+class _IdentityDecoder:
+    def feed(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decoder(cte: str):
+    cte = (cte or "").strip().lower()
+    if cte == "base64":
+        return _Base64Decoder()
+    if cte == "quoted-printable":
+        return _QpDecoder()
+    return _IdentityDecoder()
+
+
+class _TextSink:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks: list[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self.size >= self.limit:
+            return
+        data = data[: self.limit - self.size]
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        pass
+
+    def value(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+class _FileSink:
+    def __init__(self, storage_dir: str, filename: str):
+        day = datetime.now(timezone.utc).strftime("%Y/%m/%d")
+        folder = os.path.join(storage_dir, day)
+        os.makedirs(folder, exist_ok=True)
+        ext = os.path.splitext(filename)[1][:16]
+        self.path = os.path.join(folder, uuid.uuid4().hex + _SAFE_NAME_RE.sub("", ext))
+        self.fp = open(self.path, "wb")
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.fp.write(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+class _HtmlSink:
+    """text/html part: decoded and converted to text as it streams in, the HTML itself is not kept."""
+
+    def __init__(self, limit: int, charset: str):
+        try:
+            self.decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.parser = HtmlToText()
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self.size >= self.limit:
+            return
+        data = data[: self.limit - self.size]
+        self.size += len(data)
+        self.parser.feed(self.decoder.decode(data))
+
+    def close(self) -> None:
+        self.parser.feed(self.decoder.decode(b"", final=True))
+
+    def value(self) -> str:
+        return self.parser.text()
+
+
+def _read_headers(reader: _LineReader) -> tuple[EmailHeaders, bool]:
+    """Читает блок заголовков до пустой строки. Второй элемент — False, если поток кончился."""
+    buf = []
+    size = 0
+    while True:
+        line, _ = reader.readline()
+        if not line:
+            return BytesHeaderParser(policy=policy.default).parsebytes(b"".join(buf)), False
+        if line in (b"\r\n", b"\n"):
+            break
+        if size < LINE_LIMIT * 4:
+            buf.append(line)
+            size += len(line)
+    return BytesHeaderParser(policy=policy.default).parsebytes(b"".join(buf)), True
+
+
+def _boundary_hit(line: bytes, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+    if not line.startswith(b"--"):
+        return None
+    stripped = line.rstrip()
+    for b in reversed(boundaries):
+        if stripped == b"--" + b:
+            return b, False
+        if stripped == b"--" + b + b"--":
+            return b, True
+    return None
+
+
+class _MimeWalker:
+    def __init__(self, fp: BinaryIO, storage_dir: str, text_limit: int):
+        self.reader = _LineReader(fp)
+        self.storage_dir = storage_dir
+        self.text_limit = text_limit
+        self.plain: tuple[bytes, str] | None = None
+        self.html: str | None = None
+        self.attachments: list[dict] = []
+
+    def walk(self, headers: EmailHeaders, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+        """Разбирает одну часть. Возвращает встреченную границу родителя (или None на EOF)."""
+        if headers.get_content_maintype() == "multipart":
+            boundary = headers.get_param("boundary")
+            if boundary:
+                return self._walk_multipart(str(boundary).encode("ascii", "replace"), boundaries)
+        return self._walk_leaf(headers, boundaries)
+
+    def _skip_until(self, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+        while True:
+            line, line_start = self.reader.readline()
+            if not line:
+                return None
+            hit = _boundary_hit(line, boundaries) if line_start else None
+            if hit:
+                return hit
+
+    def _walk_multipart(self, boundary: bytes, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+        inner = boundaries + [boundary]
+        hit = self._skip_until(inner)  # преамбула
+        while hit and hit[0] == boundary and not hit[1]:
+            headers, more = _read_headers(self.reader)
+            if not more:
+                return None
+            hit = self.walk(headers, inner)
+        if hit and hit[0] == boundary:
+            # закрывающая граница — дальше эпилог до границы родителя
+            return self._skip_until(boundaries) if boundaries else None
+        return hit
+
+    def _open_sink(self, headers: EmailHeaders):
+        ctype = headers.get_content_type()
+        disposition = (headers.get_content_disposition() or "").lower()
+        filename = headers.get_filename() or ""
+        if ctype in ("text/plain", "text/html") and disposition != "attachment" and not filename:
+            if ctype == "text/plain" and self.plain is None:
+                return _TextSink(self.text_limit), ctype, filename
+            if ctype == "text/html" and self.html is None:
+                return _HtmlSink(self.text_limit, headers.get_content_charset() or "utf-8"), ctype, filename
+        if not filename:
+            ext = {"message/rfc822": ".eml", "text/plain": ".txt", "text/html": ".html"}.get(ctype, "")
+            filename = f"part-{len(self.attachments) + 1}{ext}"
+        return _FileSink(self.storage_dir, filename), ctype, filename
+
+    def _walk_leaf(self, headers: EmailHeaders, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+        sink, ctype, filename = self._open_sink(headers)
+        decoder = _decoder(headers.get("Content-Transfer-Encoding", ""))
+        pending_eol = b""
+        hit = None
+        try:
+            while True:
+                line, line_start = self.reader.readline()
+                if not line:
+                    break
+                if line_start:
+                    hit = _boundary_hit(line, boundaries)
+                    if hit:
+                        break
+                # перевод строки перед границей принадлежит границе, поэтому пишем его с задержкой
+                if pending_eol:
+                    sink.write(decoder.feed(pending_eol))
+                    pending_eol = b""
+                if line.endswith(b"\r\n"):
+                    line, pending_eol = line[:-2], b"\r\n"
+                elif line.endswith(b"\n"):
+                    line, pending_eol = line[:-1], b"\n"
+                sink.write(decoder.feed(line))
+            if not boundaries and pending_eol:
+                sink.write(decoder.feed(pending_eol))
+            sink.write(decoder.flush())
+        finally:
+            sink.close()
+
+        if isinstance(sink, _TextSink):
+            self.plain = (sink.value(), headers.get_content_charset() or "utf-8")
+        elif isinstance(sink, _HtmlSink):
+            self.html = sink.value()
+        else:
+            self.attachments.append({
+                "filename": filename[:512],
+                "mime_type": ctype[:128],
+                "size_bytes": sink.size,
+                "storage_path": sink.path,
+            })
+        return hit
+
+
+def _decode(data: bytes, charset: str) -> str:
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def parse_mime_stream(fp: BinaryIO, storage_dir: str | None = None, text_limit: int | None = None) -> dict:
+    """
+    Разбирает письмо из бинарного потока.
+    Возвращает поля для create_ticket_from_inbound + список вложений (уже лежат на диске).
+    """
+    walker = _MimeWalker(fp, storage_dir or settings.ATTACHMENTS_DIR, text_limit or settings.MIME_TEXT_LIMIT)
+    headers, more = _read_headers(walker.reader)
+    try:
+        if more:
+            walker.walk(headers, [])
+    except Exception:
+        remove_attachment_files(walker.attachments)
+        raise
+
+    if walker.plain is not None:
+        text = _decode(*walker.plain)
+    elif walker.html is not None:
+        text = walker.html
+    else:
+        text = ""
+
+    from_email = parseaddr(str(headers.get("From", "")))[1]
+    reply_to = parseaddr(str(headers.get("Reply-To", "")))[1]
+    to_email = ", ".join(addr for _, addr in getaddresses([str(v) for v in headers.get_all("To", [])]) if addr)
+
+    return {
+        "subject": str(headers.get("Subject", ""))[:512],
+        "customer_email": reply_to or from_email,
+        "from_email": from_email,
+        "to_email": to_email,
+        "cleaned_text": text.strip(),
+        "raw_headers": {h: str(headers[h]) for h in KEPT_HEADERS if headers[h] is not None},
+        "attachments": walker.attachments,
+    }
+
+
+def remove_attachment_files(attachments: list[dict]) -> None:
+    for a in attachments:
+        try:
+            os.remove(a["storage_path"])
+        except OSError:
+            pass
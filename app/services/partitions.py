@@ -0,0 +1,99 @@
+"""
+Monthly range partitions of messages and ai_runs (by created_at, UTC months).
+
+Partitions are named <table>_pYYYY_MM. <table>_default, created together with the table
+(app.db.models), takes rows no monthly partition covers: inserts before ensure_partitions()
+first ran, and rows of still-open tickets that the archiver (app.services.archive) kept back
+from an archived month. Creating a month that already has rows in the default partition
+moves them into the new partition first.
+"""
+
+import re
+from datetime import date, datetime, timezone
+from sqlalchemy import Table, text as sql_text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import Message, AiRun
+
+PARTITIONED: tuple[Table, ...] = (Message.__table__, AiRun.__table__)
+_NAME_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def add_months(month: date, n: int) -> date:
+    years, m = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, m + 1, 1)
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    lo = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    nxt = add_months(month, 1)
+    return lo, datetime(nxt.year, nxt.month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def copy_columns(table: Table) -> list[str]:
+    """Columns to copy between tables / files; generated ones (search_tsv) are recomputed by Postgres."""
+    return [c.name for c in table.c if c.computed is None]
+
+
+def list_partitions(db: Session, table: str) -> list[date]:
+    """Months that have a partition of `table`."""
+    names = db.scalars(
+        sql_text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    )
+    months = []
+    for name in names:
+        m = _NAME_RE.match(name)
+        if m and m["table"] == table:
+            months.append(date(int(m["year"]), int(m["month"]), 1))
+    return sorted(months)
+
+
+def create_partition(db: Session, table: Table, month: date) -> bool:
+    """Creates the month's partition unless it exists. Runs in the caller's transaction. Returns True if created."""
+    if month in list_partitions(db, table.name):
+        return False
+    name = partition_name(table.name, month)
+    lo, hi = month_bounds(month)
+    bounds = f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    params = {"lo": lo, "hi": hi}
+    default = f"{table.name}_default"
+    waiting = db.scalar(
+        sql_text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= :lo AND created_at < :hi)"), params
+    )
+    if not waiting:
+        db.execute(sql_text(f"CREATE TABLE {name} PARTITION OF {table.name} {bounds}"))
+        return True
+    # the default partition may not keep rows of a range some partition covers: move them over, then attach
+    cols = ", ".join(copy_columns(table))
+    db.execute(sql_text(f"CREATE TABLE {name} (LIKE {table.name} INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    db.execute(
+        sql_text(
+            f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :lo AND created_at < :hi RETURNING {cols}) "
+            f"INSERT INTO {name} ({cols}) SELECT {cols} FROM moved"
+        ),
+        params,
+    )
+    db.execute(sql_text(f"ALTER TABLE {table.name} ATTACH PARTITION {name} {bounds}"))
+    return True
+
+
+def ensure_partitions(db: Session, ahead: int | None = None, today: date | None = None) -> list[str]:
+    """Partitions for this month and `ahead` (PARTITION_MONTHS_AHEAD) months after it; commits. Returns created names."""
+    ahead = settings.PARTITION_MONTHS_AHEAD if ahead is None else ahead
+    first = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    created = []
+    for table in PARTITIONED:
+        for i in range(ahead + 1):
+            month = add_months(first, i)
+            if create_partition(db, table, month):
+                created.append(partition_name(table.name, month))
+    db.commit()
+    return created
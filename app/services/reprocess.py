@@ -0,0 +1,222 @@
+"""
+Re-analysis of historical tickets with new heuristics.
+
+Tickets are streamed in id order together with their first inbound message,
+analyze_message (and, with_kb, the KB search) runs in a pool of spawned processes,
+results are bulk-written as new AiRun rows tagged with the run's model_version.
+Progress (last_ticket_id) is committed after every chunk, so an interrupted run
+resumes where it stopped. A run executes only while it holds its advisory lock:
+a second start of the same run (resume while it is running) does nothing, and a
+run whose process died can be resumed even though its status still says running.
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, select, insert, update, bindparam, func, text as sql_text
+from app.core.config import settings
+from app.db.models import Ticket, Message, MessageDirection, AiRun, ReprocessRun
+from app.services.ai import analyze_many
+from app.services.kb import search_kb
+from app.services.rules import RuleEngine, refresh_rules
+from app.services.analytics import mark_dirty
+
+log = logging.getLogger("reprocess")
+
+_LOCK_NS = 0x5250  # pg_try_advisory_lock(_LOCK_NS, run_id): the process executing the run
+
+_worker_engine: RuleEngine | None = None
+_worker_session: sessionmaker | None = None
+
+
+def _init_worker(rules: list[tuple[str, str, str, int]], kb_database_url: str | None) -> None:
+    global _worker_engine, _worker_session
+    _worker_engine = RuleEngine(rules)
+    if kb_database_url:
+        _worker_session = sessionmaker(bind=create_engine(kb_database_url, pool_size=1), autoflush=False)
+
+
+def _analyze(items: list[tuple[int, str, str]]) -> list[tuple[int, dict, list[dict]]]:
+    results = analyze_many([(subject, text) for _, subject, text in items], _worker_engine)
+    kb_hits = [[] for _ in items]
+    if _worker_session is not None:
+        with _worker_session() as db:
+            kb_hits = [search_kb(db, query=f"{subject}\n{text}"[:800], limit=5) for _, subject, text in items]
+    return [(ticket_id, ai, hits) for (ticket_id, _, _), ai, hits in zip(items, results, kb_hits)]
+
+
+def start_run(db: Session, model_version: str, update_tickets: bool = False, with_kb: bool = False) -> ReprocessRun:
+    run = ReprocessRun(
+        model_version=model_version,
+        status="running",
+        update_tickets=update_tickets,
+        with_kb=with_kb,
+        total=int(db.scalar(select(func.count()).select_from(Ticket)) or 0),
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def run_in_progress(db: Session, run_id: int) -> bool:
+    """True while some process executes the run (holds its lock); ends the transaction."""
+    free = db.scalar(sql_text("SELECT pg_try_advisory_xact_lock(:ns, :id)"), {"ns": _LOCK_NS, "id": run_id})
+    db.rollback()
+    return not free
+
+
+@contextmanager
+def _run_lock(db: Session, run_id: int) -> Iterator[bool]:
+    """Session-level lock of the run on a connection of its own (db commits per chunk), held for the block."""
+    with db.get_bind().connect() as conn:
+        held = conn.scalar(sql_text("SELECT pg_try_advisory_lock(:ns, :id)"), {"ns": _LOCK_NS, "id": run_id})
+        conn.commit()
+        try:
+            yield held
+        finally:
+            if held:
+                conn.execute(sql_text("SELECT pg_advisory_unlock(:ns, :id)"), {"ns": _LOCK_NS, "id": run_id})
+                conn.commit()
+
+
+def fetch_chunk(db: Session, after_id: int, limit: int) -> list[tuple[int, str, str, int]]:
+    """(ticket_id, subject, first inbound text, current confidence) for the next `limit` tickets."""
+    first_msg = (
+        select(Message.ticket_id, Message.subject, Message.cleaned_text)
+        .where(Message.ticket_id > after_id, Message.direction == MessageDirection.inbound)
+        .distinct(Message.ticket_id)
+        .order_by(Message.ticket_id, Message.id)
+        .limit(limit)
+        .subquery()
+    )
+    rows = db.execute(
+        select(first_msg.c.ticket_id, first_msg.c.subject, first_msg.c.cleaned_text, Ticket.ai_confidence)
+        .join(Ticket, Ticket.id == first_msg.c.ticket_id)
+        .order_by(first_msg.c.ticket_id)
+    ).all()
+    return [tuple(r) for r in rows]
+
+
+_ticket_update = (
+    update(Ticket.__table__)
+    .where(Ticket.__table__.c.id == bindparam("b_id"), Ticket.__table__.c.ai_confidence < bindparam("b_confidence"))
+    .values(
+        category=bindparam("b_category"),
+        priority=bindparam("b_priority"),
+        ai_summary=bindparam("b_summary"),
+        ai_draft_reply=bindparam("b_draft"),
+        ai_confidence=bindparam("b_confidence"),
+    )
+)
+_ticket_update_with_kb = _ticket_update.values(ai_suggested_actions=bindparam("b_actions"))
+
+
+def write_results(db: Session, run: ReprocessRun, results: list[tuple[int, dict, list[dict]]], source: dict[int, tuple]) -> int:
+    """
+    results: (ticket_id, analysis, KB hits) from the pool; source: ticket_id -> (subject, text,
+    current ai_confidence). Returns number of updated tickets.
+    """
+    runs = []
+    updates = []
+    for ticket_id, ai, kb_hits in results:
+        current = source[ticket_id][2]
+        runs.append({
+            "ticket_id": ticket_id,
+            "model_versions": {**ai.get("model_versions", {}), "run": run.model_version},
+            "outputs": {
+                "summary": ai["summary"],
+                "draft_reply": ai["draft_reply"],
+                "entities": ai.get("entities", {}),
+                "missing_info": ai.get("missing_info", []),
+                "kb_hits": kb_hits,
+            },
+            "confidence": int(ai["confidence"]),
+        })
+        if run.update_tickets and int(ai["confidence"]) > current:
+            row = {
+                "b_id": ticket_id,
+                "b_category": ai["category"],
+                "b_priority": ai["priority"],
+                "b_summary": ai["summary"],
+                "b_draft": ai["draft_reply"],
+                "b_confidence": int(ai["confidence"]),
+            }
+            if run.with_kb:
+                row["b_actions"] = {
+                    **ai.get("suggested_actions", {}),
+                    "kb_hits": [{"id": h["id"], "title": h["title"], "rank": float(h["rank"]), "snippet": h["snippet"]} for h in kb_hits],
+                    "entities": ai.get("entities", {}),
+                }
+            updates.append(row)
+
+    if runs:
+        db.execute(insert(AiRun), runs)
+    if updates:
+        # the WHERE ai_confidence < new re-checks at write time
+        db.connection().execute(_ticket_update_with_kb if run.with_kb else _ticket_update, updates)
+        mark_dirty(db, [u["b_id"] for u in updates])
+    return len(updates)
+
+
+def run_reprocess(db: Session, run_id: int, workers: int | None = None, chunk: int | None = None, progress=None) -> ReprocessRun:
+    """Executes the run from last_ticket_id on; returns it as is if another process is executing it."""
+    with _run_lock(db, run_id) as held:
+        run = db.get(ReprocessRun, run_id)
+        if run is None:
+            raise ValueError("Reprocess run not found")
+        if not held:
+            log.warning("reprocess run %s is already in progress", run_id)
+            return run
+        return _execute(db, run, workers, chunk, progress)
+
+
+def _execute(db: Session, run: ReprocessRun, workers: int | None, chunk: int | None, progress) -> ReprocessRun:
+    run_id = run.id
+    workers = workers or settings.REPROCESS_WORKERS or os.cpu_count() or 1
+    chunk = chunk or settings.REPROCESS_CHUNK
+
+    run.status = "running"
+    run.error = ""
+    db.commit()
+
+    rules = refresh_rules(db, force=True).rules
+    kb_url = db.get_bind().url.render_as_string(hide_password=False) if run.with_kb else None
+    try:
+        # spawn, not fork: the API starts runs from a thread, and a forked child would inherit its locks and pooled connections
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(rules, kb_url),
+        ) as pool:
+            while True:
+                rows = fetch_chunk(db, run.last_ticket_id, chunk)
+                if not rows:
+                    break
+                items = [(tid, subject, text) for tid, subject, text, _ in rows]
+                source = {tid: (subject, text, conf) for tid, subject, text, conf in rows}
+
+                step = max(len(items) // (workers * 4), 50)
+                results = []
+                for part in pool.map(_analyze, [items[i:i + step] for i in range(0, len(items), step)]):
+                    results.extend(part)
+
+                run.updated_tickets += write_results(db, run, results, source)
+                run.processed += len(rows)
+                run.last_ticket_id = rows[-1][0]
+                db.commit()
+                if progress:
+                    progress(run)
+        run.status = "done"
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        run = db.get(ReprocessRun, run_id)
+        run.status = "failed"
+        run.error = f"{type(e).__name__}: {e}"[:2000]
+        db.commit()
+        log.exception("reprocess run %s failed", run_id)
+    return run
@@ -0,0 +1,114 @@
+"""
+Keyword rules for analyze_message (category / priority / os).
+
+Rules live in the ai_rules table (defaults below when it is empty) and are compiled
+into one regex, so a message is scanned once no matter how many keywords there are.
+Within a kind the matched rule with the smallest `order` wins.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from app.db.models import AiRule
+
+RULES_RELOAD_SECONDS = 60
+
+# (kind, value, keyword, order) — reproduces the original hardcoded heuristics
+DEFAULT_RULES: list[tuple[str, str, str, int]] = [
+    *[("category", "billing", k, 10) for k in ("оплат", "платеж", "billing")],
+    *[("category", "login", k, 20) for k in ("не могу войти", "login", "парол")],
+    *[("category", "bug", k, 30) for k in ("ошибк", "error", "exception")],
+    # "low" is checked after "high" in the old code, so it wins
+    *[("priority", "low", k, 10) for k in ("вопрос", "как сделать", "how to")],
+    *[("priority", "high", k, 20) for k in ("срочно", "urgent", "не работает", "down", "прод", "production")],
+    ("os", "Windows", "windows", 10),
+    *[("os", "macOS", k, 20) for k in ("mac", "os x")],
+    ("os", "Linux", "linux", 30),
+]
+
+
+def _trie_pattern(keywords: list[str]) -> str:
+    """Alternation folded into a prefix trie, so each text position fails on its first char."""
+    trie: dict = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # greedy: the longer keyword is tried first, the shorter one is a prefix of it
+        return f"(?:{body})?" if end else body
+
+    return build(trie)
+
+
+class RuleEngine:
+    def __init__(self, rules: list[tuple[str, str, str, int]]):
+        self.rules = sorted(rules)
+        self.by_keyword: dict[str, list[tuple[str, str, int]]] = {}
+        for kind, value, keyword, order in self.rules:
+            self.by_keyword.setdefault(keyword.lower(), []).append((kind, value, order))
+
+        keywords = sorted(self.by_keyword, key=len, reverse=True)
+        # lookahead => matches may overlap; at one position the longest keyword wins,
+        # and shorter keywords matching there are necessarily its prefixes
+        self.prefixes = {k: [p for p in keywords if p != k and k.startswith(p)] for k in keywords}
+        self.regex = re.compile("(?=(" + _trie_pattern(keywords) + "))") if keywords else None
+        self.version = hashlib.sha1(repr(self.rules).encode()).hexdigest()[:12]
+
+    def match(self, low: str) -> dict[str, str]:
+        """Single pass over lowercased text -> {kind: winning value}."""
+        best: dict[str, tuple[int, str]] = {}
+        if self.regex is None:
+            return {}
+        for kw in set(self.regex.findall(low)):
+            for k in (kw, *self.prefixes[kw]):
+                for kind, value, order in self.by_keyword[k]:
+                    if kind not in best or order < best[kind][0]:
+                        best[kind] = (order, value)
+        return {kind: value for kind, (_, value) in best.items()}
+
+
+_lock = threading.Lock()
+_engine = RuleEngine(DEFAULT_RULES)
+_loaded_at: float | None = None  # monotonic time of the last load; None: never loaded
+
+
+def get_engine() -> RuleEngine:
+    return _engine
+
+
+def set_rules(rules: list[tuple[str, str, str, int]]) -> RuleEngine:
+    global _engine
+    engine = RuleEngine(rules or DEFAULT_RULES)
+    if engine.version != _engine.version:
+        _engine = engine
+    return _engine
+
+
+def load_rules(db: Session) -> list[tuple[str, str, str, int]]:
+    rows = db.execute(
+        select(AiRule.kind, AiRule.value, AiRule.keyword, AiRule.order).where(AiRule.active.is_(True))
+    ).all()
+    return [tuple(r) for r in rows]
+
+
+def refresh_rules(db: Session, force: bool = False) -> RuleEngine:
+    """Reloads ai_rules at most once per RULES_RELOAD_SECONDS."""
+    global _loaded_at
+    if not force and _loaded_at is not None and time.monotonic() - _loaded_at < RULES_RELOAD_SECONDS:
+        return _engine
+    with _lock:
+        if force or _loaded_at is None or time.monotonic() - _loaded_at >= RULES_RELOAD_SECONDS:
+            set_rules(load_rules(db))
+            _loaded_at = time.monotonic()
+    return _engine
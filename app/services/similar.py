@@ -0,0 +1,150 @@
+"""
+Similar solved tickets (MinHash + LSH).
+
+A ticket moving to `solved` gets a MinHash signature of its subject, summary and
+first inbound text (similar_signatures) and SIMILAR_BANDS band hashes (similar_buckets).
+A query hashes its text the same way; tickets sharing any (band, bucket) are candidates,
+those are re-ranked by estimated Jaccard from the stored signatures. The cost depends
+on bucket sizes, not on the number of historical tickets.
+"""
+
+import hashlib
+import random
+import re
+from array import array
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import select, delete, insert, func, or_, tuple_
+from app.core.config import settings
+from app.db.session import run_blocking
+from app.db.models import Ticket, Message, MessageDirection, DeliveryStatus, SimilarSignature, SimilarBucket
+
+_PRIME = (1 << 61) - 1
+_TOKEN_RE = re.compile(r"\w{3,}")
+TEXT_LIMIT = 20_000
+
+# fixed seed: signatures must stay comparable across processes and restarts
+_rng = random.Random(1408)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(settings.SIMILAR_NUM_PERM)]
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def minhash(text: str) -> list[int] | None:
+    tokens = {_hash64(t.encode()) for t in _TOKEN_RE.findall(text[:TEXT_LIMIT].lower())}
+    if not tokens:
+        return None
+    return [min((a * h + b) % _PRIME for h in tokens) for a, b in _PERMS]
+
+
+def lsh_buckets(signature: list[int]) -> list[tuple[int, int]]:
+    rows = len(signature) // settings.SIMILAR_BANDS
+    return [
+        # signed, so it fits BIGINT
+        (band, _hash64(array("Q", signature[band * rows:(band + 1) * rows]).tobytes()) - (1 << 63))
+        for band in range(settings.SIMILAR_BANDS)
+    ]
+
+
+def jaccard(a: list[int], b: list[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _ticket_texts(db: Session, ticket_ids: list[int]) -> dict[int, str]:
+    first_inbound = (
+        select(Message.cleaned_text)
+        .where(Message.ticket_id == Ticket.id, Message.direction == MessageDirection.inbound)
+        .order_by(Message.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    rows = db.execute(select(Ticket.id, Ticket.subject, Ticket.ai_summary, first_inbound).where(Ticket.id.in_(ticket_ids)))
+    return {tid: "\n".join(filter(None, (subject, summary, text))) for tid, subject, summary, text in rows}
+
+
+def index_tickets(db: Session, ticket_ids: list[int]) -> int:
+    """(Re)indexes the given tickets inside the caller's transaction. Returns number indexed."""
+    if not ticket_ids:
+        return 0
+    texts = _ticket_texts(db, ticket_ids)
+    db.execute(delete(SimilarBucket).where(SimilarBucket.ticket_id.in_(ticket_ids)))
+    db.execute(delete(SimilarSignature).where(SimilarSignature.ticket_id.in_(ticket_ids)))
+
+    signatures = []
+    buckets = []
+    for tid, sig in run_blocking(lambda: [(tid, minhash(text)) for tid, text in texts.items()]):
+        if sig is None:
+            continue
+        signatures.append({"ticket_id": tid, "signature": array("Q", sig).tobytes()})
+        buckets.extend({"band": band, "bucket": bucket, "ticket_id": tid} for band, bucket in lsh_buckets(sig))
+    if signatures:
+        db.execute(insert(SimilarSignature), signatures)
+        db.execute(insert(SimilarBucket), buckets)
+    return len(signatures)
+
+
+def find_similar(db: Session, text: str, k: int | None = None, exclude_id: int | None = None) -> list[dict]:
+    """Top-k solved tickets for `text` with their last sent reply: two statements."""
+    k = k or settings.SIMILAR_TOP_K
+    sig = run_blocking(minhash, text)
+    if sig is None:
+        return []
+
+    hits = (
+        select(SimilarBucket.ticket_id, func.count().label("hits"))
+        .where(tuple_(SimilarBucket.band, SimilarBucket.bucket).in_(lsh_buckets(sig)))
+        .group_by(SimilarBucket.ticket_id)
+        .order_by(func.count().desc())
+        .limit(settings.SIMILAR_CANDIDATES)
+    )
+    if exclude_id is not None:
+        hits = hits.where(SimilarBucket.ticket_id != exclude_id)
+    hits = hits.subquery()
+    candidates = db.execute(
+        select(SimilarSignature.ticket_id, SimilarSignature.signature)
+        .join(hits, hits.c.ticket_id == SimilarSignature.ticket_id)
+    ).all()
+
+    scored = run_blocking(sorted, ((jaccard(sig, array("Q", raw).tolist()), tid) for tid, raw in candidates), reverse=True)
+    scored = [(score, tid) for score, tid in scored[:k] if score >= settings.SIMILAR_MIN_SCORE]
+    if not scored:
+        return []
+
+    sent = aliased(Message)
+    reply_id = (
+        select(func.max(sent.id))
+        .where(
+            sent.ticket_id == Ticket.id,
+            sent.direction == MessageDirection.outbound,
+            or_(sent.delivery_status.is_(None), sent.delivery_status != DeliveryStatus.failed),
+        )
+        .correlate(Ticket)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(Ticket.id, Ticket.subject, Message.id, Message.subject, Message.cleaned_text, Message.created_at)
+        .outerjoin(Message, Message.id == reply_id)
+        .where(Ticket.id.in_([tid for _, tid in scored]))
+    ).all()
+    by_id = {r[0]: r for r in rows}
+
+    result = []
+    for score, tid in scored:
+        if tid not in by_id:
+            continue
+        _, subject, msg_id, msg_subject, msg_text, msg_at = by_id[tid]
+        result.append({
+            "ticket_id": tid,
+            "subject": subject,
+            "similarity": round(score, 4),
+            "reply": {"message_id": msg_id, "subject": msg_subject, "text": msg_text, "created_at": msg_at} if msg_id else None,
+        })
+    return result
+
+
+def similar_to_ticket(db: Session, ticket_id: int, k: int | None = None) -> list[dict]:
+    text = _ticket_texts(db, [ticket_id]).get(ticket_id)
+    if text is None:
+        raise ValueError("Ticket not found")
+    return find_similar(db, text, k, exclude_id=ticket_id)
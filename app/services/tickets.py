@@ -1,8 +1,78 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import re
+import time
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
-from app.db.models import Ticket, Message, MessageDirection, TicketStatus, AiRun
-from app.services.ai import analyze_message
-from app.services.kb import search_kb
+from sqlalchemy import select, func, insert, update, case, tuple_, cast, desc, union, text as sql_text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.metrics import STAGE, stage
+from app.db.session import run_blocking
+from app.db.models import (
+    Ticket, Message, MessageDirection, TicketStatus, Attachment, AiRun, EnrichmentJob, JobStatus, OutboxEmail, DeliveryStatus,
+)
+from app.services.email import new_message_id
+from app.services.mime import remove_attachment_files
+from app.services.similar import index_tickets
+from app.services.analytics import mark_dirty
+from app.services.cleaner import clean_text
+from app.services.enrichment import enqueue_enrichment, enrich_ticket, build_enrichment
+
+log = logging.getLogger("tickets")
+
+_MSGID_RE = re.compile(r"<[^<>\s]+>")
+MAX_REFS = 50
+# a customer reply puts these back into the queue
+REOPEN_STATUSES = (TicketStatus.needs_info, TicketStatus.waiting_customer, TicketStatus.solved)
+
+def _header(headers: dict, name: str) -> str:
+    name = name.lower()
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return str(v or "")
+    return ""
+
+def thread_ids(raw_headers: dict) -> tuple[str | None, list[str]]:
+    """(Message-ID, parent candidates) as "<id>"; In-Reply-To first, then References newest first."""
+    raw_id = _header(raw_headers, "Message-ID").strip()
+    found = _MSGID_RE.findall(raw_id)
+    message_id = found[0] if found else (f"<{raw_id}>" if raw_id and " " not in raw_id else None)
+    refs = _MSGID_RE.findall(_header(raw_headers, "In-Reply-To")) + _MSGID_RE.findall(_header(raw_headers, "References"))[::-1]
+    refs = [r for r in dict.fromkeys(refs) if r != message_id][:MAX_REFS]
+    return message_id, refs
+
+def known_message_ids(db: Session, ids: list[str]) -> dict[str, int]:
+    """Message-ID -> ticket_id for those already stored (one probe of ix_messages_message_id_header per partition)."""
+    if not ids:
+        return {}
+    return dict(db.execute(
+        select(Message.message_id_header, Message.ticket_id).where(Message.message_id_header.in_(ids))
+    ).all())
+
+def lock_message_ids(db: Session, ids: list[str]) -> None:
+    """
+    Transaction-level advisory locks on Message-IDs: ingest of the same Message-ID waits for
+    the first one to commit, then finds it in known_message_ids(). Stands in for the unique
+    index messages cannot have (partitioned by created_at), so every path that stores a
+    received Message-ID takes it: ingest here and archive restore (app.services.archive).
+    Outbound ids are new make_msgid() values. Keys are taken in sorted order.
+    """
+    keys = sorted({int.from_bytes(hashlib.blake2b(i.encode(), digest_size=8).digest(), "big", signed=True) for i in ids if i})
+    if keys:
+        db.execute(
+            sql_text("SELECT pg_advisory_xact_lock(k) FROM unnest(CAST(:keys AS bigint[])) WITH ORDINALITY AS t(k, n) ORDER BY n"),
+            {"keys": keys},
+        )
+
+def _message_text(text: str, keep_raw: bool | None) -> dict:
+    cleaned = run_blocking(clean_text, text)
+    keep = settings.KEEP_RAW_TEXT if keep_raw is None else keep_raw
+    return {"cleaned_text": cleaned, "raw_text": text if keep and cleaned != text else None}
 
 def create_ticket_from_inbound(
     db: Session,
@@ -12,10 +82,38 @@ def create_ticket_from_inbound(
     to_email: str,
     cleaned_text: str,
     raw_headers: dict,
+    attachments: list[dict] | None = None,
+    commit: bool = True,
+    keep_raw: bool | None = None,
 ) -> Ticket:
-    ticket = Ticket(subject=subject, customer_email=customer_email, status=TicketStatus.new)
-    db.add(ticket)
-    db.flush()
+    """
+    New ticket, or — for a reply (In-Reply-To/References hit a stored Message-ID) — a message
+    appended to the existing ticket without another enrichment. A re-delivered Message-ID is a no-op.
+    The text is stored, analyzed and indexed as clean_text() leaves it.
+    """
+    started = time.perf_counter()
+    message_id, refs = thread_ids(raw_headers)
+    lock_message_ids(db, [message_id])
+    known = known_message_ids(db, [message_id, *refs] if message_id else refs)
+    if message_id in known:
+        remove_attachment_files(attachments or [])
+        return db.get(Ticket, known[message_id])
+    parent_id = next((known[r] for r in refs if r in known), None)
+
+    if parent_id is not None:
+        ticket = db.get(Ticket, parent_id, with_for_update=True)
+        if ticket.status in REOPEN_STATUSES:
+            ticket.status = TicketStatus.new
+        ticket.updated_at = func.now()
+    else:
+        ticket = Ticket(
+            subject=subject,
+            customer_email=customer_email,
+            status=TicketStatus.new,
+            enrichment_status=JobStatus.pending,
+        )
+        db.add(ticket)
+        db.flush()
 
     msg = Message(
         ticket_id=ticket.id,
@@ -23,99 +121,483 @@ def create_ticket_from_inbound(
         from_email=from_email,
         to_email=to_email,
         subject=subject,
-        cleaned_text=cleaned_text,
+        **_message_text(cleaned_text, keep_raw),
         raw_headers=raw_headers or {},
+        message_id_header=message_id,
+        ref_ids=refs,
     )
     db.add(msg)
     db.flush()
 
-    # Run AI analysis (MVP)
-    ai = analyze_message(subject, cleaned_text)
-
-    # KB search (Variant 3)
-    kb_hits = search_kb(db, query=f"{subject}\n{cleaned_text}"[:800], limit=5)
-
-    ticket.category = ai["category"]
-    ticket.product = ai.get("product", "")
-    ticket.priority = ai["priority"]
-    ticket.ai_summary = ai["summary"]
-    ticket.ai_draft_reply = ai["draft_reply"]
-    ticket.ai_suggested_actions = {
-        **ai.get("suggested_actions", {}),
-        "kb_hits": [{"id": h["id"], "title": h["title"], "rank": float(h["rank"]), "snippet": h["snippet"]} for h in kb_hits],
-        "entities": ai.get("entities", {}),
-    }
-    ticket.ai_confidence = int(ai["confidence"])
-
-    run = AiRun(
-        ticket_id=ticket.id,
-        model_versions=ai.get("model_versions", {}),
-        outputs={
-            "summary": ai["summary"],
-            "draft_reply": ai["draft_reply"],
-            "entities": ai.get("entities", {}),
-            "missing_info": ai.get("missing_info", []),
-            "kb_hits": kb_hits,
-        },
-        confidence=int(ai["confidence"]),
-    )
-    db.add(run)
+    # files are already spooled to disk by app.services.mime
+    for a in attachments or []:
+        db.add(Attachment(
+            message_id=msg.id,
+            filename=a.get("filename", ""),
+            mime_type=a.get("mime_type", ""),
+            size_bytes=a.get("size_bytes", 0),
+            storage_path=a.get("storage_path", ""),
+        ))
 
-    # status suggestion
-    if ai.get("suggested_actions", {}).get("next_step") == "request_info":
-        ticket.status = TicketStatus.needs_info
+    db.flush()
+    mark_dirty(db, [ticket.id])
+    STAGE.observe("ingest_insert", value=time.perf_counter() - started)
 
-    db.commit()
+    # AI/KB enrichment runs out of band (app.workers.enrichment_worker); replies don't re-run it
+    if parent_id is not None:
+        pass
+    elif settings.ENRICH_INLINE:
+        enrich_ticket(db, ticket, msg)
+    else:
+        enqueue_enrichment(db, ticket.id, msg.id)
+
+    if not commit:
+        # caller (e.g. IMAP worker) commits a whole batch at once
+        db.flush()
+        return ticket
+
+    with stage("ingest_commit"):
+        db.commit()
     db.refresh(ticket)
     return ticket
 
-def list_tickets(db: Session, limit: int, offset: int, status: str | None, priority: str | None, q: str | None):
-    stmt = select(Ticket)
+def _bulk_insert_inbound(db: Session, items: list[dict], enrich: str) -> list[int]:
+    """
+    Multi-row INSERT ... RETURNING for tickets, messages and AI runs/jobs; ids come back in input order.
+    Threading as in create_ticket_from_inbound: re-deliveries map to the stored ticket, replies
+    (also to a message earlier in the same batch) are appended to their ticket without enrichment.
+    """
+    threads = [thread_ids(it.get("raw_headers") or {}) for it in items]
+    lock_message_ids(db, [mid for mid, _ in threads])
+    known = known_message_ids(db, list({i for mid, refs in threads for i in (mid, *refs) if i}))
+
+    # per item: ("ticket", ticket_id) existing, ("item", j) same ticket as item j, or None — new ticket
+    owner: list[tuple[str, int] | None] = []
+    store: list[bool] = []  # False for re-deliveries
+    seen: dict[str, int] = {}
+    for j, (mid, refs) in enumerate(threads):
+        if mid in known:
+            owner.append(("ticket", known[mid]))
+            store.append(False)
+            continue
+        if mid in seen:
+            owner.append(owner[seen[mid]] or ("item", seen[mid]))
+            store.append(False)
+            continue
+        parent = next((("ticket", known[r]) if r in known else owner[seen[r]] or ("item", seen[r])
+                       for r in refs if r in known or r in seen), None)
+        owner.append(parent)
+        store.append(True)
+        if mid:
+            seen[mid] = j
+
+    texts = run_blocking(
+        lambda: {j: _message_text(it["cleaned_text"], it.get("keep_raw")) for j, it in enumerate(items) if store[j]}
+    )
+    new = [j for j, o in enumerate(owner) if o is None]
+    ticket_rows = []
+    run_rows = []
+    for j in new:
+        it = items[j]
+        row = {
+            "subject": it["subject"],
+            "customer_email": it["customer_email"],
+            "status": TicketStatus.new,
+            "enrichment_status": JobStatus.skipped if enrich == "none" else JobStatus.pending,
+        }
+        if enrich == "inline":
+            ticket_fields, run_fields = build_enrichment(db, it["subject"], texts[j]["cleaned_text"])
+            row.update(ticket_fields)
+            run_rows.append(run_fields)
+        ticket_rows.append(row)
+
+    created = dict(zip(new, db.scalars(insert(Ticket).returning(Ticket.id, sort_by_parameter_order=True), ticket_rows).all())) if new else {}
+    ticket_ids = [created[j] if o is None else (o[1] if o[0] == "ticket" else created[o[1]]) for j, o in enumerate(owner)]
+
+    stored = [j for j in range(len(items)) if store[j]]
+    message_ids = dict(zip(stored, db.scalars(
+        insert(Message).returning(Message.id, sort_by_parameter_order=True),
+        [
+            {
+                "ticket_id": ticket_ids[j],
+                "direction": MessageDirection.inbound,
+                "from_email": items[j]["from_email"],
+                "to_email": items[j]["to_email"],
+                "subject": items[j]["subject"],
+                **texts[j],
+                "raw_headers": items[j].get("raw_headers") or {},
+                "message_id_header": threads[j][0],
+                "ref_ids": threads[j][1],
+            }
+            for j in stored
+        ],
+    ).all())) if stored else {}
+
+    replied = {ticket_ids[j] for j in stored if owner[j] is not None}
+    if replied:
+        db.execute(
+            update(Ticket)
+            .where(Ticket.id.in_(replied))
+            .values(
+                status=case((Ticket.status.in_(REOPEN_STATUSES), TicketStatus.new), else_=Ticket.status),
+                updated_at=func.now(),
+            )
+        )
+
+    if enrich == "inline" and new:
+        db.execute(insert(AiRun), [{"ticket_id": created[j], **run} for j, run in zip(new, run_rows)])
+    elif enrich == "queue" and new:
+        db.execute(
+            insert(EnrichmentJob),
+            [{"ticket_id": created[j], "message_id": message_ids[j], "status": JobStatus.pending} for j in new],
+        )
+    mark_dirty(db, ticket_ids)
+    return ticket_ids
+
+def create_tickets_from_inbound_batch(db: Session, items: list[dict], enrich: str = "queue") -> list[dict]:
+    """
+    Set-based ingest of many inbound messages (backfills, NDJSON endpoint).
+    enrich: "queue" — enrichment jobs, "inline" — analyze now and write AiRun rows, "none" — store only
+    (enrichment_status "skipped").
+    If the set-based insert fails, the chunk is retried item by item in savepoints,
+    so one bad record only fails itself. Returns [{"id": ..., "error": ...}] in input order.
+    """
+    if not items:
+        return []
+    try:
+        ids = _bulk_insert_inbound(db, items, enrich)
+        db.commit()
+        return [{"id": tid, "error": None} for tid in ids]
+    except SQLAlchemyError:
+        db.rollback()
+        log.warning("bulk insert of %s inbound items failed, retrying one by one", len(items), exc_info=True)
+
+    results = []
+    for it in items:
+        try:
+            with db.begin_nested():
+                tid = _bulk_insert_inbound(db, [it], enrich)[0]
+            results.append({"id": tid, "error": None})
+        except SQLAlchemyError as e:
+            results.append({"id": None, "error": str(getattr(e, "orig", None) or e).strip()[:500]})
+    db.commit()
+    return results
+
+def ticket_filters(
+    status: str | None = None,
+    priority: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    q: str | None = None,
+) -> list:
+    """WHERE clauses shared by the ticket list and exports."""
+    where = []
     if status:
-        stmt = stmt.where(Ticket.status == status)
+        where.append(Ticket.status == status)
     if priority:
-        stmt = stmt.where(Ticket.priority == priority)
+        where.append(Ticket.priority == priority)
+    if date_from:
+        where.append(Ticket.created_at >= date_from)
+    if date_to:
+        where.append(Ticket.created_at < date_to)
     if q:
+        # ILIKE is served by the trigram indexes, message text by the GIN tsvector index
         like = f"%{q}%"
-        stmt = stmt.where((Ticket.subject.ilike(like)) | (Ticket.customer_email.ilike(like)))
-
-    total = db.scalar(select(func.count()).select_from(stmt.subquery()))
-    items = db.scalars(stmt.order_by(Ticket.updated_at.desc()).limit(limit).offset(offset)).all()
-    return items, int(total)
-
-def get_ticket_detail(db: Session, ticket_id: int) -> tuple[Ticket | None, list[Message]]:
-    ticket = db.get(Ticket, ticket_id)
-    if not ticket:
-        return None, []
-    msgs = db.scalars(select(Message).where(Message.ticket_id == ticket_id).order_by(Message.created_at.asc())).all()
-    return ticket, msgs
-
-def update_ticket(db: Session, ticket_id: int, **fields) -> Ticket:
-    ticket = db.get(Ticket, ticket_id)
-    if not ticket:
+        where.append(Ticket.id.in_(union(
+            select(Ticket.id).where(Ticket.subject.ilike(like)),
+            select(Ticket.id).where(Ticket.customer_email.ilike(like)),
+            select(Message.ticket_id).where(Message.search_tsv.op("@@")(_tsquery(q))),
+        )))
+    return where
+
+def _tsquery(q: str):
+    return func.websearch_to_tsquery(cast(settings.KB_TS_CONFIG, REGCONFIG), q)
+
+def search_tickets(
+    db: Session,
+    q: str,
+    limit: int,
+    status: str | None = None,
+    priority: str | None = None,
+) -> list[dict]:
+    """
+    Ranked ticket search: full-text match over message bodies plus trigram
+    match on subject/customer email. Headlines are built only for the
+    returned page, from the best-matching message of each ticket.
+    """
+    tsq = _tsquery(q)
+    like = f"%{q}%"
+
+    best_msg = (
+        select(
+            Message.ticket_id,
+            Message.id.label("message_id"),
+            func.ts_rank_cd(Message.search_tsv, tsq).label("rank"),
+        )
+        .where(Message.search_tsv.op("@@")(tsq))
+        .distinct(Message.ticket_id)
+        .order_by(Message.ticket_id, desc("rank"))
+        .cte("best_msg")
+    )
+    # each branch is served by its own index; an OR across the join would scan all tickets
+    candidates = union(
+        select(best_msg.c.ticket_id.label("id")),
+        select(Ticket.id).where(Ticket.subject.ilike(like)),
+        select(Ticket.id).where(Ticket.customer_email.ilike(like)),
+    ).subquery("candidates")
+    trgm = func.greatest(func.similarity(Ticket.subject, q), func.similarity(Ticket.customer_email, q))
+    score = (func.coalesce(best_msg.c.rank, 0) + trgm).label("score")
+
+    stmt = (
+        select(Ticket, best_msg.c.message_id, score)
+        .join(candidates, candidates.c.id == Ticket.id)
+        .outerjoin(best_msg, best_msg.c.ticket_id == Ticket.id)
+        .where(*ticket_filters(status, priority))
+        .order_by(desc("score"), Ticket.id.desc())
+        .limit(limit)
+    )
+    rows = db.execute(stmt).all()
+
+    message_ids = [r.message_id for r in rows if r.message_id is not None]
+    headlines = {}
+    if message_ids:
+        headlines = dict(db.execute(
+            select(
+                Message.id,
+                func.ts_headline(
+                    cast(settings.KB_TS_CONFIG, REGCONFIG), Message.cleaned_text, tsq,
+                    "MaxWords=28, MinWords=10, ShortWord=3, MaxFragments=2, FragmentDelimiter= … ",
+                ),
+            ).where(Message.id.in_(message_ids))
+        ).all())
+
+    return [
+        {
+            "ticket": r.Ticket,
+            "rank": float(r.score),
+            "message_id": r.message_id,
+            "highlight": headlines.get(r.message_id, ""),
+        }
+        for r in rows
+    ]
+
+def encode_cursor(updated_at: datetime, ticket_id: int, direction: str) -> str:
+    raw = json.dumps([updated_at.isoformat(), ticket_id, direction]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, ticket_id, direction = json.loads(raw)
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(updated_at), int(ticket_id), direction
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+def estimate_count(db: Session, stmt) -> int:
+    """Row estimate from the planner (EXPLAIN), constant time regardless of table size."""
+    compiled = stmt.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+# sparse fieldsets (?fields=): the default is the full TicketOut / MessageOut shape
+TICKET_FIELDS = tuple(c.name for c in Ticket.__table__.c)
+MESSAGE_FIELDS = (
+    "id", "ticket_id", "direction", "from_email", "to_email", "subject", "cleaned_text", "raw_headers", "created_at",
+)
+MESSAGE_EXTRA_FIELDS = ("raw_text",)  # only when asked for by name
+
+
+def parse_fields(fields: str | None, allowed: tuple[str, ...], default: tuple[str, ...] | None = None) -> tuple[str, ...]:
+    """"status,subject" -> ("id", "subject", "status") in `allowed` order; empty -> `default` (all of `allowed`)."""
+    if not fields:
+        return default or allowed
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(f for f in allowed if f == "id" or f in wanted)
+
+def _select_fields(table, fields: tuple[str, ...], *keys: str):
+    """Column-only select of `fields` plus the keyset columns; no ORM objects are built."""
+    return select(*(table.c[name] for name in dict.fromkeys((*fields, *keys))))
+
+def list_tickets(
+    db: Session,
+    limit: int,
+    cursor: str | None,
+    status: str | None,
+    priority: str | None,
+    q: str | None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    total: str = "none",
+    fields: tuple[str, ...] = TICKET_FIELDS,
+):
+    """
+    Keyset pagination over (updated_at DESC, id DESC).
+    total: "none" — skip counting, "estimate" — planner estimate, "exact" — count(*).
+    Returns (items, next_cursor, prev_cursor, total); items are dicts with only `fields`.
+    """
+    where = ticket_filters(status, priority, date_from, date_to, q)
+    key = tuple_(Ticket.updated_at, Ticket.id)
+
+    direction = "next"
+    stmt = _select_fields(Ticket.__table__, fields, "updated_at", "id").where(*where)
+    if cursor:
+        updated_at, ticket_id, direction = decode_cursor(cursor)
+        if direction == "next":
+            stmt = stmt.where(key < (updated_at, ticket_id))
+        else:
+            stmt = stmt.where(key > (updated_at, ticket_id))
+
+    if direction == "next":
+        stmt = stmt.order_by(Ticket.updated_at.desc(), Ticket.id.desc())
+    else:
+        stmt = stmt.order_by(Ticket.updated_at.asc(), Ticket.id.asc())
+
+    rows = db.execute(stmt.limit(limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == "prev":
+        rows.reverse()
+
+    if direction == "next":
+        has_next, has_prev = has_more, cursor is not None
+    else:
+        has_next, has_prev = True, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"], "next")
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0]["updated_at"], rows[0]["id"], "prev")
+
+    count = None
+    if total == "exact":
+        count = int(db.scalar(select(func.count()).select_from(Ticket).where(*where)))
+    elif total == "estimate":
+        count = estimate_count(db, select(Ticket.id).where(*where))
+    items = [{name: r[name] for name in fields} for r in rows]
+    return items, next_cursor, prev_cursor, count
+
+def get_ticket_detail(
+    db: Session,
+    ticket_id: int,
+    fields: tuple[str, ...] = TICKET_FIELDS,
+    message_fields: tuple[str, ...] = MESSAGE_FIELDS,
+    messages_limit: int = 50,
+    messages_cursor: str | None = None,
+) -> tuple[dict | None, list[dict], str | None]:
+    """Ticket row and one page of its messages, oldest first, keyset on (created_at, id). Returns (ticket, messages, next_cursor)."""
+    ticket = db.execute(_select_fields(Ticket.__table__, fields).where(Ticket.id == ticket_id)).mappings().first()
+    if ticket is None:
+        return None, [], None
+
+    stmt = _select_fields(Message.__table__, message_fields, "created_at", "id").where(Message.ticket_id == ticket_id)
+    if messages_cursor:
+        created_at, message_id, _ = decode_cursor(messages_cursor)
+        stmt = stmt.where(tuple_(Message.created_at, Message.id) > (created_at, message_id))
+    rows = db.execute(stmt.order_by(Message.created_at, Message.id).limit(messages_limit + 1)).mappings().all()
+
+    next_cursor = None
+    if len(rows) > messages_limit:
+        rows = rows[:messages_limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"], "next")
+    return dict(ticket), [{name: r[name] for name in message_fields} for r in rows], next_cursor
+
+_TICKET_COLUMNS = tuple(Ticket.__table__.c)
+
+def update_ticket(db: Session, ticket_id: int, **fields) -> dict:
+    """
+    One UPDATE ... RETURNING: the row lock, the existence check and the new state in a single statement;
+    the commit adds the analytics queue insert (mark_dirty). Two statements, more when it solves the ticket.
+    """
+    values = {k: v for k, v in fields.items() if v is not None and k in Ticket.__table__.c}
+    if values:
+        stmt = update(Ticket).where(Ticket.id == ticket_id).values(**values).returning(*_TICKET_COLUMNS)
+    else:
+        stmt = select(*_TICKET_COLUMNS).where(Ticket.id == ticket_id)
+    row = db.execute(stmt).mappings().first()
+    if row is None:
+        db.rollback()
         raise ValueError("Ticket not found")
-    for k, v in fields.items():
-        if v is not None and hasattr(ticket, k):
-            setattr(ticket, k, v)
+    if values.get("status") == TicketStatus.solved:
+        # its answer becomes a suggestion for similar new tickets
+        index_tickets(db, [ticket_id])
+    if values:
+        mark_dirty(db, [ticket_id])
     db.commit()
-    db.refresh(ticket)
-    return ticket
+    return dict(row)
 
-def add_outbound_message(db: Session, ticket_id: int, to_email: str, subject: str, body_text: str) -> Message:
-    ticket = db.get(Ticket, ticket_id)
-    if not ticket:
+def ticket_action(
+    db: Session,
+    ticket_id: int,
+    status: TicketStatus | str,
+    body_text: str | None = None,
+    to_email: str | None = None,
+    subject: str | None = None,
+) -> dict:
+    """
+    Status change plus an optional outbound reply in one transaction:
+    UPDATE tickets ... RETURNING (locks the row, checks it exists), then
+    INSERT messages ... RETURNING id and INSERT outbox, plus the analytics queue insert
+    (mark_dirty) — four statements with a reply, two without, one commit.
+    """
+    last_inbound = (
+        select(Message.message_id_header)
+        .where(Message.ticket_id == ticket_id, Message.direction == MessageDirection.inbound)
+        .order_by(Message.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    values = {"status": status}
+    if body_text is not None:
+        values["first_response_at"] = func.coalesce(Ticket.first_response_at, func.now())
+    ticket = db.execute(
+        update(Ticket)
+        .where(Ticket.id == ticket_id)
+        .values(**values)
+        .returning(Ticket.id, Ticket.customer_email, Ticket.subject, Ticket.status, last_inbound.label("reply_to"))
+    ).first()
+    if ticket is None:
+        db.rollback()
         raise ValueError("Ticket not found")
 
-    msg = Message(
-        ticket_id=ticket_id,
-        direction=MessageDirection.outbound,
-        from_email="",  # can be SMTP_USER at UI level if needed
-        to_email=to_email,
-        subject=subject,
-        cleaned_text=body_text,
-        raw_headers={},
-    )
-    db.add(msg)
+    message_id = None
+    if body_text is not None:
+        to_email = to_email or ticket.customer_email
+        subject = subject or ticket.subject or "Support request"
+        header = new_message_id()
+        message_id = db.scalar(
+            insert(Message)
+            .values(
+                ticket_id=ticket_id,
+                direction=MessageDirection.outbound,
+                from_email=settings.SMTP_USER,
+                to_email=to_email,
+                subject=subject,
+                cleaned_text=body_text,
+                raw_headers={"Message-ID": header, **({"In-Reply-To": ticket.reply_to} if ticket.reply_to else {})},
+                message_id_header=header,
+                ref_ids=[ticket.reply_to] if ticket.reply_to else [],
+                delivery_status=DeliveryStatus.pending,
+            )
+            .returning(Message.id)
+        )
+        db.execute(insert(OutboxEmail).values(
+            message_id=message_id,
+            message_id_header=header,
+            to_email=to_email,
+            subject=subject,
+            body_text=body_text,
+            in_reply_to=ticket.reply_to or "",
+            references=ticket.reply_to or "",
+            status=DeliveryStatus.pending,
+        ))
+    mark_dirty(db, [ticket_id])
     db.commit()
-    db.refresh(msg)
-    return msg
\ No newline at end of file
+    return {"ticket_id": ticket.id, "status": ticket.status, "message_id": message_id}
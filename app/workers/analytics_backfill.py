@@ -0,0 +1,28 @@
+"""
+Пересборка аналитических агрегатов (/analytics) с нуля по таблице tickets, одним проходом.
+
+python -m app.workers.analytics_backfill
+Нужно один раз после деплоя и после ручных правок tickets в обход сервисов;
+дальше агрегаты обновляет app.workers.analytics_refresh по очереди analytics_dirty.
+"""
+
+import argparse
+import logging
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.analytics import rebuild_rollups
+
+log = logging.getLogger("analytics_backfill")
+
+
+def main(argv: list[str] | None = None) -> int:
+    argparse.ArgumentParser(description="Rebuild analytics rollups from tickets").parse_args(argv)
+    with SessionLocal() as db:
+        total = rebuild_rollups(db)
+    log.info("analytics rollups rebuilt from %s tickets", total)
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
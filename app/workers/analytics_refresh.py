@@ -0,0 +1,39 @@
+"""
+Обновление аналитических агрегатов (/analytics) по очереди analytics_dirty.
+
+Запуск отдельным процессом: python -m app.workers.analytics_refresh
+Транзакции API и воркеров только ставят изменённые тикеты в очередь (mark_dirty),
+пересчёт агрегатов и блокировки общих строк по дням — здесь, вне их транзакций.
+Тикеты берутся через FOR UPDATE SKIP LOCKED, так что процессов может быть несколько.
+"""
+
+import logging
+import time
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.analytics import refresh_pending
+
+log = logging.getLogger("analytics_refresh")
+
+
+def run_forever() -> None:
+    log.info("Analytics refresh started.")
+    while True:
+        try:
+            with SessionLocal() as db:
+                taken = refresh_pending(db, settings.ANALYTICS_REFRESH_BATCH)
+        except Exception:
+            log.exception("analytics refresh failed")
+            taken = 0
+        # полная пачка — очередь ещё не разобрана
+        if taken < settings.ANALYTICS_REFRESH_BATCH:
+            time.sleep(settings.ANALYTICS_REFRESH_INTERVAL)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    try:
+        run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+"""
+Обслуживание партиций messages / ai_runs и архив старых месяцев (app.services.archive).
+
+python -m app.workers.archive                          создать партиции наперёд и архивировать месяцы старше ARCHIVE_AFTER_MONTHS
+python -m app.workers.archive --after-months 12        то же с другим сроком
+python -m app.workers.archive --restore 2026-01 [--ticket 12 --ticket 15]
+                                                       вернуть месяц (или только эти тикеты) из ARCHIVE_DIR в БД
+Запускать по cron раз в сутки; повторный запуск безопасен.
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.archive import run_archival, restore_month
+
+log = logging.getLogger("archive")
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Partition maintenance and archival of messages / ai_runs")
+    p.add_argument("--after-months", type=int, help="default: ARCHIVE_AFTER_MONTHS")
+    p.add_argument("--restore", metavar="YYYY-MM", help="restore an archived month instead")
+    p.add_argument("--ticket", type=int, action="append", help="with --restore: only these tickets")
+    args = p.parse_args(argv)
+
+    started = time.monotonic()
+    with SessionLocal() as db:
+        if args.restore:
+            month = datetime.strptime(args.restore, "%Y-%m").date()
+            try:
+                counts = restore_month(db, month, args.ticket)
+            except ValueError as e:
+                log.error("%s", e)
+                return 1
+            log.info("restored %s: %s in %.1fs", args.restore, counts, time.monotonic() - started)
+            return 0
+        done = run_archival(db, args.after_months)
+    for month, counts in done.items():
+        log.info("%s: %s", month, counts)
+    log.info("archived %s months in %.1fs", len(done), time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
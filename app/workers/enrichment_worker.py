@@ -0,0 +1,50 @@
+"""
+Пул воркеров AI/KB-обогащения тикетов.
+
+Запуск отдельным процессом: python -m app.workers.enrichment_worker
+Задачи берутся из enrichment_jobs через FOR UPDATE SKIP LOCKED,
+поэтому процессов и потоков можно запускать сколько угодно.
+"""
+
+import logging
+import threading
+import time
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.enrichment import process_pending
+
+log = logging.getLogger("enrichment_worker")
+
+
+def worker_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            with SessionLocal() as db:
+                claimed = process_pending(db, settings.ENRICH_BATCH)
+        except Exception:
+            log.exception("enrichment batch failed")
+            claimed = 0
+        if not claimed:
+            stop.wait(settings.ENRICH_POLL_INTERVAL)
+
+
+def run_forever(workers: int | None = None) -> None:
+    workers = workers or settings.ENRICH_WORKERS
+    log.info("Enrichment worker started (%s threads).", workers)
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker_loop, args=(stop,), name=f"enrich-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run_forever()
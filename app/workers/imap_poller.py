@@ -1,18 +1,332 @@
 """
-MVP: заглушка.
-Реально для хакатона можно:
-- запускать отдельным процессом (python -m app.workers.imap_poller)
-- или как background task внутри FastAPI (но лучше отдельным процессом)
+IMAP ingestion worker.
+
+Запуск отдельным процессом: python -m app.workers.imap_poller
+
+- одно постоянное IMAP-соединение на ящик;
+- IDLE, чтобы видеть новые письма сразу; polling только если сервер не умеет IDLE;
+- новые письма забираются пачками через UID FETCH по диапазонам UID;
+- последний обработанный UID хранится в mailbox_checkpoints, рестарт продолжает с него;
+- письма пачки создаются через create_ticket_from_inbound в одной транзакции с чекпоинтом;
+  чекпоинт не перескакивает письмо, которое не удалось принять: оно забирается снова
+  через IMAP_POLL_INTERVAL, а после IMAP_MAX_ATTEMPTS попыток записывается в
+  mailbox_failures и пропускается;
+- большие письма забираются частями (BODY.PEEK[]<off.len>) во временный файл
+  и разбираются потоково (app.services.mime), вложения сразу ложатся на диск.
+
+Для тестов достаточно указать IMAP_HOST/IMAP_PORT локального fake-сервера и IMAP_USE_SSL=false.
 """
 
-import time
+import imaplib
+import io
 import logging
+import re
+import select
+import ssl
+import tempfile
+import time
+from typing import BinaryIO
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.models import MailboxCheckpoint, MailboxFailure
+from app.db.session import SessionLocal
+from app.services.mime import parse_mime_stream, remove_attachment_files
+from app.services.tickets import create_ticket_from_inbound
 
 log = logging.getLogger("imap_poller")
 
+_FETCH_UID_RE = re.compile(rb"UID (\d+)")
+_FETCH_SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+
+
+def uid_ranges(uids: list[int]) -> str:
+    """[1,2,3,7,9,10] -> '1:3,7,9:10' — один UID FETCH вместо запроса на каждое письмо."""
+    parts = []
+    start = prev = None
+    for uid in sorted(uids):
+        if start is None:
+            start = prev = uid
+        elif uid == prev + 1:
+            prev = uid
+        else:
+            parts.append(f"{start}:{prev}" if start != prev else str(start))
+            start = prev = uid
+    if start is not None:
+        parts.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(parts)
+
+
+class ImapMailbox:
+    def __init__(self, host: str, port: int, user: str, password: str, mailbox: str, use_ssl: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.use_ssl = use_ssl
+        self.conn: imaplib.IMAP4 | None = None
+        self.uidvalidity = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.user}@{self.host}/{self.mailbox}"
+
+    @property
+    def supports_idle(self) -> bool:
+        return self.conn is not None and "IDLE" in self.conn.capabilities
+
+    def connect(self) -> None:
+        cls = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        self.conn = cls(self.host, self.port)
+        if self.user:
+            self.conn.login(self.user, self.password)
+        typ, _ = self.conn.select(self.mailbox, readonly=True)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"cannot select {self.mailbox}")
+        _, data = self.conn.response("UIDVALIDITY")
+        self.uidvalidity = int(data[0]) if data and data[0] else 0
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        try:
+            self.conn.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        self.conn = None
+
+    def __enter__(self) -> "ImapMailbox":
+        self.connect()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def uids_after(self, last_uid: int) -> list[int]:
+        typ, data = self.conn.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+        if typ != "OK" or not data or not data[0]:
+            return []
+        # "N:*" всегда возвращает максимальный UID, даже если он <= last_uid
+        return sorted(u for u in map(int, data[0].split()) if u > last_uid)
+
+    def sizes(self, uids: list[int]) -> dict[int, int]:
+        typ, data = self.conn.uid("FETCH", uid_ranges(uids), "(UID RFC822.SIZE)")
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+        out = {}
+        for item in data:
+            line = item[0] if isinstance(item, tuple) else item
+            uid, size = _FETCH_UID_RE.search(line or b""), _FETCH_SIZE_RE.search(line or b"")
+            if uid and size:
+                out[int(uid.group(1))] = int(size.group(1))
+        return out
+
+    def fetch(self, uids: list[int]) -> list[tuple[int, BinaryIO]]:
+        """
+        Маленькие письма — одним UID FETCH на всю пачку,
+        большие — кусками во временный файл, чтобы не держать их в памяти целиком.
+        """
+        if not uids:
+            return []
+        sizes = self.sizes(uids)
+        small = [u for u in uids if sizes.get(u, 0) <= settings.IMAP_STREAM_THRESHOLD]
+        large = [u for u in uids if u in sizes and u not in small]
+
+        out: list[tuple[int, BinaryIO]] = []
+        if small:
+            typ, data = self.conn.uid("FETCH", uid_ranges(small), "(UID BODY.PEEK[])")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+            for item in data:
+                if not isinstance(item, tuple):
+                    continue
+                m = _FETCH_UID_RE.search(item[0])
+                if m:
+                    out.append((int(m.group(1)), io.BytesIO(item[1])))
+        for uid in large:
+            out.append((uid, self._fetch_spooled(uid, sizes[uid])))
+        out.sort(key=lambda x: x[0])
+        return out
+
+    def _fetch_spooled(self, uid: int, size: int) -> BinaryIO:
+        fp = tempfile.TemporaryFile()
+        chunk = settings.IMAP_FETCH_CHUNK
+        for offset in range(0, size, chunk):
+            typ, data = self.conn.uid("FETCH", str(uid), f"(BODY.PEEK[]<{offset}.{chunk}>)")
+            if typ != "OK":
+                fp.close()
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {data!r}")
+            part = next((item[1] for item in data if isinstance(item, tuple)), b"")
+            fp.write(part)
+            if len(part) < chunk:
+                break
+        fp.seek(0)
+        return fp
+
+    def idle(self, timeout: float) -> bool:
+        """Ждёт EXISTS/RECENT в режиме IDLE. True — есть новые письма, False — таймаут."""
+        conn = self.conn
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        got_new = False
+        deadline = time.monotonic() + timeout
+        while not got_new:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not _buffered(conn) and not select.select([conn.sock], [], [], remaining)[0]:
+                break
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.startswith(b"* ") and (b"EXISTS" in line or b"RECENT" in line):
+                got_new = True
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed after IDLE")
+            if line.startswith(tag):
+                break
+        return got_new
+
+    def wait_for_mail(self, retry: bool = False) -> None:
+        """retry — есть письмо, которое не удалось принять: повтор через IMAP_POLL_INTERVAL, а не после IDLE."""
+        if self.supports_idle and not retry:
+            self.idle(settings.IMAP_IDLE_TIMEOUT)
+        else:
+            time.sleep(settings.IMAP_POLL_INTERVAL)
+            self.conn.noop()
+
+
+def _buffered(conn: imaplib.IMAP4) -> bool:
+    """
+    Есть ли уже прочитанные из сокета строки: select видит только сокет, а ответ сервера
+    мог прийти вместе с "+ idling" и лежать в буфере conn.file (или в буфере SSL).
+    """
+    if getattr(conn.sock, "pending", lambda: 0)():
+        return True
+    timeout = conn.sock.gettimeout()
+    conn.sock.settimeout(0)
+    try:
+        return bool(conn.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        conn.sock.settimeout(timeout)
+
+
+def load_checkpoint(db: Session, key: str, uidvalidity: int) -> MailboxCheckpoint:
+    cp = db.get(MailboxCheckpoint, key)
+    if cp is None:
+        cp = MailboxCheckpoint(mailbox=key, uidvalidity=uidvalidity, last_uid=0)
+        db.add(cp)
+        db.commit()
+    elif cp.uidvalidity != uidvalidity:
+        # ящик пересоздан — старые UID больше ничего не значат
+        log.warning("UIDVALIDITY changed for %s (%s -> %s), rescanning", key, cp.uidvalidity, uidvalidity)
+        cp.uidvalidity = uidvalidity
+        cp.last_uid = 0
+        db.commit()
+    return cp
+
+
+def ingest_batch(
+    db: Session, cp: MailboxCheckpoint, fetched: list[tuple[int, BinaryIO]], attempts: dict[int, int] | None = None,
+) -> int:
+    """
+    Одна транзакция на пачку: тикеты + сдвиг чекпоинта, по порядку UID. На письме, которое
+    не удалось принять, пачка останавливается — чекпоинт остаётся перед ним, оно и всё после
+    забираются снова. attempts (uid -> неудачи подряд) живёт между вызовами; после
+    IMAP_MAX_ATTEMPTS письмо записывается в mailbox_failures и пропускается.
+    """
+    attempts = {} if attempts is None else attempts
+    created = 0
+    try:
+        for uid, fp in fetched:
+            parsed = None
+            try:
+                with fp:
+                    parsed = parse_mime_stream(fp)
+                with db.begin_nested():
+                    create_ticket_from_inbound(db, **parsed, commit=False)
+                created += 1
+            except Exception as e:
+                log.exception("failed to ingest uid=%s from %s", uid, cp.mailbox)
+                if parsed:
+                    remove_attachment_files(parsed["attachments"])
+                attempts[uid] = attempts.get(uid, 0) + 1
+                if attempts[uid] < settings.IMAP_MAX_ATTEMPTS:
+                    break
+                log.error("uid=%s from %s failed %s times, skipped", uid, cp.mailbox, attempts[uid])
+                db.merge(MailboxFailure(
+                    mailbox=cp.mailbox, uidvalidity=cp.uidvalidity, uid=uid,
+                    attempts=attempts[uid], error=f"{type(e).__name__}: {e}"[:2000],
+                ))
+            attempts.pop(uid, None)
+            cp.last_uid = max(cp.last_uid, uid)
+    finally:
+        for _, fp in fetched:
+            fp.close()
+    db.commit()
+    return created
+
+
+def drain(box: ImapMailbox, db: Session, cp: MailboxCheckpoint, attempts: dict[int, int] | None = None) -> int:
+    total = 0
+    uids = box.uids_after(cp.last_uid)
+    for i in range(0, len(uids), settings.IMAP_FETCH_BATCH):
+        fetched = box.fetch(uids[i:i + settings.IMAP_FETCH_BATCH])
+        total += ingest_batch(db, cp, fetched, attempts)
+        if fetched and cp.last_uid < fetched[-1][0]:
+            break  # остановились на неудаче: дальше чекпоинт не двигается
+    if total:
+        log.info("ingested %s messages from %s (last_uid=%s)", total, cp.mailbox, cp.last_uid)
+    return total
+
+
+def run_mailbox(box: ImapMailbox) -> None:
+    attempts: dict[int, int] = {}
+    with box, SessionLocal() as db:
+        cp = load_checkpoint(db, box.key, box.uidvalidity)
+        log.info("connected to %s, idle=%s, last_uid=%s", box.key, box.supports_idle, cp.last_uid)
+        while True:
+            drain(box, db, cp, attempts)
+            box.wait_for_mail(retry=bool(attempts))
+
+
 def run_forever():
-    log.info("IMAP poller started (MVP stub).")
+    log.info("IMAP poller started.")
+    backoff = 1
     while True:
-        # TODO: подключить imaplib, fetch unseen, парсить MIME,
-        # вызывать POST /tickets/inbound или напрямую сервис create_ticket_from_inbound
-        time.sleep(10)
\ No newline at end of file
+        box = ImapMailbox(
+            host=settings.IMAP_HOST,
+            port=settings.IMAP_PORT,
+            user=settings.IMAP_USER,
+            password=settings.IMAP_PASSWORD,
+            mailbox=settings.IMAP_MAILBOX,
+            use_ssl=settings.IMAP_USE_SSL,
+        )
+        started = time.monotonic()
+        try:
+            run_mailbox(box)
+        except (imaplib.IMAP4.error, OSError, SQLAlchemyError) as e:
+            # сессия уже закрыта блоком with в run_mailbox; следующая попытка берёт новое соединение из пула
+            if time.monotonic() - started > 60:
+                backoff = 1
+            log.warning("%s connection lost (%s), reconnecting in %ss",
+                        "DB" if isinstance(e, SQLAlchemyError) else "IMAP", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 300)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run_forever()
@@ -0,0 +1,92 @@
+"""
+Массовый импорт базы знаний из файла (то же, что POST /kb/documents/bulk, без HTTP).
+
+python -m app.workers.kb_import articles.ndjson [--chunk 500] [--reindex deferred|inline] [--errors errors.ndjson]
+Файл: NDJSON (по документу KbDocumentImport на строку) или JSON-массив; '-' — stdin.
+Документы upsert'ятся по external_id пачками; с --reindex deferred векторный индекс
+и версия БЗ обновляются один раз в конце.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Iterator
+from pydantic import ValidationError
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.schemas.kb import KbDocumentImport
+from app.services.kb import import_kb_documents, finish_kb_import, import_summary
+
+log = logging.getLogger("kb_import")
+
+
+def read_records(fp) -> Iterator[dict | str]:
+    first = fp.read(1)
+    while first and first.isspace():
+        first = fp.read(1)
+    if first == "[":
+        yield from json.loads(first + fp.read())
+        return
+    if first:
+        yield first + fp.readline()
+    for line in fp:
+        if line.strip():
+            yield line
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Bulk upsert KB documents keyed on external_id")
+    p.add_argument("path")
+    p.add_argument("--chunk", type=int, default=settings.KB_IMPORT_CHUNK)
+    p.add_argument("--reindex", choices=("deferred", "inline"), default="deferred")
+    p.add_argument("--errors", help="write failed records' results here (NDJSON)")
+    args = p.parse_args(argv)
+
+    started = time.perf_counter()
+    results: list[dict] = []
+    chunk: list[tuple[int, dict]] = []
+
+    with SessionLocal() as db:
+        def flush() -> None:
+            rows = import_kb_documents(db, [it for _, it in chunk], args.reindex)
+            results.extend({"index": i, **r} for (i, _), r in zip(chunk, rows))
+            chunk.clear()
+            log.info("%s documents processed (%.0f/s)", len(results), len(results) / (time.perf_counter() - started))
+
+        fp = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+        with fp:
+            for index, record in enumerate(read_records(fp)):
+                try:
+                    if isinstance(record, dict):
+                        doc = KbDocumentImport.model_validate(record)
+                    else:
+                        doc = KbDocumentImport.model_validate_json(record if isinstance(record, str) else json.dumps(record))
+                    chunk.append((index, doc.model_dump()))
+                except ValidationError as e:
+                    results.append({"index": index, "error": str(e.errors(include_url=False))[:500]})
+                if len(chunk) >= args.chunk:
+                    flush()
+        if chunk:
+            flush()
+        if args.reindex == "deferred":
+            finish_kb_import(db, [r["id"] for r in results if r.get("action") in ("created", "updated")])
+
+    summary = import_summary(sorted(results, key=lambda r: r["index"]), time.perf_counter() - started)
+    if args.errors:
+        with open(args.errors, "w", encoding="utf-8") as f:
+            for r in summary["items"]:
+                if r.get("error"):
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    log.info(
+        "created %(created)s, updated %(updated)s, unchanged %(unchanged)s, failed %(failed)s in %(seconds)ss (%(docs_per_second)s docs/s)",
+        summary,
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
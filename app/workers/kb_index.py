@@ -0,0 +1,28 @@
+"""
+Полная пересборка локального векторного индекса БЗ (app.services.kb_vectors).
+
+python -m app.workers.kb_index
+Нужна после смены KB_VECTOR_DIM или при переносе на новый хост; дальше индекс
+обновляется сам при create/update документа.
+"""
+
+import logging
+import time
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.kb_vectors import rebuild_index
+
+log = logging.getLogger("kb_index")
+
+
+def main() -> int:
+    started = time.monotonic()
+    with SessionLocal() as db:
+        total = rebuild_index(db)
+    log.info("indexed %s KB documents in %.1fs", total, time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
@@ -0,0 +1,35 @@
+"""
+Нарезка всех документов БЗ на пассажи (kb_passages), по которым ищет search_kb.
+
+python -m app.workers.kb_passages
+Нужна один раз после деплоя (для документов, созданных до появления пассажей) и после
+смены KB_PASSAGE_CHARS; дальше пассажи обновляются сами при create/update/импорте.
+Повторный запуск безопасен: неизменившиеся пассажи не переписываются.
+"""
+
+import argparse
+import logging
+import time
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.kb import bump_kb_version
+from app.services.kb_passages import rebuild_passages
+
+log = logging.getLogger("kb_passages")
+
+
+def main(argv: list[str] | None = None) -> int:
+    argparse.ArgumentParser(description="Re-chunk all KB documents into passages").parse_args(argv)
+    started = time.monotonic()
+    with SessionLocal() as db:
+        total = rebuild_passages(db)
+        # cached search results may point at passages that are gone now
+        bump_kb_version(db)
+        db.commit()
+    log.info("chunked %s KB documents in %.1fs", total, time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
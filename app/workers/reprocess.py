@@ -0,0 +1,47 @@
+"""
+Повторный анализ исторических тикетов новыми эвристиками.
+
+python -m app.workers.reprocess --model-version rules-v2 [--update-tickets] [--with-kb]
+python -m app.workers.reprocess --resume 7
+Прогон, который сейчас выполняет другой процесс (API или этот CLI), второй раз не запускается:
+--resume такого прогона сразу завершается с кодом 1.
+"""
+
+import argparse
+import logging
+import time
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.reprocess import start_run, run_reprocess
+
+log = logging.getLogger("reprocess")
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Re-run analyze_message over historical tickets")
+    p.add_argument("--model-version", help="label stored in AiRun.model_versions['run']")
+    p.add_argument("--resume", type=int, help="continue an interrupted run by id")
+    p.add_argument("--update-tickets", action="store_true", help="update ticket ai_* fields when confidence improves")
+    p.add_argument("--with-kb", action="store_true", help="also re-run KB search for every ticket")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--chunk", type=int, default=None)
+    args = p.parse_args(argv)
+    if not args.resume and not args.model_version:
+        p.error("--model-version or --resume is required")
+
+    started = time.monotonic()
+
+    def progress(run) -> None:
+        rate = run.processed / max(time.monotonic() - started, 1e-6)
+        log.info("run %s: %s/%s tickets (%.0f/s), %s updated", run.id, run.processed, run.total, rate, run.updated_tickets)
+
+    with SessionLocal() as db:
+        run_id = args.resume or start_run(db, args.model_version, args.update_tickets, args.with_kb).id
+        run = run_reprocess(db, run_id, workers=args.workers, chunk=args.chunk, progress=progress)
+        log.info("run %s finished with status %s", run.id, run.status)
+        return 0 if run.status == "done" else 1
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+"""
+Первичное заполнение индекса похожих тикетов по уже решённым тикетам.
+
+python -m app.workers.similar_index [--chunk 1000]
+Дальше индекс поддерживается сам: тикет индексируется при переходе в solved.
+"""
+
+import argparse
+import logging
+from sqlalchemy import select
+from app.core.logging import setup_logging
+from app.db.models import Ticket, TicketStatus
+from app.db.session import SessionLocal
+from app.services.similar import index_tickets
+
+log = logging.getLogger("similar_index")
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Index solved tickets for /tickets/{id}/similar")
+    p.add_argument("--chunk", type=int, default=1000)
+    args = p.parse_args(argv)
+
+    last_id = 0
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            ids = db.scalars(
+                select(Ticket.id)
+                .where(Ticket.status == TicketStatus.solved, Ticket.id > last_id)
+                .order_by(Ticket.id)
+                .limit(args.chunk)
+            ).all()
+            if not ids:
+                break
+            total += index_tickets(db, list(ids))
+            db.commit()
+            last_id = ids[-1]
+            log.info("indexed %s solved tickets (up to id %s)", total, last_id)
+    return 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""
+Отправка писем из outbox.
+
+Запуск отдельным процессом: python -m app.workers.smtp_sender
+SMTP_POOL_SIZE потоков, у каждого своё долгоживущее авторизованное SMTP-соединение,
+которое переиспользуется для многих писем. Строки outbox берутся в аренду
+(FOR UPDATE SKIP LOCKED + next_attempt_at), неудачи повторяются с backoff.
+Если сервер недоступен (соединение, EHLO, TLS, авторизация), взятая пачка
+возвращается в очередь без учёта попытки; failed — только ответ 5xx на MAIL/RCPT/DATA.
+Для локальной проверки: SMTP_HOST=localhost, SMTP_PORT=1025, SMTP_USE_TLS=false.
+"""
+
+import logging
+import threading
+import time
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.services.email import SmtpConnection, SmtpUnavailable, drain_outbox
+
+log = logging.getLogger("smtp_sender")
+
+
+def sender_loop(stop: threading.Event) -> None:
+    conn = SmtpConnection()
+    try:
+        while not stop.is_set():
+            pause = settings.OUTBOX_POLL_INTERVAL
+            try:
+                # аренда закоммичена, но строки не перечитываются по одной перед отправкой
+                with SessionLocal(expire_on_commit=False) as db:
+                    claimed = drain_outbox(db, conn, settings.SMTP_BATCH)
+            except SmtpUnavailable:
+                # строки уже возвращены в очередь; пауза растёт, пока сервер недоступен
+                claimed = 0
+                pause = min(pause * 2 ** conn.failures, 60)
+            except Exception:
+                log.exception("outbox batch failed")
+                claimed = 0
+            if not claimed:
+                stop.wait(pause)
+    finally:
+        conn.close()
+
+
+def run_forever(pool_size: int | None = None) -> None:
+    pool_size = pool_size or settings.SMTP_POOL_SIZE
+    log.info("SMTP sender started (%s connections).", pool_size)
+    stop = threading.Event()
+    threads = [threading.Thread(target=sender_loop, args=(stop,), name=f"smtp-{i}", daemon=True) for i in range(pool_size)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    run_forever()
@@ -0,0 +1,65 @@
+"""
+Сравнение результатов bench.run с сохранённым baseline.
+
+python -m bench.compare bench/results/latest.json bench/baseline.json [--tolerance 0.2] [--min-ms 1]
+Код выхода 1, если хотя бы у одного сценария baseline p95 вырос или throughput упал
+больше чем на tolerance (p95 — ещё и больше чем на min-ms в абсолюте: шум
+суб-миллисекундных замеров не считается регрессией). Новые сценарии не сравниваются.
+"""
+
+import argparse
+import json
+
+# metric -> +1: bigger is worse, -1: smaller is worse
+METRICS = {"p95_ms": 1, "throughput": -1}
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_ms: float = 1.0) -> list[dict]:
+    rows = []
+    for name, base in sorted(baseline["results"].items()):
+        cur = current["results"].get(name)
+        if cur is None:
+            rows.append({"scenario": name, "metric": "-", "baseline": None, "current": None, "change": None, "regression": True})
+            continue
+        for metric, direction in METRICS.items():
+            b, c = base[metric], cur[metric]
+            change = (c - b) / b if b else 0.0
+            regression = change * direction > tolerance
+            if metric.endswith("_ms") and c - b <= min_ms:
+                regression = False
+            rows.append({"scenario": name, "metric": metric, "baseline": b, "current": c, "change": change, "regression": regression})
+    return rows
+
+
+def report(rows: list[dict]) -> str:
+    lines = [f"{'scenario':<28} {'metric':<11} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for r in rows:
+        if r["current"] is None:
+            lines.append(f"{r['scenario']:<28} {'missing':<11} {'':>12} {'':>12} {'':>8}  REGRESSION")
+            continue
+        flag = "  REGRESSION" if r["regression"] else ""
+        lines.append(
+            f"{r['scenario']:<28} {r['metric']:<11} {r['baseline']:>12.2f} {r['current']:>12.2f} {r['change']:>+8.1%}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Compare bench results with a baseline")
+    p.add_argument("current")
+    p.add_argument("baseline")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.add_argument("--min-ms", type=float, default=1.0)
+    args = p.parse_args(argv)
+
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.tolerance, args.min_ms)
+    print(report(rows))
+    return 1 if any(r["regression"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+"""
+Deterministic synthetic corpus: RU/EN support emails and KB articles.
+
+Same seed -> same corpus, so runs are comparable with a stored baseline. Topics follow
+what analyze_message and the KB actually see (billing / login / bug / question);
+bodies range from one-liners to long quoted threads, and a share of the emails are
+replies (In-Reply-To of an earlier email) to exercise threading.
+"""
+
+import random
+
+TOPICS = {
+    "billing": {
+        "ru": {
+            "subjects": ["Списали деньги дважды", "Вопрос по оплате счета", "Не проходит платеж", "Возврат средств за подписку"],
+            "lines": [
+                "С карты списали оплату за подписку два раза.",
+                "Платеж по счету {n} завис в обработке.",
+                "Прошу оформить возврат, тариф не подключился.",
+                "Банк пишет, что транзакция отклонена, хотя деньги на карте есть.",
+                "Нужен закрывающий документ по оплате за {month}.",
+            ],
+        },
+        "en": {
+            "subjects": ["Charged twice", "Invoice question", "Payment failed", "Refund request"],
+            "lines": [
+                "My card was charged twice for the subscription.",
+                "Invoice {n} is still pending after payment.",
+                "Please refund the last payment, the plan was never activated.",
+                "The bank declined the transaction although the card has funds.",
+                "I need a receipt for the {month} billing period.",
+            ],
+        },
+    },
+    "login": {
+        "ru": {
+            "subjects": ["Не могу войти в аккаунт", "Не приходит код", "Сброс пароля не работает", "Аккаунт заблокирован"],
+            "lines": [
+                "При входе пишет неверный пароль, хотя пароль верный.",
+                "Код подтверждения по SMS не приходит уже час.",
+                "Ссылка для сброса пароля ведет на ошибку 404.",
+                "Аккаунт {email} заблокирован после нескольких попыток входа.",
+                "Двухфакторная авторизация не принимает код.",
+            ],
+        },
+        "en": {
+            "subjects": ["Cannot log in", "Verification code not received", "Password reset broken", "Account locked"],
+            "lines": [
+                "Login says the password is wrong but it is correct.",
+                "The SMS verification code never arrives.",
+                "The password reset link opens a 404 page.",
+                "Account {email} got locked after a few login attempts.",
+                "Two-factor authentication rejects the code.",
+            ],
+        },
+    },
+    "bug": {
+        "ru": {
+            "subjects": ["Ошибка при сохранении", "Приложение падает", "Не работает экспорт", "Ошибка 500"],
+            "lines": [
+                "При сохранении формы появляется ошибка 500.",
+                "Приложение вылетает при открытии отчета на версии {version}.",
+                "Экспорт в CSV выгружает пустой файл.",
+                "После обновления до {version} не работает поиск.",
+                "Страница долго грузится и показывает ошибку таймаута.",
+            ],
+        },
+        "en": {
+            "subjects": ["Error on save", "App crashes", "Export is broken", "500 error"],
+            "lines": [
+                "Saving the form returns a 500 error.",
+                "The app crashes when opening a report on version {version}.",
+                "CSV export produces an empty file.",
+                "Search stopped working after updating to {version}.",
+                "The page loads forever and then shows a timeout error.",
+            ],
+        },
+    },
+    "question": {
+        "ru": {
+            "subjects": ["Как подключить интеграцию", "Вопрос по тарифам", "Как добавить пользователя", "Подскажите, пожалуйста"],
+            "lines": [
+                "Подскажите, как подключить интеграцию с CRM?",
+                "Можно ли перейти на годовой тариф с сохранением данных?",
+                "Как добавить нового пользователя в рабочее пространство?",
+                "Где найти настройки уведомлений?",
+                "Есть ли API для выгрузки тикетов?",
+            ],
+        },
+        "en": {
+            "subjects": ["How to connect the integration", "Pricing question", "How to add a user", "Quick question"],
+            "lines": [
+                "How do I connect the CRM integration?",
+                "Can we switch to the yearly plan and keep our data?",
+                "How do I add a new user to the workspace?",
+                "Where are the notification settings?",
+                "Is there an API to export tickets?",
+            ],
+        },
+    },
+}
+
+GREETING = {"ru": "Здравствуйте!", "en": "Hello,"}
+SIGNATURE = {"ru": "С уважением,\n{name}", "en": "Best regards,\n{name}"}
+QUOTE_HEADER = {"ru": "{date}, Техподдержка пишет:", "en": "On {date}, Support wrote:"}
+NAMES = ["Анна", "Иван", "Мария", "Олег", "Alice", "Bob", "Carol", "Dmitry", "Elena", "Frank"]
+MONTHS = ["январь", "февраль", "March", "April", "май", "June"]
+
+# body size classes: (weight, sentences, quoted history lines)
+SIZES = [(60, (1, 3), 0), (30, (3, 8), 10), (8, (8, 20), 60), (2, (20, 40), 400)]
+
+SUPPORT_EMAIL = "support@bench.local"
+
+
+def _fill(rng: random.Random, line: str, email: str) -> str:
+    return line.format(
+        n=rng.randint(10_000, 99_999),
+        month=rng.choice(MONTHS),
+        email=email,
+        version=f"{rng.randint(1, 5)}.{rng.randint(0, 20)}",
+    )
+
+
+def _body(rng: random.Random, topic: str, lang: str, email: str) -> str:
+    _, (lo, hi), quoted = rng.choices(SIZES, weights=[s[0] for s in SIZES])[0]
+    lines = TOPICS[topic][lang]["lines"]
+    parts = [GREETING[lang], " ".join(_fill(rng, rng.choice(lines), email) for _ in range(rng.randint(lo, hi)))]
+    parts.append(SIGNATURE[lang].format(name=rng.choice(NAMES)))
+    if quoted:
+        parts.append(QUOTE_HEADER[lang].format(date=f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}"))
+        other = TOPICS[rng.choice(list(TOPICS))][lang]["lines"]
+        parts.extend("> " + _fill(rng, rng.choice(other), email) for _ in range(quoted))
+    return "\n\n".join(parts)
+
+
+def emails(count: int, seed: int = 1, reply_share: float = 0.1) -> list[dict]:
+    """TicketCreateInbound payloads; `topic` and `lang` are extra keys the API ignores."""
+    rng = random.Random(seed)
+    customers = [f"customer{i}@example.com" for i in range(max(count // 4, 1))]
+    out: list[dict] = []
+    for i in range(count):
+        topic = rng.choice(list(TOPICS))
+        lang = "ru" if rng.random() < 0.6 else "en"
+        customer = rng.choice(customers)
+        subject = rng.choice(TOPICS[topic][lang]["subjects"])
+        headers = {"Message-ID": f"<bench-{seed}-{i}@example.com>"}
+        if out and rng.random() < reply_share:
+            parent = rng.choice(out)
+            customer = parent["customer_email"]
+            subject = "Re: " + parent["subject"]
+            headers["In-Reply-To"] = parent["raw_headers"]["Message-ID"]
+        out.append({
+            "subject": subject,
+            "customer_email": customer,
+            "from_email": customer,
+            "to_email": SUPPORT_EMAIL,
+            "cleaned_text": _body(rng, topic, lang, customer),
+            "raw_headers": headers,
+            "topic": topic,
+            "lang": lang,
+        })
+    return out
+
+
+def kb_documents(count: int, seed: int = 1) -> list[dict]:
+    """KbDocumentCreate payloads, 1..~60 paragraphs each."""
+    rng = random.Random(seed + 1)
+    out = []
+    for i in range(count):
+        topic = rng.choice(list(TOPICS))
+        lang = "ru" if rng.random() < 0.6 else "en"
+        lines = TOPICS[topic][lang]["lines"]
+        paragraphs = [
+            " ".join(_fill(rng, rng.choice(lines), "user@example.com") for _ in range(rng.randint(2, 6)))
+            for _ in range(max(1, int(rng.expovariate(1 / 8))))
+        ]
+        out.append({
+            "title": f"{rng.choice(TOPICS[topic][lang]['subjects'])} #{i}",
+            "body": "\n\n".join(paragraphs),
+            "tags": [topic, lang],
+            "language": lang,
+            "status": "active",
+        })
+    return out
+
+
+def queries(count: int, seed: int = 1) -> list[str]:
+    """Search phrases: KB-like sentences, shortened, so lexical and fuzzy matches both occur."""
+    rng = random.Random(seed + 2)
+    out = []
+    for _ in range(count):
+        topic = rng.choice(list(TOPICS))
+        lang = rng.choice(["ru", "en"])
+        words = _fill(rng, rng.choice(TOPICS[topic][lang]["lines"]), "user@example.com").rstrip(".?").split()
+        start = rng.randint(0, max(len(words) - 2, 0))
+        out.append(" ".join(words[start:start + rng.randint(2, 4)]))
+    return out
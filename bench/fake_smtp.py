@@ -0,0 +1,60 @@
+"""Минимальный SMTP-приёмник для бенчмарков: принимает всё, считает письма, ничего не хранит."""
+
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server: "FakeSmtp" = self.server  # type: ignore[assignment]
+        self._reply("220 bench smtp ready")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line.rstrip(b"\r\n") == b".":
+                    in_data = False
+                    with server.lock:
+                        server.messages += 1
+                    self._reply("250 queued")
+                continue
+            cmd = line.strip().upper()
+            if cmd.startswith((b"EHLO", b"HELO")):
+                self.wfile.write(b"250-bench\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif cmd == b"DATA":
+                in_data = True
+                self._reply("354 end with .")
+            elif cmd == b"QUIT":
+                self._reply("221 bye")
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._reply("250 ok")
+
+    def _reply(self, text: str) -> None:
+        self.wfile.write(text.encode() + b"\r\n")
+
+
+class FakeSmtp(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.messages = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeSmtp":
+        threading.Thread(target=self.serve_forever, name="fake-smtp", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    srv = FakeSmtp(port=1025)
+    print(f"fake SMTP on 127.0.0.1:{srv.port}")
+    srv.serve_forever()
@@ -0,0 +1,356 @@
+"""
+Нагрузочный прогон API и сервисов на синтетическом корпусе.
+
+python -m bench.run [--reset] [--tickets 2000] [--kb 300] [--requests 300] [--concurrency 8]
+                    [--api http://127.0.0.1:8000] [--out bench/results/latest.json]
+                    [--baseline bench/baseline.json [--save-baseline]] [--tolerance 0.2]
+
+Сценарии (throughput + p50/p95/p99 на операцию):
+  kb_create, ingest_single, ingest_batch, enrich, analytics_refresh, tickets_list, tickets_list_sparse,
+  tickets_search, analytics, kb_search_lexical, kb_search_hybrid, approve_send, smtp_drain, export_csv, export_xlsx
+и микро-бенчмарки в процессе: micro_analyze_message, micro_search_kb_lexical (мимо кэша),
+micro_search_kb_hybrid (мимо кэша), micro_search_kb_cached.
+Почта уходит в bench.fake_smtp, не наружу. Без --api сервер поднимается в этом же
+процессе (uvicorn в потоке) с текущими настройками (.env / переменные окружения).
+
+Baseline — bench/baseline.json в репозитории; в его meta записаны машина, коммит, корпус
+и настройки. Снят на отдельной пустой базе с параметрами по умолчанию:
+  DATABASE_URL=.../bench python -m bench.run --reset --baseline bench/baseline.json --save-baseline
+Сравнение (код выхода 1 при регрессии): тот же запуск без --save-baseline, или
+python -m bench.compare bench/results/latest.json bench/baseline.json.
+Цифры сравнимы только на машине того же класса: на другой машине сначала снимается
+свой baseline с того же коммита. Намеренное изменение производительности обновляет
+bench/baseline.json в том же коммите.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+import httpx
+import uvicorn
+from sqlalchemy import text, func, select
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.models import Base, EnrichmentJob, JobStatus
+from app.db.session import engine, SessionLocal
+from app.services.ai import analyze_message
+from app.services.email import SmtpConnection, drain_outbox
+from app.services.enrichment import process_pending
+from app.services.analytics import refresh_pending
+from app.services.kb import search_kb, _search_kb_db, _search_kb_hybrid
+from app.services.kb_vectors import rebuild_index
+from app.services.partitions import ensure_partitions
+from bench import corpus
+from bench.compare import compare, report
+from bench.fake_smtp import FakeSmtp
+
+log = logging.getLogger("bench")
+
+SETTINGS_IN_META = (
+    "DB_ASYNC", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "KB_SEARCH_MODE", "KB_CACHE_SIZE", "KB_VECTOR_DIM",
+    "INBOUND_BATCH_CHUNK", "SMTP_BATCH",
+)
+
+
+def percentile(xs: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return xs[max(0, math.ceil(p / 100 * len(xs)) - 1)] if xs else 0.0
+
+
+def summarize(latencies: list[float], wall: float, units: int | None = None) -> dict:
+    """latencies/wall in seconds; throughput is units (default: operations) per second."""
+    xs = sorted(latencies)
+    return {
+        "n": len(xs),
+        "throughput": round((units if units is not None else len(xs)) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(xs, 50) * 1000, 3),
+        "p95_ms": round(percentile(xs, 95) * 1000, 3),
+        "p99_ms": round(percentile(xs, 99) * 1000, 3),
+    }
+
+
+def timed(fn: Callable, items: Iterable, concurrency: int = 1) -> tuple[list[float], float, list]:
+    """Calls fn(item) for every item from `concurrency` threads. Returns (latencies, wall, results)."""
+    latencies: list[float] = []
+
+    def one(item):
+        start = time.perf_counter()
+        result = fn(item)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [one(item) for item in items]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(one, items))
+    return latencies, time.perf_counter() - start, results
+
+
+def reset_schema() -> None:
+    # kb_documents.search_tsv is filled in by a trigger, same as alembic 0002_initial_tables
+    with engine.begin() as conn:
+        Base.metadata.drop_all(conn)
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        Base.metadata.create_all(conn)
+        conn.execute(text(
+            f"""
+            CREATE OR REPLACE FUNCTION kb_documents_search_tsv() RETURNS trigger AS $$
+            BEGIN
+              NEW.search_tsv := setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(NEW.title, '')), 'A')
+                             || setweight(to_tsvector('{settings.KB_TS_CONFIG}'::regconfig, coalesce(NEW.body, '')), 'B');
+              RETURN NEW;
+            END $$ LANGUAGE plpgsql
+            """
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER kb_documents_search_tsv BEFORE INSERT OR UPDATE ON kb_documents "
+            "FOR EACH ROW EXECUTE FUNCTION kb_documents_search_tsv()"
+        ))
+    # monthly partitions of messages / ai_runs, as app.workers.archive keeps them in production
+    with SessionLocal() as db:
+        ensure_partitions(db)
+
+
+def start_api() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(url + "/health", timeout=1).raise_for_status()
+            return url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("in-process API did not start")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    results: dict[str, dict] = {}
+
+    def record(name: str, latencies: list[float], wall: float, units: int | None = None) -> None:
+        results[name] = summarize(latencies, wall, units)
+        log.info("%-26s %s", name, results[name])
+
+    emails = corpus.emails(args.tickets, args.seed)
+    kb_docs = corpus.kb_documents(args.kb, args.seed)
+    queries = corpus.queries(args.requests, args.seed)
+
+    smtp = FakeSmtp().start()
+    settings.SMTP_HOST, settings.SMTP_PORT = "127.0.0.1", smtp.port
+    settings.SMTP_USE_TLS, settings.SMTP_USER, settings.SMTP_PASSWORD = False, corpus.SUPPORT_EMAIL, ""
+
+    url = args.api or start_api()
+    client = httpx.Client(base_url=url, headers={"X-API-Key": settings.API_KEY}, timeout=120,
+                          limits=httpx.Limits(max_connections=args.concurrency * 2))
+
+    def post(path: str, **kw) -> dict:
+        r = client.post(path, **kw)
+        r.raise_for_status()
+        return r.json()
+
+    def get(path: str, **kw) -> httpx.Response:
+        r = client.get(path, **kw)
+        r.raise_for_status()
+        return r
+
+    # --- KB
+    lat, wall, _ = timed(lambda d: post("/kb/documents", json=d), kb_docs, args.concurrency)
+    record("kb_create", lat, wall)
+    with SessionLocal() as db:
+        rebuild_index(db)
+
+    # --- ingest: single requests, then the rest as NDJSON batches
+    api_fields = ("subject", "customer_email", "from_email", "to_email", "cleaned_text", "raw_headers")
+    payloads = [{k: e[k] for k in api_fields} for e in emails]
+    single, rest = payloads[:args.requests], payloads[args.requests:]
+    lat, wall, ids = timed(lambda p: post("/tickets/inbound", json=p)["id"], single, args.concurrency)
+    record("ingest_single", lat, wall)
+    ticket_ids = list(ids)
+
+    batches = [rest[i:i + args.batch] for i in range(0, len(rest), args.batch)]
+    if batches:
+        def ingest_batch(batch: list[dict]) -> list[int]:
+            body = "\n".join(json.dumps(p, ensure_ascii=False) for p in batch).encode()
+            return [it["id"] for it in post("/tickets/inbound/batch", content=body)["items"] if it["id"]]
+
+        lat, wall, created = timed(ingest_batch, batches, min(args.concurrency, 2))
+        record("ingest_batch", lat, wall, units=sum(map(len, created)))
+        ticket_ids.extend(i for chunk in created for i in chunk)
+
+    # --- enrichment queue, in process like the worker
+    with SessionLocal() as db:
+        pending = db.scalar(select(func.count()).select_from(EnrichmentJob).where(EnrichmentJob.status == JobStatus.pending))
+        lat, jobs, start = [], 0, time.perf_counter()
+        while jobs < pending:
+            t = time.perf_counter()
+            n = process_pending(db, 50)
+            if not n:
+                break
+            lat.append(time.perf_counter() - t)
+            jobs += n
+        record("enrich", lat, time.perf_counter() - start, units=jobs)
+
+    # --- analytics rollups of everything ingested and enriched, in process like app.workers.analytics_refresh
+    with SessionLocal() as db:
+        lat, refreshed, start = [], 0, time.perf_counter()
+        while True:
+            t = time.perf_counter()
+            n = refresh_pending(db, settings.ANALYTICS_REFRESH_BATCH)
+            if not n:
+                break
+            lat.append(time.perf_counter() - t)
+            refreshed += n
+        record("analytics_refresh", lat, time.perf_counter() - start, units=refreshed)
+
+    # --- reads
+    statuses = [None, None, "new", "waiting_customer", "solved"]
+
+    def tickets_list(fields: str | None) -> None:
+        params = {"limit": 20, **({"fields": fields} if fields else {})}
+        if status := rng.choice(statuses):
+            params["status"] = status
+        page = get("/tickets", params=params).json()
+        if page["next_cursor"] and rng.random() < 0.5:
+            get("/tickets", params={**params, "cursor": page["next_cursor"]})
+
+    lat, wall, _ = timed(tickets_list, [None] * args.requests, args.concurrency)
+    record("tickets_list", lat, wall)
+    lat, wall, _ = timed(tickets_list, ["subject,status,priority,updated_at"] * args.requests, args.concurrency)
+    record("tickets_list_sparse", lat, wall)
+    lat, wall, _ = timed(lambda q: get("/tickets/search", params={"q": q}), queries, args.concurrency)
+    record("tickets_search", lat, wall)
+    lat, wall, _ = timed(lambda _: get("/analytics"), range(args.requests), args.concurrency)
+    record("analytics", lat, wall)
+    for mode in ("lexical", "hybrid"):
+        lat, wall, _ = timed(lambda q: get("/kb/search", params={"q": q, "mode": mode}), queries, args.concurrency)
+        record(f"kb_search_{mode}", lat, wall)
+
+    # --- approve-send, then deliver the outbox to the fake SMTP server
+    targets = rng.sample(ticket_ids, min(args.requests, len(ticket_ids)))
+    reply = {"reply_text": "Здравствуйте! Проверили, проблема решена. / Hello, the issue is fixed."}
+    lat, wall, _ = timed(lambda tid: post(f"/tickets/{tid}/approve-send", json=reply), targets, args.concurrency)
+    record("approve_send", lat, wall)
+
+    conn = SmtpConnection()
+    try:
+        with SessionLocal(expire_on_commit=False) as db:
+            lat, sent, start = [], 0, time.perf_counter()
+            while True:
+                t = time.perf_counter()
+                n = drain_outbox(db, conn, settings.SMTP_BATCH)
+                if not n:
+                    break
+                lat.append(time.perf_counter() - t)
+                sent += n
+            record("smtp_drain", lat, time.perf_counter() - start, units=sent)
+    finally:
+        conn.close()
+    if smtp.messages != sent:
+        log.warning("fake SMTP received %s messages, outbox claimed %s", smtp.messages, sent)
+
+    # --- exports: whole file streamed and read
+    for kind in ("csv", "xlsx"):
+        lat, wall, _ = timed(lambda _: get(f"/export/tickets.{kind}").content, range(args.exports))
+        record(f"export_{kind}", lat, wall)
+    client.close()
+    smtp.shutdown()
+
+    # --- micro-benchmarks
+    lat, wall, _ = timed(lambda e: analyze_message(e["subject"], e["cleaned_text"]), emails)
+    record("micro_analyze_message", lat, wall)
+    with SessionLocal() as db:
+        lang = settings.KB_TS_CONFIG
+        lat, wall, _ = timed(lambda q: _search_kb_db(db, q, 5, lang), queries)
+        record("micro_search_kb_lexical", lat, wall)
+        lat, wall, _ = timed(lambda q: _search_kb_hybrid(db, q, 5, lang), queries)
+        record("micro_search_kb_hybrid", lat, wall)
+        hot = queries[:20]
+        for q in hot:
+            search_kb(db, q, 5)
+        lat, wall, _ = timed(lambda q: search_kb(db, q, 5), hot * max(1, args.requests // len(hot)))
+        record("micro_search_kb_cached", lat, wall)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "api": args.api or "in-process",
+            "corpus": {"seed": args.seed, "tickets": args.tickets, "kb": args.kb, "requests": args.requests,
+                       "concurrency": args.concurrency, "batch": args.batch, "exports": args.exports},
+            "settings": {name: getattr(settings, name) for name in SETTINGS_IN_META},
+        },
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Load and micro benchmarks on a synthetic corpus")
+    p.add_argument("--reset", action="store_true", help="drop and recreate all tables first (destroys data)")
+    p.add_argument("--tickets", type=int, default=2000)
+    p.add_argument("--kb", type=int, default=300)
+    p.add_argument("--requests", type=int, default=300, help="requests per read / write scenario")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--batch", type=int, default=500, help="records per /tickets/inbound/batch request")
+    p.add_argument("--exports", type=int, default=3)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--api", help="base URL of a running API; default: start one in this process")
+    p.add_argument("--out", default="bench/results/latest.json")
+    p.add_argument("--baseline", help="compare with this results file")
+    p.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    args = p.parse_args(argv)
+
+    if args.reset:
+        reset_schema()
+    data = run(args)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    log.info("results written to %s", args.out)
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        log.info("baseline saved to %s", args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        rows = compare(data, json.load(f), args.tolerance)
+    print(report(rows))
+    return 1 if any(r["regression"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(main())
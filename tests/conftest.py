@@ -0,0 +1,60 @@
+import os
+import uuid
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+# settings need a URL at import time; tests that talk to Postgres use TEST_DATABASE_URL
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+@pytest.fixture
+def scratch_database_url():
+    """URL of a new empty database on the TEST_DATABASE_URL server, dropped afterwards."""
+    admin_url = os.environ.get("TEST_DATABASE_URL")
+    if not admin_url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(admin_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    try:
+        yield make_url(admin_url).set(database=name).render_as_string(hide_password=False)
+    finally:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+        admin.dispose()
+
+
+@pytest.fixture
+def pg_db(scratch_database_url):
+    """Session on a scratch database with the models' schema (Base.metadata.create_all, as bench/run.py does)."""
+    from sqlalchemy.orm import sessionmaker
+    from app.db import models  # noqa: F401
+    from app.db.base import Base
+
+    engine = create_engine(scratch_database_url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        Base.metadata.create_all(conn)
+    with sessionmaker(bind=engine, autoflush=False)() as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def ingest(pg_db, monkeypatch):
+    """ingest(message_id, text=..., **fields) -> Ticket: one inbound email through create_ticket_from_inbound, enrichment queued."""
+    from app.core.config import settings
+    from app.services.tickets import create_ticket_from_inbound
+
+    monkeypatch.setattr(settings, "ENRICH_INLINE", False)
+
+    def ingest(message_id: str = "<a1@example.com>", text: str = "Не проходит оплата", **fields):
+        fields = {
+            "subject": "Оплата", "customer_email": "c@example.com", "from_email": "c@example.com",
+            "to_email": "support@example.com", "cleaned_text": text, "raw_headers": {"Message-ID": message_id}, **fields,
+        }
+        return create_ticket_from_inbound(pg_db, **fields)
+
+    return ingest
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from sqlalchemy import select
+from app.db.models import AnalyticsDirty
+from app.services.analytics import get_analytics, refresh_pending
+from app.services.tickets import update_ticket
+
+
+def test_rollups_refreshed_from_the_queue(pg_db, ingest):
+    db = pg_db
+    today = datetime.now(timezone.utc).date()
+    ticket = ingest()
+    update_ticket(db, ticket.id, category="billing")
+    # the write transactions only queue the ticket, once
+    assert db.scalars(select(AnalyticsDirty.ticket_id)).all() == [ticket.id]
+    assert get_analytics(db, today, today)["total"]["tickets"] == 0
+
+    assert refresh_pending(db, 10) == 1
+    total = get_analytics(db, today, today)["total"]
+    assert (total["tickets"], total["by_status"], total["by_category"]) == (1, {"new": 1}, {"billing": 1})
+
+    update_ticket(db, ticket.id, category="delivery")
+    assert refresh_pending(db, 10) == 1
+    assert refresh_pending(db, 10) == 0
+    total = get_analytics(db, today, today)["total"]
+    assert (total["tickets"], total["by_category"]) == (1, {"delivery": 1})
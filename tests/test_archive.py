@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, update
+from app.core.config import settings
+from app.db.models import Message, Ticket, TicketStatus
+from app.services.archive import archive_month, restore_month
+
+
+def test_restore_keeps_message_ids_unique(pg_db, ingest, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    db = pg_db
+    first = ingest("<m1@example.com>")
+    assert ingest("<m1@example.com>").id == first.id  # re-delivery
+    db.execute(update(Ticket).where(Ticket.id == first.id).values(status=TicketStatus.solved))
+    db.commit()
+
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    counts = archive_month(db, month, datetime.now(timezone.utc) + timedelta(days=1))
+    assert counts["messages"] == 1
+    assert db.scalar(select(func.count()).select_from(Message)) == 0
+
+    # archived: the same Message-ID arriving again starts a new ticket
+    second = ingest("<m1@example.com>")
+    assert second.id != first.id
+
+    restore_month(db, month)
+    rows = db.execute(select(Message.ticket_id, Message.message_id_header).order_by(Message.id)).all()
+    assert sorted(rows) == sorted([(first.id, None), (second.id, "<m1@example.com>")])
+    restore_month(db, month)  # twice is harmless
+    assert db.scalar(select(func.count()).select_from(Message)) == 2
@@ -0,0 +1,45 @@
+from app.services.cleaner import clean_text, html_to_text
+
+
+def test_opening_sentence_is_not_a_disclaimer():
+    text = "Hello,\nThis email is to report that I cannot log in since yesterday.\nPlease help."
+    assert clean_text(text) == text
+
+
+def test_ru_opening_sentence_is_not_a_disclaimer():
+    text = "Добрый день.\nЭто письмо содержит вопрос по оплате: списали дважды."
+    assert clean_text(text) == text
+
+
+def test_thanks_before_the_question_is_not_a_sign_off():
+    text = "Здравствуйте!\nСпасибо\nНе могу оплатить подписку, карта отклоняется.\nПомогите."
+    assert clean_text(text) == text
+
+
+def test_en_thanks_before_the_question_is_not_a_sign_off():
+    text = "Hi,\nThanks\nThe export button does nothing, what should I do?"
+    assert clean_text(text) == text
+
+
+def test_sign_off_with_signature_is_cut():
+    assert clean_text("Cannot pay.\n\nThanks,\nIvan Petrov\nAcme Inc.\n+7 999 123-45-67") == "Cannot pay."
+    assert clean_text("Не работает вход.\n\nС уважением,\nИван") == "Не работает вход."
+
+
+def test_trailing_legal_block_is_cut():
+    en = "Invoice is wrong.\n\nThis email and any attachments are confidential and intended solely for the addressee."
+    ru = (
+        "Счёт неверный.\n\n---\n"
+        "Настоящее письмо содержит конфиденциальную информацию и предназначено только для адресата."
+    )
+    assert clean_text(en) == "Invoice is wrong."
+    assert clean_text(ru) == "Счёт неверный."
+
+
+def test_quoted_history_is_cut():
+    text = "New question.\n\nOn Mon, 1 Jan 2026 at 10:00, Support <s@x.io> wrote:\n> old answer"
+    assert clean_text(text) == "New question."
+
+
+def test_html_entities_are_decoded_once():
+    assert html_to_text("<p>a &amp;lt; b</p>") == "a &lt; b"
@@ -0,0 +1,117 @@
+import smtplib
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db.models import DeliveryStatus, OutboxEmail
+from app.services import email
+from app.services.email import SmtpConnection, SmtpUnavailable, drain_outbox, is_permanent
+
+
+class FakeSMTP:
+    """smtplib.SMTP stand-in: `login_error` fails AUTH, `refuse` maps a recipient to the exception its send raises."""
+
+    login_error: Exception | None = None
+    refuse: dict[str, Exception] = {}
+    sent: list[str] = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        if FakeSMTP.login_error:
+            raise FakeSMTP.login_error
+
+    def noop(self):
+        return 250, b"ok"
+
+    def send_message(self, msg):
+        if msg["To"] in FakeSMTP.refuse:
+            raise FakeSMTP.refuse[msg["To"]]
+        FakeSMTP.sent.append(msg["To"])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setattr(email.smtplib, "SMTP", FakeSMTP)
+    monkeypatch.setattr(SmtpConnection.send.retry, "sleep", lambda seconds: None)
+    monkeypatch.setattr(settings, "SMTP_USER", "support@example.com")
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(FakeSMTP, "login_error", None)
+    monkeypatch.setattr(FakeSMTP, "refuse", {})
+    monkeypatch.setattr(FakeSMTP, "sent", [])
+    return FakeSMTP
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    OutboxEmail.__table__.create(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with sessionmaker(bind=engine, expire_on_commit=False)() as session:
+        session.statements = statements
+        yield session
+
+
+def _enqueue(db, *recipients):
+    due = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.add_all(OutboxEmail(to_email=to, subject="re", body_text="hi", next_attempt_at=due) for to in recipients)
+    db.commit()
+
+
+def _rows(db):
+    db.expire_all()
+    return {row.to_email: row for row in db.scalars(select(OutboxEmail))}
+
+
+def test_is_permanent():
+    assert is_permanent(smtplib.SMTPRecipientsRefused({"a@x": (550, b"no such user")}))
+    assert not is_permanent(smtplib.SMTPRecipientsRefused({"a@x": (550, b"no"), "b@x": (451, b"later")}))
+    assert is_permanent(smtplib.SMTPSenderRefused(553, b"bad sender", "s@x"))
+    assert not is_permanent(smtplib.SMTPDataError(452, b"mailbox full"))
+    assert is_permanent(smtplib.SMTPDataError(554, b"rejected"))
+    assert not is_permanent(smtplib.SMTPAuthenticationError(535, b"bad credentials"))
+    assert not is_permanent(smtplib.SMTPServerDisconnected("gone"))
+
+
+def test_auth_failure_releases_whole_batch(smtp, db):
+    _enqueue(db, "a@example.com", "b@example.com")
+    smtp.login_error = smtplib.SMTPAuthenticationError(535, b"bad credentials")
+    conn = SmtpConnection()
+    with pytest.raises(SmtpUnavailable):
+        drain_outbox(db, conn, 10)
+    for row in _rows(db).values():
+        assert row.status == DeliveryStatus.pending
+        assert row.attempts == 0
+        assert row.next_attempt_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+        assert "SMTPAuthenticationError" in row.last_error
+    assert conn.failures == 1
+
+
+def test_only_own_5xx_fails_a_row(smtp, db):
+    _enqueue(db, "ok@example.com", "gone@example.com", "full@example.com")
+    smtp.refuse = {
+        "gone@example.com": smtplib.SMTPRecipientsRefused({"gone@example.com": (550, b"no such user")}),
+        "full@example.com": smtplib.SMTPRecipientsRefused({"full@example.com": (452, b"mailbox full")}),
+    }
+    db.statements.clear()
+    assert drain_outbox(db, SmtpConnection(), 10) == 3
+    # claim + lease, then one UPDATE per row: the leased rows are not SELECTed again
+    assert sum(s.lstrip().upper().startswith("SELECT") for s in db.statements) == 1
+    rows = _rows(db)
+    assert rows["ok@example.com"].status == DeliveryStatus.sent
+    assert rows["gone@example.com"].status == DeliveryStatus.failed
+    assert rows["full@example.com"].status == DeliveryStatus.pending
+    assert rows["full@example.com"].attempts == 1
+    assert smtp.sent == ["ok@example.com"]
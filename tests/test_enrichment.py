@@ -0,0 +1,28 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.db.models import Ticket, TicketStatus, JobStatus
+from app.services import enrichment
+from app.services.enrichment import process_pending
+
+
+def test_agent_edit_during_enrichment_wins(pg_db, ingest, monkeypatch):
+    ticket = ingest()
+
+    def build(db, subject, text):
+        # an agent edits the ticket while the slow stages run
+        with Session(pg_db.get_bind()) as agent:
+            agent.execute(update(Ticket).where(Ticket.id == ticket.id).values(category="billing", status=TicketStatus.escalated))
+            agent.commit()
+        ticket_fields = {
+            "category": "delivery", "priority": "high", "ai_summary": "Оплата не проходит",
+            "status": TicketStatus.needs_info, "enrichment_status": JobStatus.done,
+        }
+        return ticket_fields, {"model_versions": {}, "outputs": {}, "confidence": 80}
+
+    monkeypatch.setattr(enrichment, "build_enrichment", build)
+    assert process_pending(pg_db, 10) == 1
+
+    pg_db.expire_all()
+    ticket = pg_db.get(Ticket, ticket.id)
+    assert (ticket.category, ticket.status) == ("billing", TicketStatus.escalated)
+    assert (ticket.priority, ticket.ai_summary, ticket.enrichment_status) == ("high", "Оплата не проходит", JobStatus.done)
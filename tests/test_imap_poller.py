@@ -0,0 +1,156 @@
+import io
+import re
+import socketserver
+import threading
+import time
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from app.core.config import settings
+from app.db.models import MailboxFailure, Ticket
+from app.workers import imap_poller
+from app.workers.imap_poller import ImapMailbox, drain, load_checkpoint
+
+
+def _message(uid: int, subject: str, body: str = "Не проходит оплата") -> bytes:
+    return (
+        f"From: c@example.com\r\nTo: support@example.com\r\nSubject: {subject}\r\n"
+        f"Message-ID: <{uid}@example.com>\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n{body}\r\n"
+    ).encode()
+
+
+class FakeImap(socketserver.ThreadingTCPServer):
+    """Just enough IMAP4rev1 for ImapMailbox: SELECT, UID SEARCH / FETCH (whole and <partial>), IDLE."""
+    daemon_threads = True
+
+    def __init__(self, messages: dict[int, bytes], uidvalidity: int = 42):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def uid_set(self, spec: bytes) -> list[int]:
+        uids = set()
+        for part in spec.decode().split(","):
+            lo, _, hi = part.partition(":")
+            top = max(self.messages, default=0) if hi == "*" else int(hi or lo)
+            uids.update(u for u in self.messages if int(lo) <= u <= top)
+        return sorted(uids)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        srv, w = self.server, self.wfile.write
+        w(b"* OK ready\r\n")
+        while line := self.rfile.readline():
+            tag, cmd, rest = (line.strip().split(b" ", 2) + [b""])[:3]
+            cmd = cmd.upper()
+            if cmd == b"CAPABILITY":
+                w(b"* CAPABILITY IMAP4rev1 IDLE\r\n")
+            elif cmd in (b"SELECT", b"EXAMINE"):
+                w(b"* %d EXISTS\r\n* OK [UIDVALIDITY %d] ok\r\n" % (len(srv.messages), srv.uidvalidity))
+            elif cmd == b"UID" and rest.upper().startswith(b"SEARCH"):
+                w(b"* SEARCH " + b" ".join(b"%d" % u for u in srv.uid_set(rest.split()[-1])) + b"\r\n")
+            elif cmd == b"UID":
+                spec, items = rest.split(b" ", 2)[1:]
+                for u in srv.uid_set(spec):
+                    m = srv.messages[u]
+                    if b"RFC822.SIZE" in items:
+                        w(b"* 1 FETCH (UID %d RFC822.SIZE %d)\r\n" % (u, len(m)))
+                        continue
+                    partial = re.search(rb"<(\d+)\.(\d+)>", items)
+                    if partial:
+                        offset, size = map(int, partial.groups())
+                        m = m[offset:offset + size]
+                    w(b"* 1 FETCH (UID %d BODY[] {%d}\r\n" % (u, len(m)) + m + b")\r\n")
+            elif cmd == b"IDLE":
+                # the continuation and the news in one packet: the client must look at its buffer
+                w(b"+ idling\r\n* %d EXISTS\r\n" % (len(srv.messages) + 1))
+                self.wfile.flush()
+                self.rfile.readline()  # DONE
+            elif cmd == b"LOGOUT":
+                w(b"* BYE\r\n" + tag + b" OK done\r\n")
+                return
+            w(tag + b" OK done\r\n")
+            self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    srv = FakeImap({3: _message(3, "Оплата"), 5: _message(5, "bad"), 7: _message(7, "Доставка")})
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _box(srv: FakeImap) -> ImapMailbox:
+    return ImapMailbox("127.0.0.1", srv.server_address[1], "u", "p", "INBOX", use_ssl=False)
+
+
+def test_checkpoint_stops_at_failure_then_records_it(pg_db, server, monkeypatch):
+    monkeypatch.setattr(settings, "ENRICH_INLINE", False)
+    monkeypatch.setattr(settings, "IMAP_MAX_ATTEMPTS", 2)
+    create = imap_poller.create_ticket_from_inbound
+
+    def flaky(db, **parsed):
+        if parsed["subject"] == "bad":
+            raise RuntimeError("boom")
+        return create(db, **parsed)
+
+    monkeypatch.setattr(imap_poller, "create_ticket_from_inbound", flaky)
+    db, attempts = pg_db, {}
+    with _box(server) as box:
+        cp = load_checkpoint(db, box.key, box.uidvalidity)
+        assert drain(box, db, cp, attempts) == 1
+        assert (cp.last_uid, attempts) == (3, {5: 1})  # 7 waits behind the failed 5
+
+        assert drain(box, db, cp, attempts) == 1
+        assert (cp.last_uid, attempts) == (7, {})
+        failure = db.scalars(select(MailboxFailure)).one()
+        assert (failure.uid, failure.uidvalidity, failure.attempts, failure.error) == (5, 42, 2, "RuntimeError: boom")
+        assert drain(box, db, cp, attempts) == 0
+
+    # mailbox recreated: UIDs start over, the messages already stored are re-deliveries
+    server.uidvalidity = 43
+    monkeypatch.setattr(imap_poller, "create_ticket_from_inbound", create)
+    with _box(server) as box:
+        cp = load_checkpoint(db, box.key, box.uidvalidity)
+        assert (cp.uidvalidity, cp.last_uid) == (43, 0)
+        assert drain(box, db, cp, attempts) == 3
+        assert cp.last_uid == 7
+    assert db.scalar(select(func.count()).select_from(Ticket)) == 3
+
+
+def test_large_messages_fetched_in_chunks(server, monkeypatch):
+    server.messages[9] = _message(9, "Большое", "вложение " * 50)
+    monkeypatch.setattr(settings, "IMAP_STREAM_THRESHOLD", 300)
+    monkeypatch.setattr(settings, "IMAP_FETCH_CHUNK", 64)
+    with _box(server) as box:
+        fetched = box.fetch([3, 5, 7, 9])
+        assert [uid for uid, _ in fetched] == [3, 5, 7, 9]
+        assert [isinstance(fp, io.BytesIO) for _, fp in fetched] == [True, True, True, False]
+        assert [fp.read() for _, fp in fetched] == [server.messages[u] for u in (3, 5, 7, 9)]
+
+
+def test_idle_sees_buffered_exists(server):
+    with _box(server) as box:
+        started = time.monotonic()
+        assert box.idle(5)
+        assert time.monotonic() - started < 1
+        assert box.uids_after(0) == [3, 5, 7]  # the connection is still in step
+
+
+def test_run_forever_reconnects_after_db_error(monkeypatch):
+    calls = []
+
+    def run_mailbox(box):
+        calls.append(box)
+        if len(calls) == 1:
+            raise OperationalError("SELECT 1", {}, Exception("server closed the connection"))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(imap_poller, "run_mailbox", run_mailbox)
+    monkeypatch.setattr(imap_poller.time, "sleep", lambda s: None)
+    with pytest.raises(KeyboardInterrupt):
+        imap_poller.run_forever()
+    assert len(calls) == 2
@@ -0,0 +1,39 @@
+from sqlalchemy import func, select
+from app.db.models import EnrichmentJob, JobStatus, Message, Ticket
+from app.services.tickets import create_tickets_from_inbound_batch
+
+
+def _item(message_id: str, reply_to: str | None = None, subject: str = "Оплата") -> dict:
+    headers = {"Message-ID": message_id, **({"In-Reply-To": reply_to} if reply_to else {})}
+    return {
+        "subject": subject, "customer_email": "c@example.com", "from_email": "c@example.com",
+        "to_email": "support@example.com", "cleaned_text": "Не проходит оплата", "raw_headers": headers,
+    }
+
+
+def _count(db, model) -> int:
+    return db.scalar(select(func.count()).select_from(model))
+
+
+def test_threading_within_and_across_batches(pg_db):
+    # a reply to an item earlier in the batch and a re-delivery of it join the same new ticket
+    rows = create_tickets_from_inbound_batch(
+        pg_db, [_item("<a1@x>"), _item("<a2@x>", reply_to="<a1@x>"), _item("<a1@x>")], enrich="none",
+    )
+    first = rows[0]["id"]
+    assert [r["id"] for r in rows] == [first] * 3
+    assert (_count(pg_db, Ticket), _count(pg_db, Message), _count(pg_db, EnrichmentJob)) == (1, 2, 0)
+    assert pg_db.get(Ticket, first).enrichment_status == JobStatus.skipped
+
+    # next batch: a re-delivery and a reply to stored messages, and one new thread
+    rows = create_tickets_from_inbound_batch(pg_db, [_item("<a1@x>"), _item("<b1@x>", reply_to="<a2@x>"), _item("<c1@x>")])
+    assert [r["id"] for r in rows[:2]] == [first, first] and rows[2]["id"] != first
+    assert (_count(pg_db, Ticket), _count(pg_db, Message), _count(pg_db, EnrichmentJob)) == (2, 4, 1)
+    assert pg_db.get(Ticket, rows[2]["id"]).enrichment_status == JobStatus.pending
+
+
+def test_failed_batch_retried_item_by_item(pg_db):
+    rows = create_tickets_from_inbound_batch(pg_db, [_item("<d1@x>"), _item("<d2@x>", subject="x" * 600), _item("<d3@x>")])
+    assert [r["id"] is not None for r in rows] == [True, False, True]
+    assert "too long" in rows[1]["error"]
+    assert (_count(pg_db, Ticket), _count(pg_db, Message), _count(pg_db, EnrichmentJob)) == (2, 2, 2)
@@ -0,0 +1,24 @@
+import json
+from fastapi.testclient import TestClient
+from app.api.deps import get_db
+from app.core.config import settings
+
+
+def test_json_array_over_limit(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(settings, "KB_IMPORT_ARRAY_MAX_BYTES", 1024)
+    docs = [{"external_id": f"d{i}", "title": "Оплата", "body": "Как оплатить заказ картой"} for i in range(50)]
+    body = json.dumps(docs, ensure_ascii=False).encode()
+
+    def chunks():
+        for i in range(0, len(body), 256):
+            yield body[i:i + 256]
+
+    app.dependency_overrides[get_db] = lambda: None  # rejected before the first chunk reaches the database
+    try:
+        client = TestClient(app, headers={"X-API-Key": settings.API_KEY})
+        r = client.post("/kb/documents/bulk", content=chunks())
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 413
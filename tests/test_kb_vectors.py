@@ -0,0 +1,15 @@
+from app.services.kb_vectors import VectorIndex
+
+
+def test_upsert_updates_in_place_and_reuses_freed_rows(tmp_path):
+    index = VectorIndex(str(tmp_path), 256)
+    index.upsert([(1, "сброс пароля"), (2, "оплата картой"), (3, "доставка заказа")])
+    index.upsert([(2, None), (3, "доставка курьером")])
+    index.upsert([(4, "возврат денег"), (1, "сброс пароля личного кабинета")])
+
+    reader = VectorIndex(str(tmp_path), 256)
+    reader.open()
+    assert reader.rows == 3  # 4 took the row 2 left
+    assert sorted(reader.ids[:reader.rows].tolist()) == [1, 3, 4]
+    assert 2 not in [doc_id for doc_id, _ in reader.search("оплата картой", 3)]
+    assert reader.search("возврат денег", 1)[0][0] == 4
@@ -0,0 +1,66 @@
+import io
+import quopri
+from app.services import mime
+from app.services.mime import parse_mime_stream
+
+TEXT = "Здравствуйте! Не приходит письмо с подтверждением заказа, проверил спам — пусто. " * 3
+
+
+def _qp_message(body: bytes, eol: bytes = b"\r\n") -> bytes:
+    headers = [
+        b"From: Customer <c@example.com>",
+        b"Subject: qp",
+        b"MIME-Version: 1.0",
+        b"Content-Type: text/plain; charset=utf-8",
+        b"Content-Transfer-Encoding: quoted-printable",
+    ]
+    return eol.join(headers) + eol + eol + body.replace(b"\n", eol) + eol
+
+
+def test_soft_wrapped_multibyte_body(tmp_path):
+    body = quopri.encodestring(TEXT.encode())
+    assert b"=\n" in body
+    for eol in (b"\r\n", b"\n"):
+        parsed = parse_mime_stream(io.BytesIO(_qp_message(body, eol)), storage_dir=str(tmp_path))
+        assert parsed["cleaned_text"] == TEXT.strip()
+
+
+def test_escape_split_by_soft_break_and_trailing_space(tmp_path):
+    body = b"=D0=9F=D1=80=D0=B8=D0=B2=D0=B5=\n=D1=82  =\t\nok \nnext"
+    parsed = parse_mime_stream(io.BytesIO(_qp_message(body)), storage_dir=str(tmp_path))
+    assert parsed["cleaned_text"] == "Привет  ok\r\nnext"
+
+
+def test_line_longer_than_read_limit(tmp_path, monkeypatch):
+    # QP lines are 76 bytes: chunks cut them anywhere, "=D0" included
+    body = quopri.encodestring(TEXT.encode())
+    for limit in range(50, 60):
+        monkeypatch.setattr(mime, "LINE_LIMIT", limit)
+        parsed = parse_mime_stream(io.BytesIO(_qp_message(body)), storage_dir=str(tmp_path))
+        assert parsed["cleaned_text"] == TEXT.strip()
+
+
+def test_qp_attachment_before_boundary(tmp_path):
+    payload = ("строка " * 40).encode()
+    msg = b"\r\n".join([
+        b"From: c@example.com",
+        b"MIME-Version: 1.0",
+        b'Content-Type: multipart/mixed; boundary="b1"',
+        b"",
+        b"--b1",
+        b"Content-Type: text/plain; charset=utf-8",
+        b"",
+        b"see attached",
+        b"--b1",
+        b'Content-Type: application/octet-stream; name="a.bin"',
+        b"Content-Transfer-Encoding: quoted-printable",
+        b"",
+        quopri.encodestring(payload).replace(b"\n", b"\r\n") + b"=",
+        b"--b1--",
+        b"",
+    ])
+    parsed = parse_mime_stream(io.BytesIO(msg), storage_dir=str(tmp_path))
+    assert parsed["cleaned_text"] == "see attached"
+    [att] = parsed["attachments"]
+    with open(att["storage_path"], "rb") as f:
+        assert f.read() == payload
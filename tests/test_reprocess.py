@@ -0,0 +1,29 @@
+from sqlalchemy import create_engine, select, text
+from app.db.models import AiRun
+from app.services.reprocess import _LOCK_NS, run_in_progress, run_reprocess, start_run
+
+
+def test_run_in_spawned_pool(pg_db, ingest):
+    for i in range(3):
+        ingest(f"<r{i}@example.com>", f"Не проходит оплата картой {i}")
+    run = start_run(pg_db, "rules-test")
+    run = run_reprocess(pg_db, run.id, workers=2, chunk=2)
+    assert (run.status, run.processed, run.last_ticket_id) == ("done", 3, 3)
+    versions = pg_db.scalars(select(AiRun.model_versions).where(AiRun.model_versions["run"].as_string() == "rules-test")).all()
+    assert len(versions) == 3
+
+
+def test_run_executes_once(pg_db, ingest):
+    ingest()
+    run = start_run(pg_db, "rules-test")
+    assert not run_in_progress(pg_db, run.id)
+    # another process executing the run
+    other = create_engine(pg_db.get_bind().url)
+    with other.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:ns, :id)"), {"ns": _LOCK_NS, "id": run.id})
+        assert run_in_progress(pg_db, run.id)
+        assert run_reprocess(pg_db, run.id, workers=1).processed == 0
+        conn.execute(text("SELECT pg_advisory_unlock(:ns, :id)"), {"ns": _LOCK_NS, "id": run.id})
+    other.dispose()
+    assert not run_in_progress(pg_db, run.id)
+    assert run_reprocess(pg_db, run.id, workers=1).status == "done"
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app.db.models import AiRule
+from app.services import rules
+
+
+def test_first_refresh_loads_even_right_after_boot(monkeypatch):
+    # time.monotonic() counts from boot: it is below RULES_RELOAD_SECONDS in the first minute
+    monkeypatch.setattr(rules.time, "monotonic", lambda: 5.0)
+    monkeypatch.setattr(rules, "_loaded_at", None)
+    monkeypatch.setattr(rules, "_engine", rules.RuleEngine(rules.DEFAULT_RULES))
+    monkeypatch.setattr(rules, "load_rules", lambda db: [("category", "shipping", "доставк", 5)])
+    assert rules.refresh_rules(None).match("где доставка?") == {"category": "shipping"}
+
+    monkeypatch.setattr(rules, "load_rules", lambda db: pytest.fail("reloaded within RULES_RELOAD_SECONDS"))
+    assert rules.refresh_rules(None).match("где доставка?") == {"category": "shipping"}
+
+
+def test_empty_keyword_rejected(pg_db):
+    pg_db.add(AiRule(kind="category", value="billing", keyword="  "))
+    with pytest.raises(IntegrityError):
+        pg_db.commit()
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+import time
+from sqlalchemy.util import greenlet_spawn
+from app.db.session import run_blocking
+
+
+def test_plain_call_outside_run_sync():
+    assert run_blocking(threading.get_ident) == threading.get_ident()
+
+
+def test_run_sync_greenlet_hands_work_to_a_thread():
+    # what AsyncSession.run_sync does with a service function
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        ident = await greenlet_spawn(lambda: run_blocking(lambda: (time.sleep(0.2), threading.get_ident())[1]))
+        task.cancel()
+        return ident, ticks
+
+    ident, ticks = asyncio.run(main())
+    assert ident != threading.get_ident()
+    assert ticks >= 5  # the loop kept running meanwhile
@@ -0,0 +1,47 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.api.deps import get_db
+from app.core.config import settings
+
+
+@pytest.fixture
+def client(pg_db):
+    from app.main import app
+
+    app.dependency_overrides[get_db] = lambda: pg_db
+    try:
+        yield TestClient(app, headers={"X-API-Key": settings.API_KEY})
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def ticket_id(ingest) -> int:
+    return ingest().id
+
+
+# with a reply: UPDATE tickets ... RETURNING, INSERT messages ... RETURNING, INSERT outbox, INSERT analytics_dirty;
+# escalate: the UPDATE and the analytics_dirty insert
+@pytest.mark.parametrize("path, body, status, statements", [
+    ("approve-send", {"reply_text": "Готово"}, "waiting_customer", 4),
+    ("request-info", {"questions": ["Номер заказа?"]}, "needs_info", 4),
+    ("escalate", {}, "escalated", 2),
+])
+def test_action_statements(client, ticket_id, path, body, status, statements):
+    r = client.post(f"/tickets/{ticket_id}/{path}", json=body)
+    assert r.status_code == 200
+    assert (r.json()["status"], r.json()["statements"]) == (status, statements)
+    assert (r.json()["message_id"] is not None) == (statements == 4)
+
+
+def test_patch_statements(client, ticket_id):
+    r = client.patch(f"/tickets/{ticket_id}", json={"category": "billing", "priority": "high"})
+    assert (r.status_code, r.headers["X-DB-Statements"], r.json()["category"]) == (200, "2", "billing")
+    # nothing to change: one SELECT, nothing queued
+    r = client.patch(f"/tickets/{ticket_id}", json={})
+    assert (r.status_code, r.headers["X-DB-Statements"]) == (200, "1")
+
+
+def test_action_on_missing_ticket(client):
+    r = client.post("/tickets/999/escalate", json={})
+    assert r.status_code == 404